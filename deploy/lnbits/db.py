@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import asyncio
+import gzip
 import json
 import os
 import re
@@ -9,7 +10,15 @@ import time
 from contextlib import asynccontextmanager
 from datetime import datetime, timezone
 from enum import Enum
-from typing import Any, AsyncGenerator, Generic, Literal, TypeVar, get_origin
+from typing import (
+    Any,
+    AsyncGenerator,
+    Callable,
+    Generic,
+    Literal,
+    TypeVar,
+    get_origin,
+)
 
 from loguru import logger
 from pydantic import BaseModel, ValidationError, root_validator
@@ -18,6 +27,7 @@ from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine, create_async_en
 from sqlalchemy.sql import text
 
 from lnbits.settings import settings
+from lnbits.tracing import span as trace_span
 
 POSTGRES = "POSTGRES"
 COCKROACH = "COCKROACH"
@@ -30,6 +40,14 @@ sqlite_formats = {
     "month": "%Y-%m-01 00:00:00",
 }
 
+
+def _env_flag(name: str, default: bool = False) -> bool:
+    raw = os.getenv(name)
+    if raw is None:
+        return default
+    return raw.strip().lower() in {"1", "true", "yes", "on"}
+
+
 if settings.lnbits_database_url:
     database_uri = settings.lnbits_database_url
     if database_uri.startswith("cockroachdb://"):
@@ -47,9 +65,69 @@ else:
         logger.info(f"Created {settings.lnbits_data_folder}")
     DB_TYPE = SQLITE
 
+# Opt-in: encode and decode nested model/dict/list fields with orjson. They stay
+# json text either way, the upstream columns holding them are TEXT.
+DB_FAST_JSON = _env_flag("LNBITS_DB_FAST_JSON")
+
+# Time-partitioned tables: compare `time` against plain TIMESTAMP bounds so the
+# Postgres planner can prune partitions for Filters/fetch_page queries.
+DB_PARTITIONING = _env_flag("LNBITS_DB_PARTITIONING")
+
+# Serve wallet payment history from incrementally maintained time buckets.
+DB_ROLLUPS = _env_flag("LNBITS_DB_ROLLUPS")
+# Set for one start after rows changed while rollups were off (or an upgrade
+# rewrote old payments): drops the buckets so the compactor rebuilds them.
+DB_ROLLUPS_REBUILD = _env_flag("LNBITS_DB_ROLLUPS_REBUILD")
+
+# Serve hot reads (fetchone_cached) from an in-process cache; on Postgres every
+# committed write then NOTIFYs its tables to the other replicas, so all
+# replicas sharing the database must agree on this flag.
+DB_CACHE = _env_flag("LNBITS_DB_CACHE")
+
+
+def _orjson_dumps(value: Any) -> str:
+    import orjson
+
+    return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS).decode()
+
+
+# Stored JSON text keeps the stdlib encoding unless asked otherwise: orjson
+# writes compact separators and raw non-ASCII, which readers of the raw column
+# (LIKE filters, other tools) may not expect.
+_default_json_dumps: Callable[[Any], str] = json.dumps
+_default_json_loads: Callable[[str | bytes], Any] = json.loads
+if DB_FAST_JSON:
+    try:
+        import orjson
+
+        _default_json_dumps = _orjson_dumps
+        _default_json_loads = orjson.loads
+    except ImportError:  # pragma: no cover - orjson is optional
+        pass
+
+# Default per-statement deadline in seconds for Connection queries (0 disables).
+DB_STATEMENT_TIMEOUT = float(os.getenv("LNBITS_DB_STATEMENT_TIMEOUT", "0") or 0)
+# Extra client-side slack before giving up on a server-side timeout.
+DB_STATEMENT_TIMEOUT_GRACE = 1.0
+
+json_dumps: Callable[[Any], str] = _default_json_dumps
+json_loads: Callable[[str | bytes], Any] = _default_json_loads
+
+
+def set_json_codec(
+    dumps: Callable[[Any], str], loads: Callable[[str | bytes], Any]
+) -> None:
+    """Swap the codec used to store and load JSON fields."""
+    global json_dumps, json_loads
+    json_dumps = dumps
+    json_loads = loads
+
 
 def compat_timestamp_placeholder(key: str):
-    if DB_TYPE == POSTGRES:
+    if DB_TYPE == POSTGRES and DB_PARTITIONING:
+        # timestamptz bounds would cast the partition key and defeat pruning
+        return f"CAST(to_timestamp(:{key}) AS TIMESTAMP)"
+    elif DB_TYPE == POSTGRES:
         return f"to_timestamp(:{key})"
     elif DB_TYPE == COCKROACH:
         return f"cast(:{key} AS timestamp)"
@@ -149,11 +227,159 @@ def dict_to_model(dict_obj, model_class: type[TModel]) -> TModel:
 
 
 class Connection(Compat):
-    def __init__(self, conn: AsyncConnection, typ, name, schema):
+    def __init__(
+        self,
+        conn: AsyncConnection,
+        typ,
+        name,
+        schema,
+        statement_timeout: float = DB_STATEMENT_TIMEOUT,
+        invalidation: InvalidationBus | None = None,
+        rollups: dict[str, TimeBucketRollup] | None = None,
+    ):
         self.conn = conn
         self.type = typ
         self.name = name
         self.schema = schema
+        self.statement_timeout = statement_timeout
+        self.invalidation = invalidation
+        # rollups keyed by source table, kept in step with writes to it
+        self.rollups = rollups or {}
+        # invalidation tags of uncommitted writes, published by _commit
+        self._pending_tags: set[str] = set()
+        # rows written per rollup source table since the last commit
+        self._pending_rows: dict[str, int] = {}
+        self._local_timeout_ms: int | None = None
+        self._deadline: float | None = None
+        self._interrupted = False
+        self._progress_handler = False
+        # task awaiting the running statement, watched by _sqlite_progress
+        self._caller: asyncio.Task | None = None
+
+    async def _apply_timeout(self, timeout: float) -> None:
+        if self.type in {POSTGRES, COCKROACH}:
+            # SET LOCAL ends with the transaction, so it never leaks into the pool
+            timeout_ms = max(int(timeout * 1000), 1)
+            if self._local_timeout_ms != timeout_ms:
+                await self.conn.execute(
+                    text(f"SET LOCAL statement_timeout = {timeout_ms}")
+                )
+                self._local_timeout_ms = timeout_ms
+        elif self.type == SQLITE:
+            self._deadline = time.monotonic() + timeout
+            await self._watch_progress()
+
+    async def _watch_progress(self) -> None:
+        # lets _cancel interrupt a running sqlite statement, with or without a
+        # deadline
+        if self.type == SQLITE and not self._progress_handler:
+            raw = await self.conn.get_raw_connection()
+            await raw.driver_connection.set_progress_handler(
+                self._sqlite_progress, 1000
+            )
+            self._progress_handler = True
+
+    async def _clear_timeout(self) -> None:
+        # the raw sqlite connection goes back to the pool, and a handler left
+        # on it would keep calling into this Connection after it is gone
+        if not self._progress_handler:
+            return
+        self._progress_handler = False
+        self._deadline = None
+        try:
+            raw = await self.conn.get_raw_connection()
+            await raw.driver_connection.set_progress_handler(None, 0)
+        except Exception as exc:
+            logger.debug(f"clearing sqlite progress handler failed: {exc!r}")
+
+    def _sqlite_progress(self) -> int:
+        # runs on the aiosqlite thread, a non-zero return interrupts the statement
+        if self._interrupted:
+            return 1
+        if self._deadline and time.monotonic() > self._deadline:
+            return 1
+        # a cancelled caller: SQLAlchemy closes the connection before _cancel
+        # runs, and that close waits on this statement
+        caller = self._caller
+        if caller is not None and caller.cancelling():
+            return 1
+        return 0
+
+    async def _cancel(self) -> None:
+        self._interrupted = True
+        # the transaction is gone with the connection, nothing left to publish
+        self._pending_tags = set()
+        self._pending_rows = {}
+        try:
+            # asyncpg already sent a cancel request for the awaited query,
+            # drop the connection instead of returning a busy one to the pool
+            await self.conn.invalidate()
+        except Exception as exc:
+            logger.debug(f"invalidating cancelled connection failed: {exc!r}")
+
+    async def _execute(
+        self, query: str, params: dict, timeout: float | None = None
+    ) -> Any:
+        with trace_span("db.query", **{"db.statement": query.strip()[:200]}):
+            return await self._execute_timed(query, params, timeout)
+
+    async def _execute_timed(
+        self, query: str, params: dict, timeout: float | None = None
+    ) -> Any:
+        if timeout is None:
+            timeout = self.statement_timeout
+        statement = text(self.rewrite_query(query))
+        self._caller = asyncio.current_task()
+        try:
+            if not timeout:
+                await self._watch_progress()
+                return await self.conn.execute(statement, params)
+            await self._apply_timeout(timeout)
+            return await asyncio.wait_for(
+                self.conn.execute(statement, params),
+                timeout + DB_STATEMENT_TIMEOUT_GRACE,
+            )
+        except (asyncio.CancelledError, asyncio.TimeoutError):
+            await self._cancel()
+            raise
+        except Exception as exc:
+            message = str(exc)
+            if not timeout:
+                raise
+            if "statement timeout" in message or "interrupted" in message:
+                raise asyncio.TimeoutError(
+                    f"statement exceeded {timeout}s: {query[:80]!r}"
+                ) from exc
+            raise
+        finally:
+            self._deadline = None
+            self._caller = None
+
+    async def _commit(self) -> None:
+        tags = self._pending_tags
+        self._pending_tags = set()
+        if tags and self.invalidation:
+            # NOTIFY is transactional: other replicas only hear it on commit
+            await self.invalidation.notify(self, tags)
+        with trace_span("db.commit"):
+            await self.conn.commit()
+        self._local_timeout_ms = None
+        if tags and self.invalidation:
+            self.invalidation.evict(tags)
+        rows = self._pending_rows
+        self._pending_rows = {}
+        for table_name, count in rows.items():
+            self.rollups[table_name].notify_write(count)
+
+    def invalidate(self, *tags: str) -> None:
+        """Evict `tags` from caches on every replica once this connection commits."""
+        self._pending_tags.update(tags)
+
+    def _count_rows(self, table_name: str, count: int = 1) -> None:
+        if table_name in self.rollups:
+            self._pending_rows[table_name] = (
+                self._pending_rows.get(table_name, 0) + count
+            )
 
     def rewrite_query(self, query) -> str:
         if self.type in {POSTGRES, COCKROACH}:
@@ -183,9 +409,10 @@ class Connection(Compat):
         query: str,
         values: dict | None = None,
         model: type[TModel] | None = None,
+        timeout: float | None = None,
     ) -> list[TModel]:
         params = self.rewrite_values(values) if values else {}
-        result = await self.conn.execute(text(self.rewrite_query(query)), params)
+        result = await self._execute(query, params, timeout)
         row = result.mappings().all()
         result.close()
         if not row:
@@ -199,9 +426,10 @@ class Connection(Compat):
         query: str,
         values: dict | None = None,
         model: type[TModel] | None = None,
+        timeout: float | None = None,
     ) -> TModel:
         params = self.rewrite_values(values) if values else {}
-        result = await self.conn.execute(text(self.rewrite_query(query)), params)
+        result = await self._execute(query, params, timeout)
         row = result.mappings().first()
         result.close()
         if model and row:
@@ -212,19 +440,53 @@ class Connection(Compat):
         self, table_name: str, model: BaseModel, where: str = "WHERE id = :id"
     ):
         values = model_to_dict(model)
-        await self.conn.execute(
-            text(update_query(self.references_schema + table_name, model, where)),
-            self.rewrite_values(values),
-        )
-        await self.conn.commit()
+        rollup = self.rollups.get(table_name)
+        if rollup:
+            # the matched rows leave their old buckets and may enter new ones
+            times = [values["time"]] if "time" in values else None
+            await rollup.before_write(self, where, values, times)
+        with trace_span("db.update", **{"db.table": table_name}):
+            await self.conn.execute(
+                text(update_query(self.references_schema + table_name, model, where)),
+                self.rewrite_values(values),
+            )
+        self.invalidate(table_name)
+        self._count_rows(table_name)
+        await self._commit()
 
     async def insert(self, table_name: str, model: BaseModel):
         values = model_to_dict(model)
-        await self.conn.execute(
-            text(insert_query(self.references_schema + table_name, model)),
-            self.rewrite_values(values),
-        )
-        await self.conn.commit()
+        rollup = self.rollups.get(table_name)
+        if rollup:
+            await rollup.before_write(self, times=[values.get("time")])
+        with trace_span("db.insert", **{"db.table": table_name}):
+            await self.conn.execute(
+                text(insert_query(self.references_schema + table_name, model)),
+                self.rewrite_values(values),
+            )
+        self.invalidate(table_name)
+        self._count_rows(table_name)
+        await self._commit()
+
+    async def insert_many(self, table_name: str, models: list[BaseModel]):
+        """Insert models in one transaction, one executemany per column set."""
+        rollup = self.rollups.get(table_name)
+        if rollup:
+            await rollup.before_write(
+                self, times=[getattr(model, "time", None) for model in models]
+            )
+        batches: dict[str, list[dict]] = {}
+        for model in models:
+            query = insert_query(self.references_schema + table_name, model)
+            batches.setdefault(query, []).append(
+                self.rewrite_values(model_to_dict(model))
+            )
+        for query, params in batches.items():
+            await self.conn.execute(text(query), params)
+        self.invalidate(table_name)
+        # one per row, so a batch counts towards compaction like single inserts
+        self._count_rows(table_name, len(models))
+        await self._commit()
 
     async def fetch_page(
         self,
@@ -234,6 +496,7 @@ class Connection(Compat):
         filters: Filters | None = None,
         model: type[TModel] | None = None,
         group_by: list[str] | None = None,
+        timeout: float | None = None,
     ) -> Page[TModel]:
         if not filters:
             filters = Filters()
@@ -259,6 +522,7 @@ class Connection(Compat):
             """,
             self.rewrite_values(parsed_values),
             model,
+            timeout,
         )
         if rows:
             # no need for extra query if no pagination is specified
@@ -272,6 +536,7 @@ class Connection(Compat):
                     ) as count
                     """,  # noqa: S608
                     parsed_values,
+                    timeout,
                 )
                 row = result.mappings().first()
                 result.close()
@@ -286,10 +551,20 @@ class Connection(Compat):
             total=count,
         )
 
-    async def execute(self, query: str, values: dict | None = None):
+    async def execute(
+        self, query: str, values: dict | None = None, timeout: float | None = None
+    ):
+        tags = write_tags(query)
+        for tag in tags:
+            rollup = self.rollups.get(tag)
+            if rollup:
+                await rollup.before_query(self, query, values)
         params = self.rewrite_values(values) if values else {}
-        result = await self.conn.execute(text(self.rewrite_query(query)), params)
-        await self.conn.commit()
+        result = await self._execute(query, params, timeout)
+        self.invalidate(*tags)
+        for tag in tags:
+            self._count_rows(tag, max(result.rowcount or 0, 1))
+        await self._commit()
         return result
 
 
@@ -358,15 +633,43 @@ class Database(Compat):
                 )
 
         self.lock = asyncio.Lock()
+        # time spent queueing on self.lock, for load tests and /status/metrics
+        self.lock_waits = 0
+        self.lock_wait_seconds = 0.0
+        self.lock_wait_max = 0.0
+        self.rollups: dict[str, TimeBucketRollup] = {}
+        self.write_behind: WriteBehindQueue | None = None
+        self.invalidation = InvalidationBus(self)
+        self.cache = TaggedCache()
 
         logger.trace(f"database {self.type} added for {self.name}")
 
     @asynccontextmanager
-    async def connect(self, schema: str | None = None) -> AsyncGenerator[Connection, None]:
-        await self.lock.acquire()
+    async def connect(
+        self, schema: str | None = None, locked: bool = True
+    ) -> AsyncGenerator[Connection, None]:
+        """
+        `locked=False` skips self.lock, for background work on Postgres that
+        orders itself with row locks instead of queueing every request behind it.
+        """
+        if locked:
+            with trace_span("db.lock_wait", **{"db.name": self.name}):
+                started = time.perf_counter()
+                await self.lock.acquire()
+                waited = time.perf_counter() - started
+            self.lock_waits += 1
+            self.lock_wait_seconds += waited
+            self.lock_wait_max = max(self.lock_wait_max, waited)
         try:
             async with self.engine.connect() as raw_conn:
-                conn = Connection(raw_conn, self.type, self.name, schema or self.schema)
+                conn = Connection(
+                    raw_conn,
+                    self.type,
+                    self.name,
+                    schema or self.schema,
+                    invalidation=self.invalidation,
+                    rollups=self.rollups,
+                )
 
                 if conn.schema:
                     if conn.type in {POSTGRES, COCKROACH}:
@@ -375,9 +678,13 @@ class Database(Compat):
                     elif conn.type == SQLITE:
                         await conn.execute(f"ATTACH '{self.path}' AS {conn.schema}")
 
-                yield conn
+                try:
+                    yield conn
+                finally:
+                    await conn._clear_timeout()
         finally:
-            self.lock.release()
+            if locked:
+                self.lock.release()
 
     async def reset(self):
         if self.type == SQLITE:
@@ -396,18 +703,50 @@ class Database(Compat):
         query: str,
         values: dict | None = None,
         model: type[TModel] | None = None,
+        timeout: float | None = None,
     ) -> list[TModel]:
         async with self.connect() as conn:
-            return await conn.fetchall(query, values, model)
+            return await conn.fetchall(query, values, model, timeout)
 
     async def fetchone(
         self,
         query: str,
         values: dict | None = None,
         model: type[TModel] | None = None,
+        timeout: float | None = None,
+    ) -> TModel:
+        async with self.connect() as conn:
+            return await conn.fetchone(query, values, model, timeout)
+
+    async def fetchone_cached(
+        self,
+        query: str,
+        values: dict | None = None,
+        model: type[TModel] | None = None,
+        tags: list[str] | None = None,
     ) -> TModel:
+        """
+        fetchone through `self.cache`. Entries are tagged with the tables the
+        query reads (or `tags`) and evicted on writes from any replica. Models
+        are returned as copies, callers may modify them. A plain fetchone unless
+        LNBITS_DB_CACHE is on.
+        """
+        if not DB_CACHE:
+            return await self.fetchone(query, values, model)
+        self.invalidation.start()
+        key = query + json.dumps(values or {}, sort_keys=True, default=str)
+        cached = self.cache.get(key)
+        if cached is _CACHE_MISS:
+            version = self.cache.version
+            cached = await self.fetchone(query, values, model)
+            self.cache.set(key, cached, tags or read_tags(query), version)
+        return cached.copy(deep=True) if isinstance(cached, BaseModel) else cached
+
+    async def invalidate(self, *tags: str) -> None:
+        """Publish tags without a write, e.g. for caches keyed on other data."""
         async with self.connect() as conn:
-            return await conn.fetchone(query, values, model)
+            conn.invalidate(*tags)
+            await conn._commit()
 
     async def insert(self, table_name: str, model: BaseModel) -> None:
         async with self.connect() as conn:
@@ -427,18 +766,95 @@ class Database(Compat):
         filters: Filters | None = None,
         model: type[TModel] | None = None,
         group_by: list[str] | None = None,
+        timeout: float | None = None,
     ) -> Page[TModel]:
         async with self.connect() as conn:
-            return await conn.fetch_page(query, where, values, filters, model, group_by)
+            return await conn.fetch_page(
+                query, where, values, filters, model, group_by, timeout
+            )
 
-    async def execute(self, query: str, values: dict | None = None):
+    async def execute(
+        self, query: str, values: dict | None = None, timeout: float | None = None
+    ):
         async with self.connect() as conn:
-            return await conn.execute(query, values)
+            return await conn.execute(query, values, timeout)
 
     @asynccontextmanager
     async def reuse_conn(self, conn: Connection):
         yield conn
 
+    async def insert_many(self, table_name: str, models: list[BaseModel]) -> None:
+        async with self.connect() as conn:
+            await conn.insert_many(table_name, models)
+
+    async def enqueue_insert(self, table_name: str, model: BaseModel) -> None:
+        """
+        Insert off the request path through the write-behind queue. Only use this
+        for rows that may be lost on a crash (audit rows, webhook logs, counters).
+        """
+        if not self.write_behind:
+            self.write_behind = WriteBehindQueue(self)
+        self.write_behind.start()
+        await self.write_behind.put(table_name, model)
+
+    async def add_rollup(self, rollup: TimeBucketRollup, rebuild: bool = False) -> None:
+        """
+        Keep `rollup` in step with writes; its tables come from a migration.
+        The watermark persists across restarts, so buckets are only dropped for
+        a rollup registered for the first time, or with `rebuild` when rows
+        changed while it was not registered (LNBITS_DB_ROLLUPS_REBUILD). The
+        compactor refills them in the background.
+        """
+        async with self.connect() as conn:
+            if await rollup.register(conn) or rebuild:
+                await rollup.rewind(conn, 0)
+                await conn._commit()
+        self.rollups[rollup.source] = rollup
+
+    async def fetch_rollup(
+        self,
+        source: str,
+        wallet_id: str,
+        group: DateTrunc,
+        since: datetime | None = None,
+    ) -> list[dict]:
+        async with self.connect() as conn:
+            return await self.rollups[source].history(conn, wallet_id, group, since)
+
+    async def compact_rollups(self) -> int:
+        """
+        Catch every rollup up, one `chunk_rows` transaction at a time. SQLite
+        takes self.lock per chunk so requests queue in between; Postgres chunks
+        skip it, the watermark row lock orders them against rewinds.
+        """
+        rolled = 0
+        for rollup in self.rollups.values():
+            done = False
+            while not done:
+                async with self.connect(locked=self.type == SQLITE) as conn:
+                    chunk, done = await rollup.compact(conn)
+                rolled += chunk
+        return rolled
+
+    async def run_rollup_compactor(self, interval: float = 300) -> None:
+        """Background task: compact now, then on a timer or once writes piled up."""
+        while True:
+            try:
+                await self.compact_rollups()
+            except Exception as exc:
+                logger.warning(f"rollup compaction failed: {exc!r}")
+            wakeups = [
+                asyncio.create_task(r.dirty.wait()) for r in self.rollups.values()
+            ]
+            if wakeups:
+                _, pending = await asyncio.wait(
+                    wakeups, timeout=interval, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in pending:
+                    task.cancel()
+            else:
+                await asyncio.sleep(interval)
+
     @classmethod
     async def clean_ext_db_files(cls, ext_id: str) -> bool:
         """
@@ -455,6 +871,957 @@ class Database(Compat):
         return False
 
 
+# ---- Write-behind queue ----
+_write_behind_queues: list[WriteBehindQueue] = []
+
+
+class WriteBehindQueue:
+    """
+    Bounded queue of (table, model) inserts flushed by a background task in
+    batched transactions, whenever `batch_size` rows are waiting or
+    `flush_interval` seconds have passed. `put` blocks while the queue is full.
+    """
+
+    def __init__(
+        self,
+        db: Database,
+        max_size: int = int(os.getenv("LNBITS_DB_WRITE_BEHIND_MAX", "10000")),
+        batch_size: int = 500,
+        flush_interval: float = 1.0,
+    ):
+        self.db = db
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue: asyncio.Queue[tuple[str, BaseModel] | None] = asyncio.Queue(
+            max_size
+        )
+        self.task: asyncio.Task | None = None
+        self.flushed = 0
+        self.dropped = 0
+        _write_behind_queues.append(self)
+
+    def start(self) -> None:
+        if not self.task or self.task.done():
+            self.task = asyncio.create_task(self._run())
+
+    async def put(self, table_name: str, model: BaseModel) -> None:
+        await self.queue.put((table_name, model))
+
+    def put_nowait(self, table_name: str, model: BaseModel) -> None:
+        """Raises asyncio.QueueFull instead of waiting when the queue is full."""
+        self.queue.put_nowait((table_name, model))
+
+    async def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            item = await self.queue.get()
+            if item is None:
+                self.queue.task_done()
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    # close() sentinel: write what we have, then stop
+                    self.queue.task_done()
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._write(batch)
+
+    async def _write(self, batch: list[tuple[str, BaseModel]]) -> None:
+        tables: dict[str, list[BaseModel]] = {}
+        for table_name, model in batch:
+            tables.setdefault(table_name, []).append(model)
+        for table_name, models in tables.items():
+            try:
+                await self.db.insert_many(table_name, models)
+                self.flushed += len(models)
+            except Exception as exc:
+                logger.warning(
+                    f"write-behind batch of {len(models)} for {table_name} "
+                    f"failed, retrying one by one: {exc!r}"
+                )
+                for model in models:
+                    try:
+                        await self.db.insert(table_name, model)
+                        self.flushed += 1
+                    except Exception as row_exc:
+                        self.dropped += 1
+                        logger.error(
+                            f"write-behind dropped {table_name} row: {row_exc!r}"
+                        )
+        for _ in batch:
+            self.queue.task_done()
+
+    async def flush(self) -> None:
+        """Write everything queued so far, without waiting for the timer."""
+        batch = []
+        while not self.queue.empty():
+            item = self.queue.get_nowait()
+            if item is None:
+                self.queue.task_done()
+                continue
+            batch.append(item)
+        if batch:
+            await self._write(batch)
+
+    async def close(self) -> None:
+        if self.task and not self.task.done():
+            await self.queue.put(None)
+            await self.task
+        self.task = None
+        await self.flush()
+
+
+async def flush_write_behind_queues() -> None:
+    """Shutdown hook: drain every write-behind queue in this process."""
+    for queue in _write_behind_queues:
+        try:
+            await queue.close()
+        except Exception as exc:
+            logger.error(f"write-behind flush on shutdown failed: {exc!r}")
+
+
+# ---- Cross-replica cache invalidation ----
+INVALIDATION_CHANNEL = os.getenv("LNBITS_INVALIDATION_CHANNEL", "lnbits_invalidate")
+INVALIDATION_BACKOFF_MIN = 1.0
+INVALIDATION_BACKOFF_MAX = 60.0
+# Postgres caps NOTIFY payloads at 8000 bytes; larger tag sets evict everything.
+_NOTIFY_MAX_PAYLOAD = 7900
+ALL_TAGS = "*"
+
+_WRITE_TABLE = re.compile(
+    r"^\s*(?:INSERT\s+INTO|UPDATE|DELETE\s+FROM)\s+([\w.\"]+)", re.IGNORECASE
+)
+_READ_TABLES = re.compile(r"\b(?:FROM|JOIN)\s+([\w.\"]+)", re.IGNORECASE)
+
+
+def _table_tag(name: str) -> str:
+    return name.replace('"', "").rsplit(".", 1)[-1].lower()
+
+
+def write_tags(query: str) -> list[str]:
+    match = _WRITE_TABLE.match(query)
+    return [_table_tag(match.group(1))] if match else []
+
+
+def read_tags(query: str) -> list[str]:
+    return sorted({_table_tag(name) for name in _READ_TABLES.findall(query)})
+
+
+_CACHE_MISS = object()
+
+
+class TaggedCache:
+    """
+    In-process read cache whose entries carry invalidation tags (table names or
+    keys such as "wallets:<id>"). Entries also expire after `ttl` seconds as a
+    backstop for notifications lost while the listener reconnects.
+    """
+
+    def __init__(
+        self,
+        ttl: float = float(os.getenv("LNBITS_DB_CACHE_TTL", "30")),
+        max_size: int = int(os.getenv("LNBITS_DB_CACHE_MAX", "10000")),
+    ):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.entries: dict[str, tuple[float, Any, list[str]]] = {}
+        self.by_tag: dict[str, set[str]] = {}
+        # bumped on every eviction so reads racing a write are not stored
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Any:
+        entry = self.entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            self.misses += 1
+            return _CACHE_MISS
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key: str, value: Any, tags: list[str], version: int) -> None:
+        if version != self.version or not tags:
+            return
+        if len(self.entries) >= self.max_size:
+            self.evict([ALL_TAGS])
+        self.entries[key] = (time.monotonic() + self.ttl, value, tags)
+        for tag in tags:
+            self.by_tag.setdefault(tag, set()).add(key)
+
+    def evict(self, tags) -> None:
+        self.version += 1
+        if ALL_TAGS in tags:
+            self.entries.clear()
+            self.by_tag.clear()
+            return
+        for tag in tags:
+            for key in self.by_tag.pop(tag, ()):
+                self.entries.pop(key, None)
+
+
+class InvalidationBus:
+    """
+    Publishes invalidation tags of committed writes to the other replicas with
+    Postgres NOTIFY and evicts tags they publish, received on one connection
+    from the Database engine kept in LISTEN. SQLite and CockroachDB (which has
+    no LISTEN/NOTIFY) only evict locally, and nothing is published unless
+    LNBITS_DB_CACHE is on, since no replica caches anything then.
+    """
+
+    def __init__(self, db: Database, channel: str = INVALIDATION_CHANNEL):
+        self.db = db
+        self.channel = channel
+        self.replica = os.urandom(6).hex()
+        self.enabled = DB_CACHE and db.type == POSTGRES
+        self.task: asyncio.Task | None = None
+        self.listening = False
+        self.published = 0
+        self.received = 0
+        self.reconnects = 0
+        self.lag_last: float | None = None
+        self.lag_max = 0.0
+        self.lag_sum = 0.0
+
+    def evict(self, tags) -> None:
+        self.db.cache.evict(tags)
+
+    async def notify(self, conn: Connection, tags: set[str]) -> None:
+        if not self.enabled:
+            return
+        message = {"r": self.replica, "ts": time.time(), "t": sorted(tags)}
+        payload = json.dumps(message)
+        if len(payload) > _NOTIFY_MAX_PAYLOAD:
+            payload = json.dumps({**message, "t": [ALL_TAGS]})
+        await conn.conn.execute(
+            text("SELECT pg_notify(:channel, :payload)"),
+            {"channel": self.channel, "payload": payload},
+        )
+        self.published += 1
+
+    def start(self) -> None:
+        if self.enabled and (not self.task or self.task.done()):
+            self.task = asyncio.create_task(self._listen())
+
+    async def _listen(self) -> None:
+        backoff = INVALIDATION_BACKOFF_MIN
+        while True:
+            try:
+                async with self.db.engine.connect() as conn:
+                    raw = await conn.get_raw_connection()
+                    driver = raw.driver_connection
+                    closed = asyncio.Event()
+                    driver.add_termination_listener(lambda _: closed.set())
+                    await driver.add_listener(self.channel, self._on_notify)
+                    # anything published while we were not listening is lost
+                    self.evict([ALL_TAGS])
+                    self.listening = True
+                    backoff = INVALIDATION_BACKOFF_MIN
+                    await closed.wait()
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                logger.warning(f"invalidation listener on {self.channel}: {exc!r}")
+            finally:
+                self.listening = False
+            self.reconnects += 1
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, INVALIDATION_BACKOFF_MAX)
+
+    def _on_notify(self, _connection, _pid, _channel, payload: str) -> None:
+        try:
+            message = json.loads(payload)
+        except ValueError:
+            return
+        if message.get("r") == self.replica:
+            return
+        self.received += 1
+        lag = max(time.time() - float(message.get("ts", 0)), 0.0)
+        self.lag_last = lag
+        self.lag_max = max(self.lag_max, lag)
+        self.lag_sum += lag
+        self.evict(message.get("t") or [ALL_TAGS])
+
+    def snapshot(self) -> dict:
+        cache = self.db.cache
+        return {
+            "enabled": self.enabled,
+            "listening": self.listening,
+            "published": self.published,
+            "received": self.received,
+            "reconnects": self.reconnects,
+            "lag_seconds_last": self.lag_last,
+            "lag_seconds_max": self.lag_max,
+            "lag_seconds_avg": self.lag_sum / self.received if self.received else None,
+            "cache_entries": len(cache.entries),
+            "cache_hits": cache.hits,
+            "cache_misses": cache.misses,
+        }
+
+
+# ---- Time partitioning and archival ----
+def _month_start(date: datetime, months: int = 0) -> datetime:
+    index = date.year * 12 + date.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1, tzinfo=timezone.utc)
+
+
+# Tables whose rows feed wallet balances or reports: archiving (deleting) old
+# rows there would change balances, so PartitionManager refuses them.
+PARTITION_PROTECTED_TABLES = frozenset(
+    {"apipayments", "wallets", "accounts", "apipayments_rollup", "rollup_watermarks"}
+)
+_IDENTIFIER = re.compile(r"[a-zA-Z_][a-zA-Z0-9_]*")
+
+
+class PartitionManager:
+    """
+    Keeps a table split by month on its `time_column` and moves cold months out.
+    Only for tables whose old rows nothing needs any more (audit and log style
+    tables); PARTITION_PROTECTED_TABLES are rejected.
+
+    Postgres: the table must already be declared `PARTITION BY RANGE`;
+    `maintain` creates the current and `premake` upcoming monthly partitions and
+    detaches partitions older than `retain_months`, dumping them as gzipped JSON
+    lines into `archive_dir` before dropping them. A detached partition is
+    recorded in `partition_archive_state` in the same transaction as the DETACH,
+    so a run interrupted before the DROP resumes from there. Pruning is left to
+    the planner.
+
+    SQLite: months older than `retain_months` are copied into a per-month
+    database file (attached for the copy), deleted from the live table and the
+    file is gzipped, so the hot table only holds the retained window.
+
+    Archived months are no longer visible to queries on the live table.
+    """
+
+    def __init__(
+        self,
+        db: Database,
+        table: str,
+        retain_months: int = 12,
+        premake: int = 2,
+        archive_dir: str | None = None,
+        time_column: str = "time",
+    ):
+        if not _IDENTIFIER.fullmatch(table) or not _IDENTIFIER.fullmatch(time_column):
+            raise ValueError(f"invalid table or column name: {table}.{time_column}")
+        if table in PARTITION_PROTECTED_TABLES:
+            raise ValueError(f"{table} feeds balances and cannot be archived")
+        self.db = db
+        self.table = table
+        self.time_column = time_column
+        self.retain_months = retain_months
+        self.premake = premake
+        self.archive_dir = archive_dir or os.path.join(
+            settings.lnbits_data_folder, "archive"
+        )
+
+    def partition_name(self, month: datetime) -> str:
+        return f"{self.table}_p{month:%Y%m}"
+
+    def _archive_path(self, month: datetime, ext: str) -> str:
+        return os.path.join(
+            self.archive_dir, f"{self.db.name}.{self.table}.{month:%Y%m}.{ext}"
+        )
+
+    async def maintain(self, now: datetime | None = None) -> dict[str, list[str]]:
+        now = now or datetime.now(timezone.utc)
+        await asyncio.to_thread(os.makedirs, self.archive_dir, exist_ok=True)
+        if self.db.type == POSTGRES:
+            return await self._maintain_postgres(now)
+        if self.db.type == SQLITE:
+            return await self._maintain_sqlite(now)
+        logger.warning(f"partitioning {self.table}: not supported on {self.db.type}")
+        return {"created": [], "archived": []}
+
+    async def run(self, interval: float = 86400) -> None:
+        while True:
+            try:
+                await self.maintain()
+            except Exception as exc:
+                logger.warning(
+                    f"partition maintenance for {self.table} failed: {exc!r}"
+                )
+            await asyncio.sleep(interval)
+
+    async def _maintain_postgres(self, now: datetime) -> dict[str, list[str]]:
+        created: list[str] = []
+        archived: list[str] = []
+        cutoff = _month_start(now, -self.retain_months)
+        lock = {"key": f"partition:{self.table}"}
+        async with self.db.connect() as conn:
+            # one replica at a time; the session lock survives the commits below
+            row = await conn.fetchone(
+                "SELECT pg_try_advisory_lock(hashtext(:key)) AS locked", lock
+            )
+            if not row["locked"]:
+                return {"created": created, "archived": archived}
+            try:
+                archived += await self._resume_postgres(conn)
+                created += await self._premake_postgres(conn, now)
+                for name, month in await self._partitions_postgres(conn):
+                    if month >= cutoff:
+                        continue
+                    await self._detach_postgres(conn, name, month)
+                    await self._archive_postgres(conn, name, month)
+                    archived.append(name)
+            finally:
+                # a failure above may have left the transaction aborted: unlock
+                # in a fresh one, without masking that failure
+                try:
+                    await conn.conn.rollback()
+                    await conn.execute(
+                        "SELECT pg_advisory_unlock(hashtext(:key))", lock
+                    )
+                except Exception as exc:
+                    logger.warning(f"partitioning {self.table}: unlock: {exc!r}")
+                    # ending the session is the other way to drop the lock
+                    await conn.conn.invalidate()
+        return {"created": created, "archived": archived}
+
+    async def _resume_postgres(self, conn: Connection) -> list[str]:
+        rows = await conn.fetchall(
+            f"""
+            SELECT partition_name, month
+            FROM {conn.references_schema}partition_archive_state
+            WHERE source = :table
+            """,
+            {"table": self.table},
+        )
+        resumed = []
+        for row in rows:
+            month = datetime.strptime(row["month"], "%Y%m").replace(tzinfo=timezone.utc)
+            logger.info(f"partitioning {self.table}: resuming {row['partition_name']}")
+            await self._archive_postgres(conn, row["partition_name"], month)
+            resumed.append(row["partition_name"])
+        return resumed
+
+    async def _premake_postgres(self, conn: Connection, now: datetime) -> list[str]:
+        partitioned = await conn.fetchone(
+            """
+            SELECT 1 AS yes FROM pg_partitioned_table pt
+            JOIN pg_class c ON c.oid = pt.partrelid
+            WHERE c.relname = :table
+            """,
+            {"table": self.table},
+        )
+        if not partitioned:
+            logger.warning(
+                f"partitioning {self.table}: not a partitioned table, skipping"
+            )
+            return []
+        created = []
+        schema = conn.references_schema
+        for offset in range(self.premake + 1):
+            month = _month_start(now, offset)
+            name = self.partition_name(month)
+            await conn.execute(
+                f"""
+                CREATE TABLE IF NOT EXISTS {schema}{name}
+                PARTITION OF {schema}{self.table}
+                FOR VALUES FROM ('{month:%Y-%m-%d %H:%M:%S}')
+                TO ('{_month_start(month, 1):%Y-%m-%d %H:%M:%S}')
+                """
+            )
+            created.append(name)
+        return created
+
+    async def _partitions_postgres(
+        self, conn: Connection
+    ) -> list[tuple[str, datetime]]:
+        rows = await conn.fetchall(
+            """
+            SELECT c.relname AS name FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            JOIN pg_class p ON p.oid = i.inhparent
+            WHERE p.relname = :table
+            """,
+            {"table": self.table},
+        )
+        partitions = []
+        for row in rows:
+            match = re.fullmatch(rf"{re.escape(self.table)}_p(\d{{6}})", row["name"])
+            if match:
+                month = datetime.strptime(match[1], "%Y%m").replace(tzinfo=timezone.utc)
+                partitions.append((row["name"], month))
+        return partitions
+
+    async def _detach_postgres(
+        self, conn: Connection, name: str, month: datetime
+    ) -> None:
+        schema = conn.references_schema
+        # state row and DETACH commit together, so a detached partition is never
+        # forgotten if the dump or the DROP below does not happen
+        await conn.conn.execute(
+            text(
+                f"""
+                INSERT INTO {schema}partition_archive_state
+                    (partition_name, source, month)
+                VALUES (:name, :table, :month)
+                """
+            ),
+            {"name": name, "table": self.table, "month": f"{month:%Y%m}"},
+        )
+        await conn.conn.execute(
+            text(f"ALTER TABLE {schema}{self.table} DETACH PARTITION {schema}{name}")
+        )
+        conn.invalidate(self.table, "partition_archive_state")
+        await conn._commit()
+
+    async def _archive_postgres(
+        self, conn: Connection, name: str, month: datetime
+    ) -> None:
+        schema = conn.references_schema
+        path = self._archive_path(month, "jsonl.gz")
+        # the dump only gets its final name once complete, so an existing file
+        # means an earlier run got as far as the DROP below
+        if not os.path.exists(path):
+            await self._dump_rows(conn, f"{schema}{name}", f"{path}.partial")
+            await asyncio.to_thread(os.replace, f"{path}.partial", path)
+        await conn.conn.execute(text(f"DROP TABLE IF EXISTS {schema}{name}"))
+        await conn.conn.execute(
+            text(
+                f"DELETE FROM {schema}partition_archive_state "
+                "WHERE partition_name = :name"
+            ),
+            {"name": name},
+        )
+        conn.invalidate("partition_archive_state")
+        await conn._commit()
+
+    async def _dump_rows(self, conn: Connection, relation: str, path: str) -> None:
+        result = await conn.conn.stream(text(f"SELECT * FROM {relation}"))  # noqa: S608
+        with gzip.open(path, "wt") as archive:
+            async for chunk in result.mappings().partitions(5000):
+                lines = [json.dumps(dict(r), default=str) + "\n" for r in chunk]
+                await asyncio.to_thread(archive.writelines, lines)
+        await result.close()
+
+    async def _maintain_sqlite(self, now: datetime) -> dict[str, list[str]]:
+        archived: list[str] = []
+        cutoff = _month_start(now, -self.retain_months)
+        column = self.time_column
+        async with self.db.connect() as conn:
+            while True:
+                row = await conn.fetchone(
+                    f"SELECT MIN({column}) AS oldest FROM {self.table}",  # noqa: S608
+                )
+                if not row or row["oldest"] is None:
+                    break
+                oldest = datetime.fromtimestamp(row["oldest"], timezone.utc)
+                month = _month_start(oldest)
+                if month >= cutoff:
+                    break
+                name = self.partition_name(month)
+                path = self._archive_path(month, "sqlite3")
+                if os.path.exists(f"{path}.gz"):
+                    # late rows for an already archived month get their own file
+                    path = self._archive_path(month, f"{int(time.time())}.sqlite3")
+                values = {"lo": month, "hi": _month_start(month, 1)}
+                where = f"WHERE {column} >= :lo AND {column} < :hi"
+                await conn.execute(f"ATTACH '{path}' AS {name}")
+                try:
+                    await conn.execute(
+                        f"CREATE TABLE IF NOT EXISTS {name}.{self.table} AS "
+                        f"SELECT * FROM main.{self.table} WHERE 0"  # noqa: S608
+                    )
+                    await conn.conn.execute(
+                        text(
+                            f"INSERT INTO {name}.{self.table} "  # noqa: S608
+                            f"SELECT * FROM main.{self.table} {where}"
+                        ),
+                        conn.rewrite_values(values),
+                    )
+                    deleted = await conn.execute(
+                        f"DELETE FROM main.{self.table} {where}", values  # noqa: S608
+                    )
+                finally:
+                    await conn.execute(f"DETACH {name}")
+                if not deleted.rowcount:
+                    # MIN() found a row the month bounds do not match (a time
+                    # stored in another format); stop rather than spin on it
+                    logger.warning(
+                        f"partitioning {self.table}: oldest {column} {row['oldest']!r}"
+                        f" is outside {month:%Y-%m}, stopping"
+                    )
+                    break
+                await asyncio.to_thread(self._compress, path)
+                archived.append(name)
+        return {"created": [], "archived": archived}
+
+    @staticmethod
+    def _compress(path: str) -> None:
+        with open(path, "rb") as src, gzip.open(f"{path}.gz", "wb") as dst:
+            while chunk := src.read(1 << 20):
+                dst.write(chunk)
+        os.remove(path)
+
+
+def load_partition_managers(db: Database) -> list[PartitionManager]:
+    """
+    LNBITS_DB_PARTITION_TABLES (JSON list of PartitionManager kwargs such as
+    {"table": "audit", "time_column": "created_at", "retain_months": 3}).
+    """
+    raw = os.getenv("LNBITS_DB_PARTITION_TABLES")
+    if not raw:
+        return []
+    try:
+        return [PartitionManager(db, **spec) for spec in json.loads(raw)]
+    except (ValueError, TypeError) as exc:
+        logger.warning(f"ignoring invalid LNBITS_DB_PARTITION_TABLES: {exc}")
+        return []
+
+
+# ---- Time-bucket rollups ----
+ROLLUP_GRAINS: tuple[DateTrunc, ...] = ("hour", "day", "month")
+
+_WRITE_FILTER = re.compile(
+    r"^\s*(?:UPDATE\s+[\w.\"]+\s+SET\s+(?P<set>.*?)|DELETE\s+FROM\s+[\w.\"]+)"
+    r"\s*(?P<where>\bWHERE\b.*)?$",
+    re.IGNORECASE | re.DOTALL,
+)
+
+
+def _epoch(value: Any) -> int:
+    # SQLite stores epoch seconds, Postgres hands back naive UTC datetimes
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return int(value.timestamp())
+    return int(value)
+
+
+class TimeBucketRollup:
+    """
+    Incrementally maintained hourly/daily/monthly income and spending buckets per
+    wallet for a payments-like table (`time`, `amount`, `fee`, wallet column).
+
+    Rows older than `settle_lag` seconds are folded into `{source}_rollup` by
+    `compact`, which advances a watermark: every row with `time` below it is in
+    the buckets, every row at or above it is not. `history` reads the buckets
+    plus the not-yet-rolled tail aggregated from the raw table with
+    `datetime_grouping`, so results match a full scan while only touching recent
+    rows.
+
+    Rows below the watermark can still change (a pending payment failing days
+    later, an invoice deleted). Connection calls `before_write` for every write
+    to the source table; when the write can touch a rolled row, `rewind` moves
+    the watermark back to the start of that row's month and drops the buckets
+    from there on, in the same transaction as the write. The next `compact`
+    rebuilds them.
+    """
+
+    def __init__(
+        self,
+        source: str = "apipayments",
+        wallet_column: str = "wallet_id",
+        # same rows as upstream get_payments_history
+        where: str = "(status = 'success' OR (amount < 0 AND status = 'pending'))",
+        settle_lag: int = 86400,
+        write_threshold: int = 500,
+        chunk_rows: int = 50_000,
+        watched_columns: frozenset[str] = frozenset(
+            {"time", "amount", "fee", "status"}
+        ),
+    ):
+        self.source = source
+        self.table = f"{source}_rollup"
+        self.wallet_column = wallet_column
+        self.where = where
+        self.settle_lag = settle_lag
+        self.write_threshold = write_threshold
+        self.chunk_rows = chunk_rows
+        # an UPDATE setting none of these cannot change a bucket
+        self.watched_columns = watched_columns | {wallet_column}
+        self.writes = 0
+        self.rewinds = 0
+        self.dirty = asyncio.Event()
+
+    def notify_write(self, rows: int = 1) -> None:
+        self.writes += rows
+        if self.writes >= self.write_threshold:
+            self.dirty.set()
+
+    async def migrate(self, conn: Connection) -> None:
+        bucket = "TIMESTAMP" if conn.type in {POSTGRES, COCKROACH} else "INT"
+        await conn.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS {conn.references_schema}{self.table} (
+                wallet_id TEXT NOT NULL,
+                grain TEXT NOT NULL,
+                bucket {bucket} NOT NULL,
+                income {conn.big_int} NOT NULL DEFAULT 0,
+                spending {conn.big_int} NOT NULL DEFAULT 0,
+                count {conn.big_int} NOT NULL DEFAULT 0,
+                PRIMARY KEY (wallet_id, grain, bucket)
+            )
+            """
+        )
+        await conn.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS {conn.references_schema}rollup_watermarks (
+                source TEXT PRIMARY KEY,
+                watermark {conn.big_int} NOT NULL
+            )
+            """
+        )
+
+    async def register(self, conn: Connection) -> bool:
+        """Create the watermark row compact and rewind lock; True if it was new."""
+        result = await conn.execute(
+            f"""
+            INSERT INTO {conn.references_schema}rollup_watermarks (source, watermark)
+            VALUES (:source, 0)
+            ON CONFLICT (source) DO NOTHING
+            """,
+            {"source": self.source},
+        )
+        return bool(result.rowcount)
+
+    async def watermark(self, conn: Connection, for_update: bool = False) -> int:
+        lock = " FOR UPDATE" if for_update and conn.type != SQLITE else ""
+        row = await conn.fetchone(
+            f"SELECT watermark FROM {conn.references_schema}rollup_watermarks "
+            f"WHERE source = :source{lock}",
+            {"source": self.source},
+        )
+        return int(row["watermark"]) if row else 0
+
+    def _watermark_time(self, conn: Connection) -> str:
+        """The watermark as a `time` bound, read inside the calling statement."""
+        subquery = (
+            f"COALESCE((SELECT watermark FROM {conn.references_schema}"
+            "rollup_watermarks WHERE source = :source), 0)"
+        )
+        return compat_timestamp_placeholder("watermark").replace(
+            ":watermark", subquery
+        )
+
+    def _aggregate(
+        self, conn: Connection, group: DateTrunc, lower: str, extra: str
+    ) -> str:
+        return f"""
+            SELECT {self.wallet_column} AS wallet_id,
+                {conn.datetime_grouping(group)} AS bucket,
+                SUM(CASE WHEN amount > 0 THEN amount ELSE 0 END) AS income,
+                SUM(CASE WHEN amount < 0 THEN abs(amount) + abs(fee) ELSE 0 END)
+                    AS spending,
+                COUNT(*) AS count
+            FROM {conn.references_schema}{self.source}
+            WHERE {self.where}
+                AND time >= {lower}
+                {extra}
+            GROUP BY {self.wallet_column}, {conn.datetime_grouping(group)}
+        """  # noqa: S608
+
+    async def before_write(
+        self,
+        conn: Connection,
+        where: str | None = None,
+        values: dict | None = None,
+        times: list[Any] | None = None,
+    ) -> None:
+        """
+        Rewind if a write may change rolled rows. `times` are the new `time`
+        values of inserted/updated rows; `where` selects the existing rows the
+        write changes, whose current `time` is looked up first ("" is the whole
+        table). An UPDATE passes both: it can move a row out of an old bucket
+        as well as into a new one.
+        """
+        horizon = time.time() - self.settle_lag
+        candidates = [_epoch(t) for t in times or [] if t is not None]
+        if where is not None:
+            row = await conn.fetchone(
+                f"SELECT MIN(time) AS oldest "
+                f"FROM {conn.references_schema}{self.source} {where}",  # noqa: S608
+                values,
+            )
+            if row and row["oldest"] is not None:
+                candidates.append(_epoch(row["oldest"]))
+        oldest = min(candidates, default=None)
+        if oldest is not None and oldest < horizon:
+            await self.rewind(conn, oldest)
+
+    async def before_query(
+        self, conn: Connection, query: str, values: dict | None = None
+    ) -> None:
+        """before_write for a raw UPDATE/DELETE statement on the source table."""
+        match = _WRITE_FILTER.match(query)
+        if not match:
+            # INSERT ... SELECT and friends: new rows, never below the watermark
+            return
+        times = None
+        if match["set"] is not None:
+            columns = {c.lower() for c in re.findall(r"(\w+)\s*=", match["set"])}
+            if not columns & self.watched_columns:
+                return
+            moved = re.search(r"\btime\s*=\s*:(\w+)", match["set"], re.IGNORECASE)
+            if moved and values and moved[1] in values:
+                times = [values[moved[1]]]
+        await self.before_write(conn, match["where"] or "", values, times)
+
+    async def rewind(self, conn: Connection, oldest: int) -> None:
+        """Un-roll everything from the month of `oldest` on (in conn's transaction)."""
+        mark = _month_start(datetime.fromtimestamp(oldest, timezone.utc))
+        values = conn.rewrite_values(
+            {"source": self.source, "mark": int(mark.timestamp()), "bucket": mark}
+        )
+        schema = conn.references_schema
+        # always touch the row: on Postgres this waits for a running compact
+        await conn.conn.execute(
+            text(
+                f"""
+                UPDATE {schema}rollup_watermarks SET watermark =
+                    CASE WHEN watermark > :mark THEN :mark ELSE watermark END
+                WHERE source = :source
+                """
+            ),
+            values,
+        )
+        await conn.conn.execute(
+            text(
+                conn.rewrite_query(
+                    f"DELETE FROM {schema}{self.table} "
+                    f"WHERE bucket >= {conn.timestamp_placeholder('bucket')}"
+                )
+            ),
+            values,
+        )
+        conn.invalidate(self.table, "rollup_watermarks")
+        self.rewinds += 1
+
+    async def compact(self, conn: Connection) -> tuple[int, bool]:
+        """
+        Fold settled rows from the watermark towards now - settle_lag, about
+        `chunk_rows` rows per call. Returns the buckets written and whether the
+        watermark caught up.
+        """
+        self.writes = 0
+        self.dirty.clear()
+        # locked until commit, so a concurrent rewind lands before or after
+        low = await self.watermark(conn, for_update=True)
+        # align to the hour so a bucket never straddles the watermark twice
+        horizon = int(time.time() - self.settle_lag) // 3600 * 3600
+        if horizon <= low:
+            await conn._commit()
+            return 0, True
+        high = horizon
+        row = await conn.fetchone(
+            f"""
+            SELECT time FROM {conn.references_schema}{self.source}
+            WHERE time >= {conn.timestamp_placeholder("lo")}
+            ORDER BY time LIMIT 1 OFFSET :chunk
+            """,  # noqa: S608
+            {"lo": datetime.fromtimestamp(low, timezone.utc), "chunk": self.chunk_rows},
+        )
+        if row:
+            # stop at the hour of the chunk_rows-th row, but always advance
+            high = min(horizon, max(_epoch(row["time"]) // 3600 * 3600, low + 3600))
+        values = conn.rewrite_values(
+            {
+                "lo": datetime.fromtimestamp(low, timezone.utc),
+                "hi": datetime.fromtimestamp(high, timezone.utc),
+                "source": self.source,
+                "watermark": high,
+            }
+        )
+        lower = conn.timestamp_placeholder("lo")
+        upper = f"AND time < {conn.timestamp_placeholder('hi')}"
+        rolled = 0
+        # one transaction: buckets and watermark move together
+        for group in ROLLUP_GRAINS:
+            result = await conn.conn.execute(
+                text(
+                    conn.rewrite_query(
+                        f"""
+                        INSERT INTO {conn.references_schema}{self.table} AS r
+                            (wallet_id, grain, bucket, income, spending, count)
+                        SELECT wallet_id, '{group}', bucket, income, spending, count
+                        FROM ({self._aggregate(conn, group, lower, upper)}) AS agg
+                        WHERE true
+                        ON CONFLICT (wallet_id, grain, bucket) DO UPDATE SET
+                            income = r.income + excluded.income,
+                            spending = r.spending + excluded.spending,
+                            count = r.count + excluded.count
+                        """  # noqa: S608
+                    )
+                ),
+                values,
+            )
+            rolled += max(result.rowcount or 0, 0)
+        await conn.conn.execute(
+            text(
+                f"""
+                INSERT INTO {conn.references_schema}rollup_watermarks
+                    (source, watermark)
+                VALUES (:source, :watermark)
+                ON CONFLICT (source) DO UPDATE SET watermark = excluded.watermark
+                """
+            ),
+            values,
+        )
+        conn.invalidate(self.table, "rollup_watermarks")
+        await conn._commit()
+        logger.debug(f"rollup {self.table}: {rolled} buckets up to {high}")
+        return rolled, high >= horizon
+
+    async def history(
+        self,
+        conn: Connection,
+        wallet_id: str,
+        group: DateTrunc,
+        since: datetime | None = None,
+    ) -> list[dict]:
+        """Rollup buckets plus the live tail, newest first."""
+        values: dict = {"wallet_id": wallet_id, "grain": group, "source": self.source}
+        rolled_since = tail_since = ""
+        if since:
+            values["since"] = since
+            placeholder = conn.timestamp_placeholder("since")
+            rolled_since = f"AND bucket >= {placeholder}"
+            tail_since = f"AND time >= {placeholder}"
+        tail = self._aggregate(
+            conn,
+            group,
+            self._watermark_time(conn),
+            f"AND {self.wallet_column} = :wallet_id {tail_since}",
+        )
+        # one statement, so buckets and tail see the same watermark even while
+        # another replica compacts or rewinds
+        rows = await conn.fetchall(
+            f"""
+            SELECT bucket, SUM(income) AS income, SUM(spending) AS spending
+            FROM (
+                SELECT bucket, income, spending
+                FROM {conn.references_schema}{self.table}
+                WHERE wallet_id = :wallet_id AND grain = :grain {rolled_since}
+                UNION ALL
+                SELECT bucket, income, spending FROM ({tail}) AS tail
+            ) AS merged
+            GROUP BY bucket
+            ORDER BY bucket DESC
+            """,  # noqa: S608
+            values,
+        )
+        return [
+            {
+                "date": row["bucket"],
+                "income": int(row["income"] or 0),
+                "spending": int(row["spending"] or 0),
+            }
+            for row in rows
+        ]
+
+
 # ---- Filter helpers (unchanged from upstream) ----
 class Operator(Enum):
     GT = "gt"
@@ -656,22 +2023,25 @@ def update_query(
     return f"UPDATE {table_name} SET {query} {where}"  # noqa: S608
 
 
+def is_json_field(field: Any) -> bool:
+    return (
+        type(field.type_) is type(BaseModel)
+        or field.type_ is dict
+        or get_origin(field.outer_type_) is list
+    )
+
+
 def model_to_dict(model: BaseModel) -> dict:
     _dict: dict = {}
     for key, value in model.dict().items():
-        type_ = model.__fields__[key].type_
-        outertype_ = model.__fields__[key].outer_type_
-        if model.__fields__[key].field_info.extra.get("no_database", False):
+        field = model.__fields__[key]
+        if field.field_info.extra.get("no_database", False):
             continue
         if isinstance(value, datetime):
             _dict[key] = value.timestamp()
             continue
-        if (
-            type(type_) is type(BaseModel)
-            or type_ is dict
-            or get_origin(outertype_) is list
-        ):
-            _dict[key] = json.dumps(value)
+        if is_json_field(field):
+            _dict[key] = json_dumps(value)
             continue
         _dict[key] = value
 
@@ -718,7 +2088,7 @@ def dict_to_model(_row: dict, model: type[TModel]) -> TModel:  # noqa: C901
             _dict[key] = dict_to_submodel(type_, value)
             continue
         if type_ is dict and value:
-            _dict[key] = _safe_load_json(value)
+            _dict[key] = _safe_load_json(value) if isinstance(value, str) else value
             continue
         _dict[key] = value
         continue
@@ -730,7 +2100,7 @@ def dict_to_model(_row: dict, model: type[TModel]) -> TModel:  # noqa: C901
 
 def _safe_load_json(value: str) -> dict:
     try:
-        return json.loads(value)
-    except json.JSONDecodeError:
+        return json_loads(value)
+    except ValueError:
         logger.error(f"Failed to decode JSON: '{value}'")
         return {}
@@ -7,7 +7,7 @@ import sys
 def _patch():
     orig_init = lndgrpc.LndWallet.__init__
 
-    def wrapped(self):
+    def wrapped(self, *args, **kwargs):
         # Force-fill macaroon from admin env or file before calling original init.
         mac = os.getenv("LND_GRPC_ADMIN_MACAROON") or os.getenv("LND_GRPC_MACAROON")
         if not mac:
@@ -28,7 +28,7 @@ def _patch():
             bool(lndgrpc.settings.lnd_grpc_macaroon),
             file=sys.stderr,
         )
-        return orig_init(self)
+        return orig_init(self, *args, **kwargs)
 
     lndgrpc.LndWallet.__init__ = wrapped
 
@@ -1,11 +1,15 @@
 import asyncio
 import base64
+import json
 import os
+import time
+from collections import OrderedDict
 from collections.abc import AsyncGenerator
 from hashlib import sha256
 from os import environ
 
 import grpc
+from bolt11 import decode as bolt11_decode
 from loguru import logger
 
 import lnbits.wallets.lnd_grpc_files.invoices_pb2 as invoices
@@ -15,6 +19,7 @@ import lnbits.wallets.lnd_grpc_files.lightning_pb2_grpc as lnrpc
 import lnbits.wallets.lnd_grpc_files.router_pb2 as router
 from lnbits.helpers import normalize_endpoint
 from lnbits.settings import settings
+from lnbits.tracing import start_span
 from lnbits.utils.crypto import random_secret_and_hash
 from lnbits.wallets.lnd_grpc_files.router_pb2_grpc import RouterStub
 
@@ -58,6 +63,457 @@ def bytes_to_hex(b: bytes) -> str:
     return b.hex()
 
 
+def invoice_status(invoice) -> PaymentStatus:
+    if invoice.settled:
+        return PaymentSuccessStatus(preimage=invoice.r_preimage.hex())
+    if invoice.state == ln.Invoice.CANCELED:
+        return PaymentFailedStatus()
+    return PaymentPendingStatus()
+
+
+PAYMENT_FAILURE_REASONS = {
+    0: "Payment failed: No error given.",
+    1: "Payment failed: Payment timed out.",
+    2: "Payment failed: No route to destination.",
+    3: "Payment failed: Error.",
+    4: "Payment failed: Incorrect payment details.",
+    5: "Payment failed: Insufficient balance.",
+}
+
+
+def payment_status(payment) -> PaymentStatus:
+    if payment.status == ln.Payment.SUCCEEDED:
+        return PaymentSuccessStatus(
+            fee_msat=payment.fee_msat, preimage=payment.payment_preimage
+        )
+    if payment.status == ln.Payment.FAILED:
+        return PaymentFailedStatus()
+    return PaymentPendingStatus()
+
+
+def payment_hash_hex(checking_id: str) -> str:
+    """Outgoing checking_ids are hex payment hashes, older rows used base64."""
+    if len(checking_id) == 64:
+        try:
+            bytes.fromhex(checking_id)
+            return checking_id.lower()
+        except ValueError:
+            pass
+    return b64_to_bytes(checking_id).hex()
+
+
+class PaymentStateCache:
+    """
+    Latest lnrpc.Payment per payment hash, fed by a TrackPayments stream.
+    In-flight entries are only trusted for `inflight_ttl` seconds, since the
+    stream may have missed the final update; finalized ones are kept for
+    `ttl` seconds and at most `max_finalized` entries.
+    """
+
+    def __init__(
+        self, max_finalized: int = 10000, ttl: float = 3600, inflight_ttl: float = 5
+    ):
+        self.max_finalized = max_finalized
+        self.ttl = ttl
+        self.inflight_ttl = inflight_ttl
+        self.inflight: dict[str, tuple[float, object]] = {}
+        self.finalized: OrderedDict[str, tuple[float, object]] = OrderedDict()
+
+    def update(self, payment) -> None:
+        if payment.status in (ln.Payment.SUCCEEDED, ln.Payment.FAILED):
+            self.inflight.pop(payment.payment_hash, None)
+            self.finalized[payment.payment_hash] = (time.monotonic(), payment)
+            self.finalized.move_to_end(payment.payment_hash)
+            self._evict()
+        else:
+            self.inflight[payment.payment_hash] = (time.monotonic(), payment)
+
+    def get(self, payment_hash: str):
+        """Cached payment, or None when the caller should ask LND itself."""
+        entry = self.finalized.get(payment_hash)
+        if entry:
+            return entry[1]
+        entry = self.inflight.get(payment_hash)
+        if not entry:
+            return None
+        if time.monotonic() - entry[0] > self.inflight_ttl:
+            del self.inflight[payment_hash]
+            return None
+        return entry[1]
+
+    def clear_inflight(self) -> None:
+        # updates may have been missed while the stream was down
+        self.inflight.clear()
+
+    def _evict(self) -> None:
+        expired = time.monotonic() - self.ttl
+        while self.finalized:
+            stored_at, _ = next(iter(self.finalized.values()))
+            if len(self.finalized) <= self.max_finalized and stored_at > expired:
+                break
+            self.finalized.popitem(last=False)
+
+
+# Seconds an in-flight entry answers get_payment_status before TrackPaymentV2
+# is asked again.
+PAYMENT_INFLIGHT_TTL = float(environ.get("LND_PAYMENT_INFLIGHT_TTL", "5"))
+# Number of HTTP/2 connections to LND; stubs are picked round-robin across them.
+GRPC_CHANNELS = int(environ.get("LND_GRPC_CHANNELS", "1"))
+# Large ListInvoices/ListPayments replies exceed gRPC's 4 MB default.
+GRPC_MAX_MESSAGE_BYTES = int(environ.get("LND_GRPC_MAX_MESSAGE_MB", "50")) << 20
+GRPC_KEEPALIVE_MS = int(environ.get("LND_GRPC_KEEPALIVE_MS", "30000"))
+GRPC_KEEPALIVE_TIMEOUT_MS = int(environ.get("LND_GRPC_KEEPALIVE_TIMEOUT_MS", "10000"))
+
+
+def grpc_channel_options() -> list[tuple[str, int]]:
+    return [
+        ("grpc.max_receive_message_length", GRPC_MAX_MESSAGE_BYTES),
+        ("grpc.max_send_message_length", GRPC_MAX_MESSAGE_BYTES),
+        ("grpc.keepalive_time_ms", GRPC_KEEPALIVE_MS),
+        ("grpc.keepalive_timeout_ms", GRPC_KEEPALIVE_TIMEOUT_MS),
+        ("grpc.keepalive_permit_without_calls", 1),
+        ("grpc.http2.max_pings_without_data", 0),
+        # without this, channels with identical args share one connection
+        ("grpc.use_local_subchannel_pool", 1),
+    ]
+
+
+# Upper bounds (ms) of the per-method latency histogram buckets.
+RPC_LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+
+class RpcMetrics:
+    """Per-method call counts, status codes, latency histogram and open calls."""
+
+    def __init__(self):
+        self.methods: dict[str, dict] = {}
+
+    def _method(self, method: str) -> dict:
+        if method not in self.methods:
+            self.methods[method] = {
+                "calls": 0,
+                "in_flight": 0,
+                "codes": {},
+                "latency_ms_sum": 0.0,
+                "latency_ms_buckets": [0] * (len(RPC_LATENCY_BUCKETS_MS) + 1),
+            }
+        return self.methods[method]
+
+    def started(self, method: str) -> None:
+        stats = self._method(method)
+        stats["calls"] += 1
+        stats["in_flight"] += 1
+
+    def finished(self, method: str, code: str, latency_ms: float) -> None:
+        stats = self._method(method)
+        stats["in_flight"] -= 1
+        stats["codes"][code] = stats["codes"].get(code, 0) + 1
+        stats["latency_ms_sum"] += latency_ms
+        bucket = len(RPC_LATENCY_BUCKETS_MS)
+        for i, bound in enumerate(RPC_LATENCY_BUCKETS_MS):
+            if latency_ms <= bound:
+                bucket = i
+                break
+        stats["latency_ms_buckets"][bucket] += 1
+
+    def snapshot(self) -> dict:
+        return {
+            "latency_buckets_ms": [*RPC_LATENCY_BUCKETS_MS, "+Inf"],
+            "methods": {
+                method: {**stats, "codes": dict(stats["codes"])}
+                for method, stats in self.methods.items()
+            },
+        }
+
+
+rpc_metrics = RpcMetrics()
+
+
+class _MetricsInterceptor:
+    _tasks: set[asyncio.Task] = set()
+
+    async def _record(self, call, method: str, start: float, span) -> None:
+        try:
+            code = (await call.code()).name
+        except Exception:
+            code = "UNKNOWN"
+        rpc_metrics.finished(method, code, (time.perf_counter() - start) * 1000)
+        if span:
+            span.set("rpc.grpc.status_code", code)
+            span.end(None if code == "OK" else code)
+
+    async def _intercept(self, continuation, client_call_details, request):
+        method = client_call_details.method
+        if isinstance(method, bytes):
+            method = method.decode()
+        method = method.rsplit("/", 1)[-1]
+        start = time.perf_counter()
+        rpc_metrics.started(method)
+        # ended by _record, which runs outside the caller's context
+        span = start_span(f"lnd.{method}", **{"rpc.method": method})
+        try:
+            call = await continuation(client_call_details, request)
+        except Exception as exc:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            rpc_metrics.finished(method, "UNKNOWN", elapsed_ms)
+            if span:
+                span.end(repr(exc))
+            raise
+        # code() resolves when the call (or the whole stream) is over
+        task = asyncio.create_task(self._record(call, method, start, span))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return call
+
+
+class UnaryUnaryMetricsInterceptor(
+    _MetricsInterceptor, grpc.aio.UnaryUnaryClientInterceptor
+):
+    async def intercept_unary_unary(self, continuation, client_call_details, request):
+        return await self._intercept(continuation, client_call_details, request)
+
+
+class UnaryStreamMetricsInterceptor(
+    _MetricsInterceptor, grpc.aio.UnaryStreamClientInterceptor
+):
+    async def intercept_unary_stream(self, continuation, client_call_details, request):
+        return await self._intercept(continuation, client_call_details, request)
+
+
+# Payments allowed in SendPaymentV2 at once; extra payments wait for a slot.
+PAY_MAX_INFLIGHT = int(environ.get("LND_PAY_MAX_INFLIGHT", "32"))
+# Return a pending PaymentResponse at once and settle it in the background.
+PAY_DISPATCH = environ.get("LND_PAY_DISPATCH", "").lower() in {"1", "true", "yes"}
+
+
+class PaymentStrategy:
+    """SendPaymentV2 knobs for payments of at least `min_amount_msat`."""
+
+    def __init__(
+        self,
+        name: str,
+        min_amount_msat: int = 0,
+        max_parts: int = 16,
+        max_shard_size_msat: int = 0,
+        time_pref: float = 0.0,
+        timeout_seconds: int = 30,
+        outgoing_chan_ids: list[int] | None = None,
+    ):
+        self.name = name
+        self.min_amount_msat = min_amount_msat
+        self.max_parts = max_parts
+        self.max_shard_size_msat = max_shard_size_msat
+        # -1 optimizes for fees, 1 for speed
+        self.time_pref = time_pref
+        self.timeout_seconds = timeout_seconds
+        self.outgoing_chan_ids = outgoing_chan_ids or []
+        self.attempts = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.settle_seconds_sum = 0.0
+
+    def record(self, ok: bool | None, seconds: float) -> None:
+        self.attempts += 1
+        if ok:
+            self.succeeded += 1
+            self.settle_seconds_sum += seconds
+        elif ok is False:
+            self.failed += 1
+
+    def metrics(self) -> dict:
+        return {
+            "attempts": self.attempts,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "success_rate": self.succeeded / self.attempts if self.attempts else None,
+            "avg_settle_seconds": (
+                self.settle_seconds_sum / self.succeeded if self.succeeded else None
+            ),
+        }
+
+
+def load_payment_strategies() -> list[PaymentStrategy]:
+    """LND_PAY_STRATEGIES (JSON list of PaymentStrategy kwargs) or the defaults."""
+    raw = environ.get("LND_PAY_STRATEGIES")
+    if raw:
+        try:
+            strategies = [PaymentStrategy(**spec) for spec in json.loads(raw)]
+            return sorted(strategies, key=lambda s: s.min_amount_msat)
+        except (ValueError, TypeError) as exc:
+            logger.warning(f"ignoring invalid LND_PAY_STRATEGIES: {exc}")
+    # small payments give up after 20s rather than upstream's flat 30s: they
+    # favour speed, and a stuck small payment is better failed and retried
+    return [
+        PaymentStrategy("small", 0, max_parts=4, time_pref=0.5, timeout_seconds=20),
+        PaymentStrategy("medium", 100_000_000, max_parts=16, timeout_seconds=45),
+        PaymentStrategy(
+            "large",
+            1_000_000_000,
+            max_parts=32,
+            max_shard_size_msat=250_000_000,
+            time_pref=-0.5,
+            timeout_seconds=90,
+        ),
+    ]
+
+
+# Failures that say the destination is unreachable right now, not a one-off.
+# INSUFFICIENT_BALANCE is left out: it is about our own liquidity, which a
+# channel open or an incoming payment can fix at any moment.
+DOOMED_FAILURE_REASONS = {2}  # NO_ROUTE
+# Seconds to skip payments to a destination and amount bucket after such a
+# failure; a route that fails for a large amount may still carry a small one.
+PAY_FAILED_DEST_TTL = float(environ.get("LND_PAY_FAILED_DEST_TTL", "60"))
+
+# Seconds a route fee quote stays usable.
+FEE_QUOTE_TTL = float(environ.get("LND_FEE_QUOTE_TTL", "120"))
+# Quotes kept at most; the least recently used go first.
+FEE_QUOTE_MAX = int(environ.get("LND_FEE_QUOTE_MAX", "10000"))
+# pay_invoice caps fee_limit_msat at quote * headroom when a quote is cached.
+FEE_QUOTE_HEADROOM = float(environ.get("LND_FEE_QUOTE_HEADROOM", "1.5"))
+
+
+def amount_bucket_sat(amount_msat: int) -> int:
+    """Round up to a power of two so nearby amounts share one quote."""
+    sat = max((amount_msat + 999) // 1000, 1)
+    return 1 << (sat - 1).bit_length()
+
+
+MODULE_LOADED_AT = time.monotonic()
+# Deadline for warmup() to get the channels ready and GetInfo answered.
+WARMUP_DEADLINE = float(environ.get("LND_WARMUP_DEADLINE", "15"))
+
+# Seconds a ChannelBalance result answers status() before it is refreshed.
+STATUS_CACHE_TTL = float(environ.get("LND_STATUS_CACHE_TTL", "5"))
+
+# Open SubscribeSingleInvoice streams for hold invoices; extra watches queue.
+HOLD_WATCH_MAX = int(environ.get("LND_HOLD_WATCH_MAX", "256"))
+HOLD_FINAL_STATES = {"SETTLED", "CANCELED"}
+
+
+class HoldInvoiceWatch:
+    """
+    Awaitable OPEN -> ACCEPTED -> SETTLED/CANCELED state of one hold invoice.
+    `live` while its stream is open and has sent the current state, so
+    get_invoice_status can answer from it.
+    """
+
+    def __init__(self, payment_hash: str):
+        self.payment_hash = payment_hash
+        self.state = "OPEN"
+        self.live = False
+        self.changed = asyncio.Condition()
+        self.task: asyncio.Task | None = None
+
+    async def set_state(self, state: str) -> None:
+        async with self.changed:
+            if self.state in HOLD_FINAL_STATES:
+                return
+            self.state = state
+            self.changed.notify_all()
+
+    async def wait_for(self, *states: str, timeout: float | None = None) -> str:
+        """Wait until the invoice reaches one of `states` (or a final state)."""
+        wanted = set(states) | HOLD_FINAL_STATES
+
+        async def _wait() -> str:
+            async with self.changed:
+                await self.changed.wait_for(lambda: self.state in wanted)
+                return self.state
+
+        return await asyncio.wait_for(_wait(), timeout)
+
+
+STREAM_BACKOFF_MIN = 1.0
+STREAM_BACKOFF_MAX = 60.0
+
+
+# Seconds between writes of a node's invoice checkpoint while settling.
+INVOICE_CHECKPOINT_INTERVAL = float(
+    environ.get("LND_INVOICE_CHECKPOINT_INTERVAL", "1")
+)
+
+
+# lnd_invoice_checkpoints is created by lnbits/overlay_migrations.py
+async def load_invoice_checkpoint(node: str) -> tuple[int, int]:
+    from lnbits.core.db import db
+
+    try:
+        row = await db.fetchone(
+            "SELECT settle_index, add_index FROM lnd_invoice_checkpoints "
+            "WHERE node = :node",
+            {"node": node},
+        )
+    except Exception as exc:
+        logger.warning(f"cannot load invoice checkpoint, starting live: {exc}")
+        return 0, 0
+    if not row:
+        return 0, 0
+    return int(row["settle_index"]), int(row["add_index"])
+
+
+async def save_invoice_checkpoint(node: str, settle_index: int, add_index: int):
+    from lnbits.core.db import db
+
+    try:
+        await db.execute(
+            """
+            INSERT INTO lnd_invoice_checkpoints (node, settle_index, add_index)
+            VALUES (:node, :settle_index, :add_index)
+            ON CONFLICT (node) DO UPDATE SET
+                settle_index = excluded.settle_index,
+                add_index = excluded.add_index
+            """,
+            {"node": node, "settle_index": settle_index, "add_index": add_index},
+        )
+    except Exception as exc:
+        logger.warning(f"cannot save invoice checkpoint {settle_index}: {exc}")
+
+
+class InvoiceCheckpoint:
+    """
+    SubscribeInvoices position of one node. advance() only moves it in memory;
+    the row is written at most every `interval` seconds and on close(), so a
+    burst of settlements costs one write. A crash replays at most the last
+    `interval` seconds of settlements, which consumers already tolerate.
+    """
+
+    def __init__(self, node: str, interval: float = INVOICE_CHECKPOINT_INTERVAL):
+        self.node = node
+        self.interval = interval
+        self.settle_index = 0
+        self.add_index = 0
+        self._saved = (0, 0)
+        self._task: asyncio.Task | None = None
+
+    async def load(self) -> tuple[int, int]:
+        self.settle_index, self.add_index = await load_invoice_checkpoint(self.node)
+        self._saved = (self.settle_index, self.add_index)
+        return self._saved
+
+    def advance(self, settle_index: int, add_index: int) -> None:
+        self.settle_index = settle_index
+        self.add_index = add_index
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._save_later())
+
+    async def _save_later(self) -> None:
+        await asyncio.sleep(self.interval)
+        await self.flush()
+
+    async def flush(self) -> None:
+        position = (self.settle_index, self.add_index)
+        if position == self._saved:
+            return
+        await save_invoice_checkpoint(self.node, *position)
+        self._saved = position
+
+    async def close(self) -> None:
+        if self._task and not self._task.done():
+            self._task.cancel()
+        await self.flush()
+
+
 # Due to updated ECDSA generated tls.cert we need to let gprc know that
 # we need to use that cipher suite otherwise there will be a handhsake
 # error when we communicate with the lnd rpc server.
@@ -67,7 +523,14 @@ environ["GRPC_SSL_CIPHER_SUITES"] = "HIGH+ECDSA"
 class LndWallet(Wallet):
     features = [Feature.holdinvoice]
 
-    def __init__(self):
+    def __init__(
+        self,
+        endpoint: str | None = None,
+        port: int | None = None,
+        cert: str | None = None,
+        macaroon: str | None = None,
+    ):
+        # Explicit arguments (LndPoolWallet nodes) win over settings and env.
         # Allow env vars to backfill values that might be missing in settings.
         endpoint_env = environ.get("LND_GRPC_ENDPOINT")
         port_env = environ.get("LND_GRPC_PORT")
@@ -87,34 +550,30 @@ class LndWallet(Wallet):
             settings.lnd_grpc_admin_macaroon = macaroon_env
 
         cert_path = (
-            settings.lnd_grpc_cert
+            cert
+            or settings.lnd_grpc_cert
             or settings.lnd_cert
             or environ.get("LND_GRPC_CERT")
             or environ.get("LND_CERT")
         )
-        # Support inline PEM (plain or base64) content by writing it to a temp file.
+        # Support inline PEM (plain or base64) content, kept in memory.
+        self._cert_pem: bytes | None = None
         if cert_path:
             if "BEGIN CERTIFICATE" in cert_path or "\n" in cert_path:
-                inline_path = "/tmp/lnd-inline.cert"
-                with open(inline_path, "w") as f:
-                    f.write(cert_path)
-                cert_path = inline_path
+                self._cert_pem = cert_path.encode()
             else:
                 try:
-                    decoded = base64.b64decode(cert_path).decode()
-                    if "BEGIN CERTIFICATE" in decoded:
-                        inline_path = "/tmp/lnd-inline.cert"
-                        with open(inline_path, "w") as f:
-                            f.write(decoded)
-                        cert_path = inline_path
+                    decoded = base64.b64decode(cert_path)
+                    if b"BEGIN CERTIFICATE" in decoded:
+                        self._cert_pem = decoded
                 except Exception:
                     pass
         if not cert_path and os.path.exists("/tmp/lnd-tls.cert"):
             cert_path = "/tmp/lnd-tls.cert"
 
-        if not settings.lnd_grpc_endpoint:
+        if not (endpoint or settings.lnd_grpc_endpoint):
             raise ValueError("cannot initialize LndWallet: missing lnd_grpc_endpoint")
-        if not settings.lnd_grpc_port:
+        if not (port or settings.lnd_grpc_port):
             raise ValueError("cannot initialize LndWallet: missing lnd_grpc_port")
 
         if not cert_path:
@@ -123,7 +582,7 @@ class LndWallet(Wallet):
             )
 
         # If endpoint already includes a port, strip it and capture as fallback port.
-        endpoint_host = settings.lnd_grpc_endpoint
+        endpoint_host = endpoint or settings.lnd_grpc_endpoint
         extra_port = None
         if endpoint_host and ":" in endpoint_host:
             endpoint_host, _, _port = endpoint_host.partition(":")
@@ -132,10 +591,14 @@ class LndWallet(Wallet):
             except Exception:
                 extra_port = None
         self.endpoint = normalize_endpoint(endpoint_host, add_proto=False)
-        self.port = int(settings.lnd_grpc_port or port_env or extra_port or 10009)
+        if endpoint:
+            self.port = int(port or extra_port or 10009)
+        else:
+            self.port = int(settings.lnd_grpc_port or port_env or extra_port or 10009)
 
         macaroon = (
-            settings.lnd_grpc_macaroon
+            macaroon
+            or settings.lnd_grpc_macaroon
             or settings.lnd_grpc_admin_macaroon
             or settings.lnd_admin_macaroon
             or settings.lnd_grpc_invoice_macaroon
@@ -148,30 +611,239 @@ class LndWallet(Wallet):
             if os.path.exists(mac_path):
                 macaroon = mac_path
 
-        encrypted_macaroon = settings.lnd_grpc_macaroon_encrypted
+        self._cert_path = cert_path
+        self._macaroon_source = macaroon
+        self._encrypted_macaroon = settings.lnd_grpc_macaroon_encrypted
+        self.macaroon: str | None = None
+        if not (macaroon and os.path.isfile(macaroon)):
+            # inline hex/base64 macaroons need no I/O, fail fast on bad values
+            self.macaroon = self._load_macaroon()
+
+        # Channels are opened by warmup() (or lazily by the first RPC) so file
+        # reads stay off the event loop and connection setup happens up front.
+        self.channels: list[grpc.aio.Channel] = []
+        self._stubs: list[tuple] = []
+        self._next_stub = 0
+        self._warmup_task: asyncio.Task | None = None
+        self.created_at = time.monotonic()
+        self.first_rpc_seconds: float | None = None
+        try:
+            self._warmup_task = asyncio.get_running_loop().create_task(self._warmup())
+        except RuntimeError:
+            pass
+
+        self.payment_states = PaymentStateCache(inflight_ttl=PAYMENT_INFLIGHT_TTL)
+        self._track_payments_task: asyncio.Task | None = None
+
+        self._status_cache: tuple[float, StatusResponse] | None = None
+        self._status_refresh: asyncio.Task | None = None
+        self._channel_events_task: asyncio.Task | None = None
+        # set whenever the balance may have moved, for push consumers
+        self.status_changed = asyncio.Event()
+
+        self.hold_watches: dict[str, HoldInvoiceWatch] = {}
+        self.hold_stream_slots = asyncio.Semaphore(HOLD_WATCH_MAX)
+
+        self.pay_strategies = load_payment_strategies()
+        self.failing_destinations: dict[tuple[str, int], tuple[float, str]] = {}
+        self.fee_quotes: OrderedDict[tuple[str, int], tuple[float, int]] = (
+            OrderedDict()
+        )
+        self._fee_quote_tasks: dict[tuple[str, int], asyncio.Task] = {}
+
+        self.pay_semaphore = asyncio.Semaphore(PAY_MAX_INFLIGHT)
+        self.pay_futures: dict[str, asyncio.Future[PaymentResponse]] = {}
+        self._pay_tasks: set[asyncio.Task] = set()
+        self.pay_queued = 0
+        self.pay_inflight = 0
+        self.pay_completed = 0
+
+    def _load_macaroon(self) -> str:
         try:
-            self.macaroon = load_macaroon(macaroon, encrypted_macaroon)
+            return load_macaroon(self._macaroon_source, self._encrypted_macaroon)
         except ValueError as exc:
             raise ValueError(f"cannot load macaroon for LndWallet: {exc!s}") from exc
 
-        cert = open(cert_path, "rb").read()
-        creds = grpc.ssl_channel_credentials(cert)
+    def _load_secrets(self) -> None:
+        """Blocking file reads; warmup() runs this in a worker thread."""
+        if self._cert_pem is None:
+            with open(self._cert_path, "rb") as f:
+                self._cert_pem = f.read()
+        if self.macaroon is None:
+            self.macaroon = self._load_macaroon()
+
+    def _connect(self) -> None:
+        if self._stubs:
+            return
+        self._load_secrets()
+        creds = grpc.ssl_channel_credentials(self._cert_pem)
         auth_creds = grpc.metadata_call_credentials(self.metadata_callback)
         composite_creds = grpc.composite_channel_credentials(creds, auth_creds)
-        channel = grpc.aio.secure_channel(
-            f"{self.endpoint}:{self.port}", composite_creds
+        self.channels = [
+            grpc.aio.secure_channel(
+                f"{self.endpoint}:{self.port}",
+                composite_creds,
+                options=grpc_channel_options(),
+                interceptors=[
+                    UnaryUnaryMetricsInterceptor(),
+                    UnaryStreamMetricsInterceptor(),
+                ],
+            )
+            for _ in range(max(GRPC_CHANNELS, 1))
+        ]
+        self._stubs = [
+            (
+                lnrpc.LightningStub(channel),
+                RouterStub(channel),
+                invoicesrpc.InvoicesStub(channel),
+            )
+            for channel in self.channels
+        ]
+
+    async def warmup(self) -> bool:
+        """App-startup hook: secrets, connected channels and one cheap RPC."""
+        if not self._warmup_task:
+            self._warmup_task = asyncio.create_task(self._warmup())
+        return await asyncio.shield(self._warmup_task)
+
+    async def _warmup(self) -> bool:
+        started = time.monotonic()
+        try:
+            await asyncio.to_thread(self._load_secrets)
+            # grpc.aio channels bind to the running loop, create them here
+            self._connect()
+            await asyncio.wait_for(
+                asyncio.gather(*(c.channel_ready() for c in self.channels)),
+                WARMUP_DEADLINE,
+            )
+            info = await self._stubs[0][0].GetInfo(
+                ln.GetInfoRequest(), timeout=WARMUP_DEADLINE  # type: ignore
+            )
+        except Exception as exc:
+            logger.warning(
+                f"LndWallet warmup failed after {time.monotonic() - started:.2f}s: "
+                f"{exc!r}"
+            )
+            return False
+        self._mark_first_rpc()
+        logger.info(
+            f"LndWallet warm: {info.alias or self.endpoint} ready in "
+            f"{time.monotonic() - started:.2f}s, "
+            f"first RPC {self.first_rpc_seconds:.2f}s after init"
         )
-        self.rpc = lnrpc.LightningStub(channel)
-        self.routerpc = RouterStub(channel)
-        self.invoicesrpc = invoicesrpc.InvoicesStub(channel)
+        return True
+
+    def _mark_first_rpc(self) -> None:
+        if self.first_rpc_seconds is None:
+            self.first_rpc_seconds = time.monotonic() - self.created_at
+
+    def startup_metrics(self) -> dict:
+        warmup = self._warmup_task
+        return {
+            "seconds_since_module_import": round(
+                time.monotonic() - MODULE_LOADED_AT, 3
+            ),
+            "init_after_import_seconds": round(self.created_at - MODULE_LOADED_AT, 3),
+            "first_rpc_seconds": self.first_rpc_seconds,
+            "warmed": bool(
+                warmup and warmup.done() and not warmup.cancelled() and warmup.result()
+            ),
+        }
+
+    def _pick_stubs(self) -> tuple:
+        if not self._stubs:
+            # RPC before warmup finished: connect synchronously like before
+            self._connect()
+        # round-robin so concurrent calls spread over the pooled connections
+        stubs = self._stubs[self._next_stub % len(self._stubs)]
+        self._next_stub += 1
+        return stubs
+
+    @property
+    def rpc(self) -> lnrpc.LightningStub:
+        return self._pick_stubs()[0]
+
+    @property
+    def routerpc(self) -> RouterStub:
+        return self._pick_stubs()[1]
+
+    @property
+    def invoicesrpc(self) -> invoicesrpc.InvoicesStub:
+        return self._pick_stubs()[2]
 
     def metadata_callback(self, _, callback):
         callback([("macaroon", self.macaroon)], None)
 
     async def cleanup(self):
-        pass
+        if self._warmup_task and not self._warmup_task.done():
+            self._warmup_task.cancel()
+        if self._track_payments_task:
+            self._track_payments_task.cancel()
+            self._track_payments_task = None
+        if self._channel_events_task:
+            self._channel_events_task.cancel()
+            self._channel_events_task = None
+        for watch in self.hold_watches.values():
+            if watch.task:
+                watch.task.cancel()
+        try:
+            # dispatched payments may still complete in LND; waiters see pending
+            pay_tasks = list(self._pay_tasks)
+            for task in pay_tasks:
+                task.cancel()
+            await asyncio.gather(*pay_tasks, return_exceptions=True)
+            for future in self.pay_futures.values():
+                if not future.done():
+                    future.set_result(PaymentResponse(ok=None))
+        finally:
+            for channel in self.channels:
+                await channel.close()
+
+    @property
+    def status_cache_age(self) -> float | None:
+        if not self._status_cache:
+            return None
+        return time.monotonic() - self._status_cache[0]
+
+    def invalidate_status(self) -> None:
+        self._status_cache = None
+        self.status_changed.set()
 
     async def status(self) -> StatusResponse:
+        """Cached ChannelBalance; concurrent callers share a single refresh."""
+        if not self._channel_events_task or self._channel_events_task.done():
+            self._channel_events_task = asyncio.create_task(
+                self._watch_channel_events()
+            )
+        age = self.status_cache_age
+        if self._status_cache and age is not None and age < STATUS_CACHE_TTL:
+            return self._status_cache[1]
+        if not self._status_refresh or self._status_refresh.done():
+            self._status_refresh = asyncio.create_task(self._refresh_status())
+        return await asyncio.shield(self._status_refresh)
+
+    async def _refresh_status(self) -> StatusResponse:
+        status = await self._fetch_status()
+        self._status_cache = (time.monotonic(), status)
+        return status
+
+    async def _watch_channel_events(self) -> None:
+        """Drop the cached balance whenever a channel opens, closes or changes."""
+        backoff = STREAM_BACKOFF_MIN
+        while True:
+            try:
+                req = ln.ChannelEventSubscription()  # type: ignore
+                async for _ in self.rpc.SubscribeChannelEvents(req):
+                    backoff = STREAM_BACKOFF_MIN
+                    self.invalidate_status()
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                logger.warning(f"SubscribeChannelEvents dropped: {exc}")
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, STREAM_BACKOFF_MAX)
+
+    async def _fetch_status(self) -> StatusResponse:
         try:
             resp = await self.rpc.ChannelBalance(ln.ChannelBalanceRequest())  # type: ignore
         except Exception as exc:
@@ -189,6 +861,7 @@ class LndWallet(Wallet):
             )
             return StatusResponse(f"Unable to connect, got: '{exc}'", 0)
 
+        self._mark_first_rpc()
         return StatusResponse(None, resp.balance * 1000)
 
     async def create_invoice(
@@ -243,19 +916,238 @@ class LndWallet(Wallet):
             preimage=preimage,
         )
 
+    async def create_invoices(
+        self, specs: list[dict], concurrency: int = 16
+    ) -> list[InvoiceResponse]:
+        """
+        Create many invoices with at most `concurrency` AddInvoice calls in flight.
+        Each spec holds create_invoice keyword arguments. Responses come back in
+        spec order and a failing item only fails its own response; the caller
+        can persist the successful ones in one go with `Database.insert_many`.
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def _create(spec: dict) -> InvoiceResponse:
+            async with semaphore:
+                try:
+                    return await self.create_invoice(**spec)
+                except Exception as exc:
+                    logger.warning(exc)
+                    return InvoiceResponse(ok=False, error_message=str(exc))
+
+        return list(await asyncio.gather(*(_create(spec) for spec in specs)))
+
     async def pay_invoice(self, bolt11: str, fee_limit_msat: int) -> PaymentResponse:
+        if not PAY_DISPATCH:
+            return await self._send_payment_bounded(bolt11, fee_limit_msat)
+        try:
+            payment_hash = bolt11_decode(bolt11).payment_hash
+        except Exception as exc:
+            return PaymentResponse(ok=False, error_message=f"invalid bolt11: {exc}")
+        future = self.pay_futures.get(payment_hash)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self.pay_futures[payment_hash] = future
+            task = asyncio.create_task(
+                self._dispatch_payment(payment_hash, bolt11, fee_limit_msat)
+            )
+            self._pay_tasks.add(task)
+            task.add_done_callback(self._pay_tasks.discard)
+        return PaymentResponse(ok=None, checking_id=payment_hash, fee_msat=0)
+
+    async def wait_payment(
+        self, payment_hash: str, timeout: float | None = None
+    ) -> PaymentResponse | None:
+        """Await a dispatched payment; None if this wallet did not dispatch it."""
+        future = self.pay_futures.get(payment_hash)
+        if future is None:
+            return None
+        return await asyncio.wait_for(asyncio.shield(future), timeout)
+
+    def pay_metrics(self) -> dict:
+        return {
+            "max_inflight": PAY_MAX_INFLIGHT,
+            "inflight": self.pay_inflight,
+            "queued": self.pay_queued,
+            "completed": self.pay_completed,
+            "awaitable": len(self.pay_futures),
+            "strategies": {s.name: s.metrics() for s in self.pay_strategies},
+            "failing_destinations": len(self.failing_destinations),
+        }
+
+    def pick_strategy(self, amount_msat: int) -> PaymentStrategy:
+        chosen = self.pay_strategies[0]
+        for strategy in self.pay_strategies:
+            if amount_msat >= strategy.min_amount_msat:
+                chosen = strategy
+        return chosen
+
+    def _recently_failed(self, key: tuple[str, int] | None) -> str | None:
+        if not key or key not in self.failing_destinations:
+            return None
+        until, reason = self.failing_destinations[key]
+        if until < time.monotonic():
+            del self.failing_destinations[key]
+            return None
+        return reason
+
+    async def estimate_fee(self, bolt11: str) -> int | None:
+        """
+        Expected routing fee in msat for paying `bolt11`, from EstimateRouteFee
+        (QueryRoutes as fallback). Quotes are cached per destination and amount
+        bucket; concurrent estimates for the same key share one RPC.
+        """
+        try:
+            decoded = bolt11_decode(bolt11)
+        except Exception as exc:
+            logger.warning(f"estimate_fee: invalid bolt11: {exc}")
+            return None
+        key = (decoded.payee, amount_bucket_sat(decoded.amount_msat or 0))
+        cached = self._cached_fee_quote(key)
+        if cached is not None:
+            return cached
+        task = self._fee_quote_tasks.get(key)
+        if not task:
+            task = asyncio.create_task(self._quote_fee(*key))
+            self._fee_quote_tasks[key] = task
+            task.add_done_callback(lambda _: self._fee_quote_tasks.pop(key, None))
+        return await asyncio.shield(task)
+
+    def _cached_fee_quote(self, key: tuple[str, int]) -> int | None:
+        quote = self.fee_quotes.get(key)
+        if not quote:
+            return None
+        if quote[0] < time.monotonic():
+            del self.fee_quotes[key]
+            return None
+        self.fee_quotes.move_to_end(key)
+        return quote[1]
+
+    def _store_fee_quote(self, key: tuple[str, int], fee_msat: int) -> None:
+        now = time.monotonic()
+        self.fee_quotes[key] = (now + FEE_QUOTE_TTL, fee_msat)
+        self.fee_quotes.move_to_end(key)
+        while self.fee_quotes:
+            expires_at, _ = next(iter(self.fee_quotes.values()))
+            if len(self.fee_quotes) <= FEE_QUOTE_MAX and expires_at >= now:
+                break
+            self.fee_quotes.popitem(last=False)
+
+    async def _quote_fee(self, destination: str, amount_sat: int) -> int | None:
+        try:
+            resp = await self.routerpc.EstimateRouteFee(
+                router.RouteFeeRequest(  # type: ignore
+                    dest=bytes.fromhex(destination), amt_sat=amount_sat
+                )
+            )
+            fee_msat = int(resp.routing_fee_msat)
+        except Exception as exc:
+            logger.debug(f"EstimateRouteFee failed, trying QueryRoutes: {exc}")
+            try:
+                resp = await self.rpc.QueryRoutes(
+                    ln.QueryRoutesRequest(  # type: ignore
+                        pub_key=destination, amt=amount_sat
+                    )
+                )
+            except Exception as exc:
+                logger.warning(f"fee estimate for {destination[:16]} failed: {exc}")
+                return None
+            if not resp.routes:
+                return None
+            fee_msat = int(resp.routes[0].total_fees_msat)
+        self._store_fee_quote((destination, amount_sat), fee_msat)
+        return fee_msat
+
+    async def _dispatch_payment(
+        self, payment_hash: str, bolt11: str, fee_limit_msat: int
+    ) -> None:
+        future = self.pay_futures[payment_hash]
+        try:
+            result = await self._send_payment_bounded(bolt11, fee_limit_msat)
+        except Exception as exc:
+            logger.warning(f"dispatched payment {payment_hash} failed: {exc}")
+            result = PaymentResponse(error_message=str(exc))
+        if not future.done():
+            future.set_result(result)
+        # keep the future around long enough for late waiters, then forget it
+        asyncio.get_running_loop().call_later(
+            300, self.pay_futures.pop, payment_hash, None
+        )
+
+    async def _send_payment_bounded(
+        self, bolt11: str, fee_limit_msat: int
+    ) -> PaymentResponse:
+        self.pay_queued += 1
+        try:
+            await self.pay_semaphore.acquire()
+        finally:
+            self.pay_queued -= 1
+        self.pay_inflight += 1
+        try:
+            return await self._send_payment(bolt11, fee_limit_msat)
+        finally:
+            self.pay_inflight -= 1
+            self.pay_completed += 1
+            self.pay_semaphore.release()
+
+    async def _send_payment(self, bolt11: str, fee_limit_msat: int) -> PaymentResponse:
+        try:
+            decoded = bolt11_decode(bolt11)
+            amount_msat, destination = decoded.amount_msat or 0, decoded.payee
+        except Exception:
+            amount_msat, destination = 0, None
+        destination_key = (
+            (destination, amount_bucket_sat(amount_msat)) if destination else None
+        )
+        reason = self._recently_failed(destination_key)
+        if reason:
+            return PaymentResponse(
+                ok=False, error_message=f"{reason} (destination recently failed)"
+            )
+        strategy = self.pick_strategy(amount_msat)
+        if destination_key:
+            quote = self._cached_fee_quote(destination_key)
+            if quote is not None:
+                # a fresh quote bounds what a sane route should cost
+                fee_limit_msat = min(
+                    fee_limit_msat, max(int(quote * FEE_QUOTE_HEADROOM), quote + 1000)
+                )
         # fee_limit_fixed = ln.FeeLimit(fixed=fee_limit_msat // 1000)
         req = router.SendPaymentRequest(  # type: ignore
             payment_request=bolt11,
             fee_limit_msat=fee_limit_msat,
-            timeout_seconds=30,
+            timeout_seconds=strategy.timeout_seconds,
             no_inflight_updates=True,
+            max_parts=strategy.max_parts,
+            max_shard_size_msat=strategy.max_shard_size_msat,
+            time_pref=strategy.time_pref,
+            outgoing_chan_ids=strategy.outgoing_chan_ids,
         )
+        started = time.monotonic()
         try:
             resp = await self.routerpc.SendPaymentV2(req).read()
         except Exception as exc:
             logger.warning(exc)
+            strategy.record(False, time.monotonic() - started)
             return PaymentResponse(error_message=str(exc))
+        if resp is grpc.aio.EOF:
+            strategy.record(None, time.monotonic() - started)
+            return PaymentResponse(ok=None)
+        self.payment_states.update(resp)
+        self.invalidate_status()
+        strategy.record(
+            {ln.Payment.SUCCEEDED: True, ln.Payment.FAILED: False}.get(resp.status),
+            time.monotonic() - started,
+        )
+        if (
+            resp.status == ln.Payment.FAILED
+            and destination_key
+            and resp.failure_reason in DOOMED_FAILURE_REASONS
+        ):
+            self.failing_destinations[destination_key] = (
+                time.monotonic() + PAY_FAILED_DEST_TTL,
+                PAYMENT_FAILURE_REASONS.get(resp.failure_reason, "Payment failed"),
+            )
 
         # PaymentStatus from https://github.com/lightningnetwork/lnd/blob/master/channeldb/payments.go#L178
         statuses = {
@@ -265,107 +1157,172 @@ class LndWallet(Wallet):
             3: False,  # FAILED
         }
 
-        failure_reasons = {
-            0: "Payment failed: No error given.",
-            1: "Payment failed: Payment timed out.",
-            2: "Payment failed: No route to destination.",
-            3: "Payment failed: Error.",
-        }
-
         if resp.status not in statuses:
             logger.error(resp)
             return PaymentResponse(ok=False, error_message="Unknown status")
-        status: PaymentStatus | None = statuses[resp.status]
+        status: bool | None = statuses[resp.status]
 
-        fees_msat = 0
         if status is False:
-            failure_reason = failure_reasons.get(
+            failure_reason = PAYMENT_FAILURE_REASONS.get(
                 resp.failure_reason, "Unknown failure reason"
             )
-            return PaymentResponse(ok=False, fee_msat=fees_msat, error_message=failure_reason)
-
-        if status is None:
             return PaymentResponse(
-                ok=None,
-                fee_msat=fees_msat,
-                status=PaymentPendingStatus(None),
+                ok=False, checking_id=resp.payment_hash, error_message=failure_reason
             )
 
-        preimage = resp.payment_preimage.hex()
-        fees_msat = resp.fee_msat
-        if resp.status == ln.Payment.SUCCEEDED:
-            return PaymentResponse(
-                ok=True,
-                fee_msat=fees_msat,
-                preimage=preimage,
-                status=PaymentSuccessStatus(None),
-            )
-        else:
-            return PaymentResponse(
-                ok=False,
-                fee_msat=fees_msat,
-                error_message=resp.failure_reason,
-                status=PaymentFailedStatus(resp.failure_reason),
-            )
+        if status is None:
+            return PaymentResponse(ok=None, checking_id=resp.payment_hash)
+
+        # lnrpc.Payment carries hash and preimage as hex strings already
+        return PaymentResponse(
+            ok=True,
+            checking_id=resp.payment_hash,
+            fee_msat=resp.fee_msat,
+            preimage=resp.payment_preimage,
+        )
 
     async def get_invoice_status(self, checking_id: str) -> PaymentStatus:
+        watch = self.hold_watches.get(checking_id)
+        if watch and watch.live and watch.state not in HOLD_FINAL_STATES:
+            # the stream reports any change, a final one has the preimage
+            return PaymentPendingStatus()
         invoice_hash = hex_to_bytes(checking_id)
         req = ln.PaymentHash(r_hash=invoice_hash)  # type: ignore
         try:
             resp = await self.rpc.LookupInvoice(req)
-            settled, preimage = resp.settled, resp.r_preimage.hex()
         except Exception as exc:
             logger.warning(exc)
             return PaymentPendingStatus(str(exc))
+        return invoice_status(resp)
 
-        if not settled:
-            return PaymentPendingStatus(None)
-        else:
-            return PaymentSuccessStatus(preimage)
+    async def get_invoice_statuses(
+        self,
+        checking_ids: list[str],
+        max_pages: int = 5,
+        page_size: int = 1000,
+        concurrency: int = 16,
+    ) -> dict[str, PaymentStatus]:
+        """
+        Batch status lookup: walk ListInvoices from the newest invoice backwards
+        for up to `max_pages` pages, then LookupInvoice whatever is left with at
+        most `concurrency` calls in flight.
+        """
+        remaining = {checking_id.lower(): checking_id for checking_id in checking_ids}
+        statuses: dict[str, PaymentStatus] = {}
+        index_offset = 0
+        for _ in range(max_pages):
+            if not remaining:
+                break
+            req = ln.ListInvoiceRequest(  # type: ignore
+                index_offset=index_offset,
+                num_max_invoices=page_size,
+                reversed=True,
+            )
+            try:
+                resp = await self.rpc.ListInvoices(req)
+            except Exception as exc:
+                logger.warning(f"ListInvoices failed, falling back to lookups: {exc}")
+                break
+            for invoice in resp.invoices:
+                checking_id = remaining.pop(bytes_to_hex(invoice.r_hash), None)
+                if checking_id:
+                    statuses[checking_id] = invoice_status(invoice)
+            # reversed pages move towards older invoices, 0 or 1 means the start
+            if len(resp.invoices) < page_size or resp.first_index_offset <= 1:
+                break
+            index_offset = resp.first_index_offset
+
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def _lookup(checking_id: str) -> None:
+            async with semaphore:
+                statuses[checking_id] = await self.get_invoice_status(checking_id)
+
+        await asyncio.gather(*(_lookup(cid) for cid in remaining.values()))
+        return statuses
 
     async def paid_invoices_stream(self) -> AsyncGenerator[str, None]:
-        req = invoices.SubscribeSingleInvoiceRequest(  # type: ignore
-            r_hash=bytes.fromhex("00")
-        )
+        """
+        Push settlements from SubscribeInvoices, resuming from the persisted
+        settle_index so settlements that happened while disconnected are replayed.
+        The checkpoint advances only after the consumer took the hash.
+        """
+        checkpoint = InvoiceCheckpoint(f"{self.endpoint}:{self.port}")
+        settle_index, add_index = await checkpoint.load()
+        backoff = STREAM_BACKOFF_MIN
         try:
-            sub = self.invoicesrpc.SubscribeSingleInvoice(req)
-        except Exception as exc:
-            logger.warning(exc)
-            return
+            while True:
+                try:
+                    req = ln.InvoiceSubscription(  # type: ignore
+                        settle_index=settle_index
+                    )
+                    async for invoice in self.rpc.SubscribeInvoices(req):
+                        backoff = STREAM_BACKOFF_MIN
+                        add_index = max(add_index, invoice.add_index)
+                        if not invoice.settled or invoice.settle_index <= settle_index:
+                            continue
+                        self.invalidate_status()
+                        yield bytes_to_hex(invoice.r_hash)
+                        settle_index = invoice.settle_index
+                        checkpoint.advance(settle_index, add_index)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as exc:
+                    logger.warning(
+                        f"SubscribeInvoices dropped at settle_index={settle_index}: "
+                        f"{exc}"
+                    )
+                else:
+                    logger.warning("SubscribeInvoices ended, reconnecting")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, STREAM_BACKOFF_MAX)
+        finally:
+            await checkpoint.close()
+
+    def _ensure_payment_tracker(self) -> None:
+        if not self._track_payments_task or self._track_payments_task.done():
+            self._track_payments_task = asyncio.create_task(self._track_payments())
 
+    async def _track_payments(self) -> None:
+        """One shared TrackPayments subscription feeding `payment_states`."""
+        backoff = STREAM_BACKOFF_MIN
         while True:
+            self.payment_states.clear_inflight()
             try:
-                invoice = await sub.read()
-                if invoice.settled:
-                    yield bytes_to_hex(invoice.r_hash)
+                req = router.TrackPaymentsRequest(  # type: ignore
+                    no_inflight_updates=True
+                )
+                async for payment in self.routerpc.TrackPayments(req):
+                    backoff = STREAM_BACKOFF_MIN
+                    self.payment_states.update(payment)
+            except asyncio.CancelledError:
+                raise
             except Exception as exc:
-                logger.warning(exc)
-                return
+                logger.warning(f"TrackPayments dropped: {exc}")
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, STREAM_BACKOFF_MAX)
 
     async def get_payment_status(self, checking_id: str) -> PaymentStatus:
-        """Uses the pending payment map to find the payment if it's still pending"""
-        payment_hash = b64_to_bytes(checking_id)
+        """Answers from the TrackPayments cache, TrackPaymentV2 for unknown hashes"""
+        self._ensure_payment_tracker()
+        payment_hash = payment_hash_hex(checking_id)
+        payment = self.payment_states.get(payment_hash)
+        if payment is not None:
+            return payment_status(payment)
         try:
-            payments: router.TrackPaymentsResponse = await self.routerpc.TrackPayments(  # type: ignore
-                router.TrackPaymentsRequest(
-                    include_incomplete=True,
+            payment = await self.routerpc.TrackPaymentV2(
+                router.TrackPaymentRequest(  # type: ignore
+                    payment_hash=bytes.fromhex(payment_hash),
                     no_inflight_updates=True,
-                    payment_hash=payment_hash,
                 )
             ).read()
         except Exception as exc:
             logger.warning(exc)
             return PaymentPendingStatus(str(exc))
-
-        for payment in payments.payments:
-            status = PaymentStatus(payment.status)
-            if status == PaymentStatus.SUCCEEDED:
-                return PaymentSuccessStatus(payment.preimage.hex())
-            elif status == PaymentStatus.FAILED:
-                reason = PaymentFailedStatus(payment.failure_reason)
-                return PaymentFailedStatus(reason.message)
-
-        return PaymentPendingStatus(None)
+        if payment is grpc.aio.EOF:
+            return PaymentPendingStatus(None)
+        self.payment_states.update(payment)
+        return payment_status(payment)
 
     async def create_hold_invoice(
         self,
@@ -375,7 +1332,7 @@ class LndWallet(Wallet):
         unhashed_description: bytes | None = None,
         **kwargs,
     ) -> InvoiceResponse:
-        preimage, payment_hash = random_secret_and_hash()
+        payment_hash = kwargs.get("payment_hash") or random_secret_and_hash()[1]
         data = {
             "description_hash": b"",
             "value": amount,
@@ -397,10 +1354,49 @@ class LndWallet(Wallet):
             logger.warning(exc)
             error_message = str(exc)
             return InvoiceResponse(ok=False, error_message=error_message)
+        self.watch_hold_invoice(payment_hash)
         return InvoiceResponse(
             ok=True, checking_id=payment_hash, payment_request=str(res.payment_request)
         )
 
+    def watch_hold_invoice(self, payment_hash: str) -> HoldInvoiceWatch:
+        watch = self.hold_watches.get(payment_hash)
+        if watch is None:
+            watch = HoldInvoiceWatch(payment_hash)
+            watch.task = asyncio.create_task(self._watch_hold_invoice(watch))
+            self.hold_watches[payment_hash] = watch
+        return watch
+
+    async def _watch_hold_invoice(self, watch: HoldInvoiceWatch) -> None:
+        backoff = STREAM_BACKOFF_MIN
+        async with self.hold_stream_slots:
+            while watch.state not in HOLD_FINAL_STATES:
+                try:
+                    req = invoices.SubscribeSingleInvoiceRequest(  # type: ignore
+                        r_hash=hex_to_bytes(watch.payment_hash)
+                    )
+                    async for invoice in self.invoicesrpc.SubscribeSingleInvoice(req):
+                        backoff = STREAM_BACKOFF_MIN
+                        state = ln.Invoice.InvoiceState.Name(invoice.state)
+                        await watch.set_state(state)
+                        watch.live = True
+                        if watch.state in HOLD_FINAL_STATES:
+                            break
+                except asyncio.CancelledError:
+                    watch.live = False
+                    raise
+                except Exception as exc:
+                    logger.warning(f"hold invoice {watch.payment_hash} stream: {exc}")
+                watch.live = False
+                if watch.state in HOLD_FINAL_STATES:
+                    break
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, STREAM_BACKOFF_MAX)
+        # keep the final state readable for a while, then forget the watch
+        asyncio.get_running_loop().call_later(
+            300, self.hold_watches.pop, watch.payment_hash, None
+        )
+
     async def settle_hold_invoice(self, preimage: str) -> InvoiceResponse:
         try:
             req = invoices.SettleInvoiceMsg(preimage=hex_to_bytes(preimage))  # type: ignore
@@ -412,6 +1408,9 @@ class LndWallet(Wallet):
         except Exception as exc:
             logger.warning(exc)
             return InvoiceResponse(ok=False, error_message=str(exc))
+        watch = self.hold_watches.get(sha256(hex_to_bytes(preimage)).hexdigest())
+        if watch:
+            await watch.set_state("SETTLED")
         return InvoiceResponse(ok=True, preimage=preimage)
 
     async def cancel_hold_invoice(self, payment_hash: str) -> InvoiceResponse:
@@ -427,4 +1426,224 @@ class LndWallet(Wallet):
                 ok=False, checking_id=payment_hash, error_message=str(exc)
             )
         # If we reach here, the invoice was successfully canceled and payment failed
+        watch = self.hold_watches.get(payment_hash)
+        if watch:
+            await watch.set_state("CANCELED")
         return InvoiceResponse(True, checking_id=payment_hash)
+
+
+class LndPoolWallet(Wallet):
+    """
+    Funding source spread over several LND nodes, configured as a JSON list in
+    LND_POOL_NODES: [{"endpoint", "port", "cert", "macaroon", "weight"}, ...].
+
+    Invoices are spread over the nodes by smooth weighted round-robin, payments
+    go to the node with the most cached outbound balance, and every checking_id
+    is remembered against the node that issued it so status calls go straight
+    there.
+    """
+
+    features = [Feature.holdinvoice]
+
+    def __init__(self):
+        raw = environ.get("LND_POOL_NODES")
+        if not raw:
+            raise ValueError("cannot initialize LndPoolWallet: missing LND_POOL_NODES")
+        try:
+            specs = json.loads(raw)
+        except ValueError as exc:
+            raise ValueError(f"cannot parse LND_POOL_NODES: {exc!s}") from exc
+        if not specs:
+            raise ValueError("cannot initialize LndPoolWallet: LND_POOL_NODES is empty")
+        self.nodes = [
+            LndWallet(
+                endpoint=spec["endpoint"],
+                port=spec.get("port"),
+                cert=spec.get("cert"),
+                macaroon=spec.get("macaroon"),
+            )
+            for spec in specs
+        ]
+        self.weights = [max(float(spec.get("weight", 1)), 0.01) for spec in specs]
+        self.load = [0] * len(self.nodes)
+        # smooth weighted round-robin state, see _pick_for_invoice
+        self._rr_current = [0.0] * len(self.nodes)
+        self.owners: OrderedDict[str, int] = OrderedDict()
+        self.max_owners = 100_000
+
+    def _remember(self, checking_id: str | None, index: int) -> None:
+        if not checking_id:
+            return
+        self.owners[checking_id] = index
+        self.owners.move_to_end(checking_id)
+        while len(self.owners) > self.max_owners:
+            self.owners.popitem(last=False)
+
+    def _pick_for_invoice(self) -> int:
+        # nginx-style smooth WRR: weights 5:1:1 give a a b a c a a, so even
+        # strictly sequential traffic is interleaved in proportion to weight
+        for i, weight in enumerate(self.weights):
+            self._rr_current[i] += weight
+        index = max(range(len(self.nodes)), key=self._rr_current.__getitem__)
+        self._rr_current[index] -= sum(self.weights)
+        return index
+
+    async def _pick_for_payment(self) -> int:
+        # status() is cached per node, so this is cheap after the first call
+        statuses = await asyncio.gather(*(node.status() for node in self.nodes))
+        healthy = [
+            i for i, status in enumerate(statuses) if status.error_message is None
+        ] or list(range(len(self.nodes)))
+        return max(healthy, key=lambda i: statuses[i].balance_msat)
+
+    async def _on(self, index: int, call):
+        self.load[index] += 1
+        try:
+            return await call(self.nodes[index])
+        finally:
+            self.load[index] -= 1
+
+    async def _owner_or_all(self, checking_id: str, call) -> PaymentStatus:
+        index = self.owners.get(checking_id)
+        if index is not None:
+            return await self._on(index, call)
+        # unknown after a restart: ask every node, prefer a final answer
+        results = await asyncio.gather(*(call(node) for node in self.nodes))
+        for index, status in enumerate(results):
+            if status.success or status.failed:
+                self._remember(checking_id, index)
+                return status
+        return results[0]
+
+    async def cleanup(self):
+        for node in self.nodes:
+            await node.cleanup()
+
+    async def warmup(self) -> bool:
+        warmed = await asyncio.gather(*(node.warmup() for node in self.nodes))
+        return any(warmed)
+
+    def startup_metrics(self) -> dict:
+        warmup = self._warmup_task
+        return {node.endpoint: node.startup_metrics() for node in self.nodes}
+
+    async def status(self) -> StatusResponse:
+        statuses = await asyncio.gather(*(node.status() for node in self.nodes))
+        errors = [s.error_message for s in statuses if s.error_message]
+        if len(errors) == len(statuses):
+            return StatusResponse("; ".join(errors), 0)
+        return StatusResponse(None, sum(s.balance_msat for s in statuses))
+
+    async def create_invoice(self, *args, **kwargs) -> InvoiceResponse:
+        index = self._pick_for_invoice()
+        response = await self._on(index, lambda n: n.create_invoice(*args, **kwargs))
+        self._remember(response.checking_id, index)
+        return response
+
+    async def pay_invoice(self, bolt11: str, fee_limit_msat: int) -> PaymentResponse:
+        index = await self._pick_for_payment()
+        try:
+            self._remember(bolt11_decode(bolt11).payment_hash, index)
+        except Exception:
+            pass
+        response = await self._on(
+            index, lambda n: n.pay_invoice(bolt11, fee_limit_msat)
+        )
+        self._remember(response.checking_id, index)
+        return response
+
+    async def get_invoice_status(self, checking_id: str) -> PaymentStatus:
+        return await self._owner_or_all(
+            checking_id, lambda n: n.get_invoice_status(checking_id)
+        )
+
+    async def get_payment_status(self, checking_id: str) -> PaymentStatus:
+        return await self._owner_or_all(
+            checking_id, lambda n: n.get_payment_status(checking_id)
+        )
+
+    async def get_invoice_statuses(
+        self, checking_ids: list[str], **kwargs
+    ) -> dict[str, PaymentStatus]:
+        """LndWallet.get_invoice_statuses, one batch per owning node."""
+        batches: dict[int | None, list[str]] = {}
+        for checking_id in checking_ids:
+            batches.setdefault(self.owners.get(checking_id), []).append(checking_id)
+        unknown = batches.pop(None, [])
+        statuses: dict[str, PaymentStatus] = {}
+        owned = await asyncio.gather(
+            *(
+                self._on(index, lambda n, i=ids: n.get_invoice_statuses(i, **kwargs))
+                for index, ids in batches.items()
+            )
+        )
+        for result in owned:
+            statuses.update(result)
+        if not unknown:
+            return statuses
+        # unknown after a restart: ask every node, prefer a final answer
+        answers = await asyncio.gather(
+            *(node.get_invoice_statuses(unknown, **kwargs) for node in self.nodes)
+        )
+        for checking_id in unknown:
+            for index, result in enumerate(answers):
+                status = result.get(checking_id)
+                if status is not None and (status.success or status.failed):
+                    self._remember(checking_id, index)
+                    statuses[checking_id] = status
+                    break
+                statuses.setdefault(checking_id, status or PaymentPendingStatus(None))
+        return statuses
+
+    async def estimate_fee(self, bolt11: str) -> int | None:
+        # quote from the node pay_invoice would pick right now
+        index = await self._pick_for_payment()
+        return await self._on(index, lambda n: n.estimate_fee(bolt11))
+
+    async def paid_invoices_stream(self) -> AsyncGenerator[str, None]:
+        queue: asyncio.Queue[str] = asyncio.Queue()
+
+        async def _forward(index: int) -> None:
+            async for checking_id in self.nodes[index].paid_invoices_stream():
+                self._remember(checking_id, index)
+                await queue.put(checking_id)
+
+        tasks = [asyncio.create_task(_forward(i)) for i in range(len(self.nodes))]
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def create_hold_invoice(self, *args, **kwargs) -> InvoiceResponse:
+        index = self._pick_for_invoice()
+        response = await self._on(
+            index, lambda n: n.create_hold_invoice(*args, **kwargs)
+        )
+        self._remember(response.checking_id, index)
+        return response
+
+    async def _owner_or_each(self, payment_hash: str, call) -> InvoiceResponse:
+        index = self.owners.get(payment_hash)
+        if index is not None:
+            return await self._on(index, call)
+        # owner forgotten (restart): only the issuing node will accept the call
+        response = InvoiceResponse(ok=False, error_message="no node knows invoice")
+        for index in range(len(self.nodes)):
+            response = await self._on(index, call)
+            if response.ok:
+                self._remember(payment_hash, index)
+                break
+        return response
+
+    async def settle_hold_invoice(self, preimage: str) -> InvoiceResponse:
+        payment_hash = sha256(hex_to_bytes(preimage)).hexdigest()
+        return await self._owner_or_each(
+            payment_hash, lambda n: n.settle_hold_invoice(preimage)
+        )
+
+    async def cancel_hold_invoice(self, payment_hash: str) -> InvoiceResponse:
+        return await self._owner_or_each(
+            payment_hash, lambda n: n.cancel_hold_invoice(payment_hash)
+        )
@@ -0,0 +1,314 @@
+"""
+End-to-end HTTP load test of the patched LNbits app: boots it in-process
+(overlay db.py, lndgrpc.py, status_public.py and sitecustomize.py hooks
+included) on SQLite or Postgres with a fake funding source, drives a weighted
+mix of API calls and reports throughput, p50/p99 per call and DB lock wait.
+
+Runs inside the LNbits image built from Dockerfile.azure:
+
+    python bench_http.py --scenario mixed --duration 30 --json baseline.json
+    python bench_http.py --scenario mixed --duration 30 --compare baseline.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# Weights of each call per named scenario.
+SCENARIOS: dict[str, dict[str, int]] = {
+    "checkout": {"create": 70, "pay": 10, "list": 10, "health": 10},
+    "wallet": {"create": 10, "pay": 10, "list": 70, "health": 10},
+    "payouts": {"create": 20, "pay": 60, "list": 10, "health": 10},
+    "mixed": {"create": 40, "pay": 20, "list": 30, "health": 10},
+}
+
+LIST_FILTERS = [
+    {"sortby": "time", "direction": "desc"},
+    {"sortby": "amount", "direction": "asc", "status": "success"},
+    {"sortby": "time", "direction": "desc", "memo[like]": "bench"},
+]
+
+
+def parse_mix(raw: str) -> dict[str, int]:
+    if raw in SCENARIOS:
+        return SCENARIOS[raw]
+    mix = {}
+    for part in raw.split(","):
+        name, _, weight = part.partition("=")
+        if name not in SCENARIOS["mixed"]:
+            raise SystemExit(f"unknown call {name!r} in mix")
+        mix[name] = int(weight or 1)
+    return mix
+
+
+def git_revision() -> str | None:
+    if os.environ.get("BENCH_REVISION"):
+        return os.environ["BENCH_REVISION"]
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def configure(args: argparse.Namespace) -> None:
+    """Environment for the app; must run before anything imports lnbits
+    (bench_lnd and fake_lnd do, so they are imported after this)."""
+    os.environ["LNBITS_DATA_FOLDER"] = args.data_folder or tempfile.mkdtemp(
+        prefix="lnbits-bench-"
+    )
+    if args.postgres:
+        os.environ["LNBITS_DATABASE_URL"] = args.postgres
+    else:
+        os.environ.pop("LNBITS_DATABASE_URL", None)
+    os.environ["LNBITS_ADMIN_UI"] = "false"
+    os.environ["LNBITS_RATE_LIMIT_NO"] = "1000000"
+    if args.funding == "fake":
+        os.environ["LNBITS_BACKEND_WALLET_CLASS"] = "FakeWallet"
+    else:
+        os.environ["LNBITS_BACKEND_WALLET_CLASS"] = "LndWallet"
+
+
+async def start_funding(args: argparse.Namespace):
+    if args.funding == "fake":
+        return None
+    from fake_lnd import FakeLndConfig, start_fake_lnd
+
+    server, _, port, cert = await start_fake_lnd(
+        0,
+        FakeLndConfig(latency_ms=args.latency_ms, settle_after=0.01),
+    )
+    os.environ.update(
+        {
+            "LND_GRPC_ENDPOINT": "127.0.0.1",
+            "LND_GRPC_PORT": str(port),
+            "LND_GRPC_CERT": cert,
+            "LND_GRPC_MACAROON": "0201036c6e64",
+        }
+    )
+    return server
+
+
+class Bench:
+    def __init__(self, client, payer, payee):
+        self.client = client
+        self.payer = payer
+        self.payee = payee
+        self.latencies: dict[str, list[float]] = {}
+        self.errors: dict[str, int] = {}
+
+    async def timed(self, name: str, request) -> dict | None:
+        start = time.perf_counter()
+        try:
+            response = await request
+            ok = response.status_code < 400
+        except Exception:
+            response, ok = None, False
+        self.latencies.setdefault(name, []).append(time.perf_counter() - start)
+        if not ok:
+            self.errors[name] = self.errors.get(name, 0) + 1
+            return None
+        return response.json()
+
+    def _invoice(self, wallet, amount: int = 10):
+        return self.client.post(
+            "/api/v1/payments",
+            json={"out": False, "amount": amount, "memo": "bench"},
+            headers={"X-Api-Key": wallet.inkey},
+        )
+
+    async def create(self) -> None:
+        await self.timed("create", self._invoice(self.payee))
+
+    async def pay(self) -> None:
+        # the invoice to pay is set-up, only the payment itself is timed
+        response = await self._invoice(self.payee, 1)
+        if response.status_code >= 400:
+            self.errors["pay"] = self.errors.get("pay", 0) + 1
+            return
+        invoice = response.json()
+        await self.timed(
+            "pay",
+            self.client.post(
+                "/api/v1/payments",
+                json={"out": True, "bolt11": invoice["bolt11"]},
+                headers={"X-Api-Key": self.payer.adminkey},
+            ),
+        )
+
+    async def list(self) -> None:
+        params = {
+            "limit": 20,
+            "offset": random.choice([0, 0, 20, 100]),
+            **random.choice(LIST_FILTERS),
+        }
+        await self.timed(
+            "list",
+            self.client.get(
+                "/api/v1/payments/paginated",
+                params=params,
+                headers={"X-Api-Key": self.payee.inkey},
+            ),
+        )
+
+    async def health(self) -> None:
+        await self.timed("health", self.client.get("/status/health"))
+
+
+async def drive(bench: Bench, mix: dict[str, int], args) -> float:
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    deadline = time.monotonic() + args.duration
+
+    async def worker():
+        while time.monotonic() < deadline:
+            await getattr(bench, random.choices(names, weights)[0])()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    return time.perf_counter() - started
+
+
+async def run(args: argparse.Namespace) -> dict:
+    configure(args)
+    funding_server = await start_funding(args)
+
+    import httpx
+    from bench_lnd import summarize
+
+    try:
+        import sitecustomize  # noqa: F401  (already loaded when /app is on the path)
+    except ImportError:
+        pass
+    from lnbits.app import create_app
+    from lnbits.core.db import db
+    from lnbits.core.services import create_user_account, update_wallet_balance
+
+    app = create_app()
+    transport = httpx.ASGITransport(app=app)
+    try:
+        async with app.router.lifespan_context(app):
+            payer = (await create_user_account()).wallets[0]
+            payee = (await create_user_account()).wallets[0]
+            await update_wallet_balance(payer, 10_000_000)
+            async with httpx.AsyncClient(
+                transport=transport, base_url="http://bench", timeout=60
+            ) as client:
+                bench = Bench(client, payer, payee)
+                # seed history so listing pages have something to page through
+                for _ in range(args.seed):
+                    await bench.pay()
+                bench.latencies.clear()
+                bench.errors.clear()
+
+                waits, wait_seconds = db.lock_waits, db.lock_wait_seconds
+                db.lock_wait_max = 0.0
+                elapsed = await drive(bench, parse_mix(args.scenario), args)
+                waits = db.lock_waits - waits
+                wait_seconds = db.lock_wait_seconds - wait_seconds
+    finally:
+        if funding_server:
+            await funding_server.stop(None)
+
+    calls = [
+        summarize(name, latencies, elapsed, bench.errors.get(name, 0))
+        for name, latencies in sorted(bench.latencies.items())
+    ]
+    total = sum(len(latencies) for latencies in bench.latencies.values())
+    return {
+        "revision": git_revision(),
+        "scenario": args.scenario,
+        "database": "postgres" if args.postgres else "sqlite",
+        "funding": args.funding,
+        "concurrency": args.concurrency,
+        "seconds": round(elapsed, 3),
+        "requests_per_sec": round(total / elapsed, 1) if elapsed else 0,
+        "calls": calls,
+        "db_lock": {
+            "waits": waits,
+            "wait_seconds": round(wait_seconds, 3),
+            "wait_mean_ms": round(wait_seconds / waits * 1000, 3) if waits else 0,
+            "wait_max_ms": round(db.lock_wait_max * 1000, 3),
+        },
+    }
+
+
+def compare(result: dict, baseline: dict) -> None:
+    before = {row["path"]: row for row in baseline["calls"]}
+    print(f"\nvs {baseline.get('revision') or 'baseline'}:")
+    for row in result["calls"]:
+        old = before.get(row["path"])
+        if not old:
+            continue
+        for key in ("ops_per_sec", "p50_ms", "p99_ms"):
+            change = (row[key] - old[key]) / old[key] * 100 if old[key] else 0
+            print(
+                f"  {row['path']:<7} {key:<11} {old[key]:>9} -> {row[key]:>9} "
+                f"({change:+.1f}%)"
+            )
+    old_wait = baseline["db_lock"]["wait_mean_ms"]
+    print(
+        f"  db lock wait mean {old_wait} -> {result['db_lock']['wait_mean_ms']} ms"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--scenario",
+        default="mixed",
+        help=f"one of {', '.join(SCENARIOS)} or a mix like create=5,list=3,health=1",
+    )
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--seed", type=int, default=200, help="payments made first")
+    parser.add_argument("--funding", choices=["fake", "lnd"], default="fake")
+    parser.add_argument("--latency-ms", type=float, default=0, help="fake LND only")
+    parser.add_argument(
+        "--postgres",
+        default=None,
+        help="postgres://... URL (TLS, as db.py requires); SQLite if unset",
+    )
+    parser.add_argument("--data-folder", default=None)
+    parser.add_argument("--json", dest="json_path", default=None)
+    parser.add_argument("--compare", default=None, help="baseline JSON to diff against")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    print(
+        f"{result['scenario']} on {result['database']}: "
+        f"{result['requests_per_sec']} req/s over {result['seconds']}s"
+    )
+    for row in result["calls"]:
+        print(
+            f"{row['path']:<7} {row['ops']:>6} ops {row['ops_per_sec']:>9} ops/s "
+            f"p50 {row['p50_ms']:>8} ms  p99 {row['p99_ms']:>8} ms  "
+            f"errors {row['errors']}"
+        )
+    lock = result["db_lock"]
+    print(
+        f"db lock: {lock['waits']} waits, mean {lock['wait_mean_ms']} ms, "
+        f"max {lock['wait_max_ms']} ms"
+    )
+    if args.compare:
+        with open(args.compare) as f:
+            compare(result, json.load(f))
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+"""
+Benchmark LndWallet against the in-process fake LND: invoices/sec and latency
+percentiles for the create, status (per-invoice and batched) and pay paths.
+
+Runs against an installed LNbits; lndgrpc.py and tracing.py are always
+loaded from the overlay directory (the parent of this one, or --overlay), so
+the numbers are for the patched wallet even outside the image:
+
+    python bench_lnd.py --invoices 2000 --concurrency 32 --latency-ms 2 \
+        --json out.json
+
+Exits non-zero when any call failed, unless --allow-errors is given (for runs
+with injected failures).
+"""
+
+import argparse
+import asyncio
+import importlib.abc
+import importlib.util
+import json
+import os
+import statistics
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+OVERLAY_MODULES = {
+    "lnbits.tracing": "tracing.py",
+    "lnbits.wallets.lndgrpc": "lndgrpc.py",
+}
+
+
+class OverlayFinder(importlib.abc.MetaPathFinder):
+    """Resolves OVERLAY_MODULES to the files in `directory`."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def find_spec(self, fullname, path, target=None):
+        if fullname not in OVERLAY_MODULES:
+            return None
+        return importlib.util.spec_from_file_location(
+            fullname, os.path.join(self.directory, OVERLAY_MODULES[fullname])
+        )
+
+
+def load_overlay(directory: str):
+    """
+    Import lndgrpc from `directory`. Must run before anything imports
+    lnbits.wallets, which imports every funding source.
+    """
+    if "lnbits.wallets" in sys.modules:
+        raise SystemExit("load_overlay must run before lnbits.wallets is imported")
+    for name in OVERLAY_MODULES.values():
+        if not os.path.isfile(os.path.join(directory, name)):
+            raise SystemExit(f"no {name} in overlay directory {directory}")
+    sys.meta_path.insert(0, OverlayFinder(directory))
+    from lnbits.wallets import lndgrpc
+
+    expected = os.path.join(directory, OVERLAY_MODULES["lnbits.wallets.lndgrpc"])
+    if os.path.realpath(lndgrpc.__file__) != os.path.realpath(expected):
+        raise SystemExit(f"loaded {lndgrpc.__file__} instead of {expected}")
+    return lndgrpc
+
+
+def summarize(name: str, latencies: list[float], elapsed: float, errors: int) -> dict:
+    ordered = sorted(latencies)
+
+    def pct(p: float) -> float:
+        if not ordered:
+            return 0.0
+        return ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1000
+
+    return {
+        "path": name,
+        "ops": len(latencies),
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "ops_per_sec": round(len(latencies) / elapsed, 1) if elapsed else 0,
+        "p50_ms": round(pct(0.50), 2),
+        "p99_ms": round(pct(0.99), 2),
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 2) if ordered else 0,
+    }
+
+
+async def run_path(name: str, calls: list, concurrency: int, ok) -> dict:
+    """Run zero-arg coroutine factories with bounded concurrency and time each."""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: list[float] = []
+    errors = 0
+
+    async def _one(call):
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                result = await call()
+                if not ok(result):
+                    errors += 1
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(_one(call) for call in calls))
+    return summarize(name, latencies, time.perf_counter() - started, errors)
+
+
+async def bench(args: argparse.Namespace) -> list[dict]:
+    lndgrpc = load_overlay(args.overlay)
+    from fake_lnd import FakeLndConfig, start_fake_lnd
+
+    config = FakeLndConfig(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        failure_rate=args.failure_rate,
+        pay_latency_ms=args.pay_latency_ms,
+    )
+    server, node, port, cert = await start_fake_lnd(0, config)
+    os.environ.update(
+        {
+            "LND_GRPC_ENDPOINT": "127.0.0.1",
+            "LND_GRPC_PORT": str(port),
+            "LND_GRPC_CERT": cert,
+            "LND_GRPC_MACAROON": "0201036c6e64",
+        }
+    )
+    from lnbits.settings import settings
+
+    settings.lnd_grpc_endpoint = "127.0.0.1"
+    settings.lnd_grpc_port = port
+    settings.lnd_grpc_cert = cert
+    settings.lnd_grpc_macaroon = "0201036c6e64"
+    wallet = lndgrpc.LndWallet()
+    results = []
+    try:
+        created: list[str] = []
+
+        def _create():
+            async def _call():
+                response = await wallet.create_invoice(1000, memo="bench")
+                if response.ok:
+                    created.append(response.checking_id)
+                return response
+
+            return _call
+
+        results.append(
+            await run_path(
+                "create",
+                [_create() for _ in range(args.invoices)],
+                args.concurrency,
+                lambda r: r.ok,
+            )
+        )
+        # settle half so status lookups see both outcomes
+        for checking_id in created[::2]:
+            node.settle(bytes.fromhex(checking_id))
+        results.append(
+            await run_path(
+                "status",
+                [
+                    (lambda cid=cid: wallet.get_invoice_status(cid))
+                    for cid in created
+                ],
+                args.concurrency,
+                lambda r: r is not None,
+            )
+        )
+        size = args.batch_size
+        batches = [created[i:i + size] for i in range(0, len(created), size)]
+        results.append(
+            await run_path(
+                "status_batch",
+                [(lambda ids=ids: wallet.get_invoice_statuses(ids)) for ids in batches],
+                args.concurrency,
+                lambda r: bool(r),
+            )
+        )
+        seconds = results[-1]["seconds"]
+        results[-1]["invoices_per_sec"] = (
+            round(len(created) / seconds, 1) if seconds else 0
+        )
+
+        async def _pay(bolt11: str):
+            response = await wallet.pay_invoice(bolt11, 10_000)
+            if response.ok is None and response.checking_id:
+                # LND_PAY_DISPATCH: time the payment, not just its dispatch
+                response = await wallet.wait_payment(response.checking_id) or response
+            return response
+
+        # invoices of "another node", signed by the fake one so they decode
+        payable = [node.external_invoice(10, "bench") for _ in range(args.payments)]
+        results.append(
+            await run_path(
+                "pay",
+                [(lambda bolt11=bolt11: _pay(bolt11)) for bolt11 in payable],
+                args.concurrency,
+                lambda r: r.ok is True,
+            )
+        )
+    finally:
+        await wallet.cleanup()
+        await server.stop(None)
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--invoices", type=int, default=1000)
+    parser.add_argument("--payments", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--batch-size", type=int, default=200)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--pay-latency-ms", type=float, default=0)
+    parser.add_argument("--failure-rate", type=float, default=0)
+    parser.add_argument("--json", dest="json_path", default=None)
+    parser.add_argument(
+        "--overlay",
+        default=os.path.dirname(HERE),
+        help="directory holding the patched lndgrpc.py and tracing.py",
+    )
+    parser.add_argument(
+        "--allow-errors",
+        action="store_true",
+        help="exit 0 even if calls failed, e.g. with --failure-rate",
+    )
+    args = parser.parse_args()
+    results = asyncio.run(bench(args))
+    for row in results:
+        print(
+            f"{row['path']:<13} {row['ops']:>6} ops {row['ops_per_sec']:>9} ops/s "
+            f"p50 {row['p50_ms']:>8} ms  p99 {row['p99_ms']:>8} ms  "
+            f"errors {row['errors']}"
+        )
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(results, f, indent=2)
+    errors = sum(row["errors"] for row in results)
+    if errors and not args.allow_errors:
+        raise SystemExit(f"{errors} calls failed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,430 @@
+"""
+In-process fake LND speaking the Lightning, Router and Invoices gRPC services
+that `lndgrpc.py` uses, for load testing LndWallet without a real node.
+
+Runs inside the LNbits image (it needs the generated lnd_grpc_files modules):
+
+    python fake_lnd.py --port 10009 --latency-ms 5 --settle-after 1
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import subprocess
+import tempfile
+import time
+from hashlib import sha256
+
+import grpc
+from bolt11 import Bolt11, MilliSatoshi, TagChar, Tags
+from bolt11 import decode as bolt11_decode
+from bolt11 import encode as bolt11_encode
+
+import lnbits.wallets.lnd_grpc_files.invoices_pb2 as invoices
+import lnbits.wallets.lnd_grpc_files.invoices_pb2_grpc as invoicesrpc
+import lnbits.wallets.lnd_grpc_files.lightning_pb2 as ln
+import lnbits.wallets.lnd_grpc_files.lightning_pb2_grpc as lnrpc
+import lnbits.wallets.lnd_grpc_files.router_pb2 as router
+import lnbits.wallets.lnd_grpc_files.router_pb2_grpc as routerrpc
+
+
+class FakeLndConfig:
+    def __init__(
+        self,
+        latency_ms: float = 0,
+        jitter_ms: float = 0,
+        failure_rate: float = 0,
+        pay_failure_rate: float = 0,
+        pay_latency_ms: float = 0,
+        settle_after: float | None = None,
+        accept_after: float | None = None,
+        balance_sat: int = 1_000_000,
+    ):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        # share of calls aborted with UNAVAILABLE
+        self.failure_rate = failure_rate
+        # share of payments that end FAILED with NO_ROUTE
+        self.pay_failure_rate = pay_failure_rate
+        self.pay_latency_ms = pay_latency_ms
+        # auto-settle regular invoices / auto-accept hold invoices after N seconds
+        self.settle_after = settle_after
+        self.accept_after = accept_after
+        self.balance_sat = balance_sat
+
+
+class FakeLnd:
+    """Shared node state plus the settlement scripting hooks."""
+
+    def __init__(self, config: FakeLndConfig | None = None):
+        self.config = config or FakeLndConfig()
+        self.invoices: dict[bytes, ln.Invoice] = {}
+        self.payments: dict[str, ln.Payment] = {}
+        self.add_index = 0
+        self.settle_index = 0
+        self.invoice_subscribers: set[asyncio.Queue] = set()
+        self.single_subscribers: dict[bytes, set[asyncio.Queue]] = {}
+        self.payment_subscribers: set[asyncio.Queue] = set()
+        self._timers: set[asyncio.TimerHandle] = set()
+        # invoices are real bolt11s signed with this key, so LNbits and
+        # LndWallet decode them as they would a real node's
+        self.privkey = os.urandom(32).hex()
+        # preimages SendPaymentV2 reveals, by payment hash
+        self.preimages: dict[str, str] = {}
+
+    async def delay(self, context: grpc.aio.ServicerContext, extra_ms: float = 0):
+        latency = self.config.latency_ms + extra_ms
+        if self.config.jitter_ms:
+            latency += random.uniform(0, self.config.jitter_ms)
+        if latency:
+            await asyncio.sleep(latency / 1000)
+        if self.config.failure_rate and random.random() < self.config.failure_rate:
+            await context.abort(grpc.StatusCode.UNAVAILABLE, "injected failure")
+
+    def add_invoice(self, invoice: ln.Invoice, hold: bool = False) -> ln.Invoice:
+        self.add_index += 1
+        invoice.add_index = self.add_index
+        invoice.creation_date = int(time.time())
+        invoice.state = ln.Invoice.OPEN
+        invoice.payment_request = self.sign(invoice)
+        if invoice.r_preimage:
+            self.preimages[invoice.r_hash.hex()] = invoice.r_preimage.hex()
+        self.invoices[invoice.r_hash] = invoice
+        self._publish_invoice(invoice)
+        after = self.config.accept_after if hold else self.config.settle_after
+        if after is not None:
+            action = self.accept if hold else self.settle
+            handle = asyncio.get_running_loop().call_later(
+                after, action, invoice.r_hash
+            )
+            self._timers.add(handle)
+        return invoice
+
+    def sign(self, invoice: ln.Invoice) -> str:
+        """bolt11 payment request for `invoice`, signed with the node key."""
+        tags = Tags()
+        if invoice.description_hash:
+            tags.add(TagChar.description_hash, invoice.description_hash.hex())
+        else:
+            tags.add(TagChar.description, invoice.memo)
+        if invoice.expiry:
+            tags.add(TagChar.expire_time, invoice.expiry)
+        tags.add(TagChar.payment_hash, invoice.r_hash.hex())
+        tags.add(TagChar.payment_secret, os.urandom(32).hex())
+        amount_msat = invoice.value_msat or invoice.value * 1000
+        return bolt11_encode(
+            Bolt11(
+                currency="bc",
+                amount_msat=MilliSatoshi(amount_msat) if amount_msat else None,
+                date=invoice.creation_date or int(time.time()),
+                tags=tags,
+            ),
+            self.privkey,
+        )
+
+    def external_invoice(self, amount_sat: int, memo: str = "") -> str:
+        """
+        A payable bolt11 that is not one of this node's invoices, standing in
+        for an invoice of another node; paying it succeeds with its preimage.
+        """
+        preimage = os.urandom(32)
+        invoice = ln.Invoice(
+            memo=memo, value=amount_sat, r_hash=sha256(preimage).digest()
+        )
+        self.preimages[invoice.r_hash.hex()] = preimage.hex()
+        return self.sign(invoice)
+
+    def settle(self, r_hash: bytes, preimage: bytes | None = None) -> bool:
+        invoice = self.invoices.get(r_hash)
+        if not invoice or invoice.state in (ln.Invoice.SETTLED, ln.Invoice.CANCELED):
+            return False
+        self.settle_index += 1
+        invoice.state = ln.Invoice.SETTLED
+        invoice.settled = True
+        invoice.settle_index = self.settle_index
+        invoice.settle_date = int(time.time())
+        invoice.amt_paid_sat = invoice.value
+        invoice.amt_paid_msat = invoice.value * 1000
+        if preimage:
+            invoice.r_preimage = preimage
+        self.config.balance_sat += invoice.value
+        self._publish_invoice(invoice)
+        return True
+
+    def accept(self, r_hash: bytes) -> bool:
+        invoice = self.invoices.get(r_hash)
+        if not invoice or invoice.state != ln.Invoice.OPEN:
+            return False
+        invoice.state = ln.Invoice.ACCEPTED
+        self._publish_invoice(invoice)
+        return True
+
+    def cancel(self, r_hash: bytes) -> bool:
+        invoice = self.invoices.get(r_hash)
+        if not invoice or invoice.state == ln.Invoice.SETTLED:
+            return False
+        invoice.state = ln.Invoice.CANCELED
+        self._publish_invoice(invoice)
+        return True
+
+    def _publish_invoice(self, invoice: ln.Invoice) -> None:
+        for queue in self.invoice_subscribers:
+            queue.put_nowait(invoice)
+        for queue in self.single_subscribers.get(invoice.r_hash, ()):
+            queue.put_nowait(invoice)
+
+    def publish_payment(self, payment: ln.Payment) -> None:
+        self.payments[payment.payment_hash] = payment
+        for queue in self.payment_subscribers:
+            queue.put_nowait(payment)
+
+
+class LightningServicer(lnrpc.LightningServicer):
+    def __init__(self, node: FakeLnd):
+        self.node = node
+
+    async def GetInfo(self, request, context):
+        await self.node.delay(context)
+        return ln.GetInfoResponse(alias="fake-lnd", synced_to_chain=True)
+
+    async def ChannelBalance(self, request, context):
+        await self.node.delay(context)
+        return ln.ChannelBalanceResponse(balance=self.node.config.balance_sat)
+
+    async def AddInvoice(self, request, context):
+        await self.node.delay(context)
+        invoice = ln.Invoice()
+        invoice.CopyFrom(request)
+        if not invoice.r_preimage:
+            invoice.r_preimage = os.urandom(32)
+        invoice.r_hash = sha256(invoice.r_preimage).digest()
+        invoice = self.node.add_invoice(invoice)
+        return ln.AddInvoiceResponse(
+            r_hash=invoice.r_hash,
+            payment_request=invoice.payment_request,
+            add_index=invoice.add_index,
+        )
+
+    async def LookupInvoice(self, request, context):
+        await self.node.delay(context)
+        invoice = self.node.invoices.get(request.r_hash)
+        if not invoice:
+            await context.abort(grpc.StatusCode.NOT_FOUND, "unable to locate invoice")
+        return invoice
+
+    async def ListInvoices(self, request, context):
+        await self.node.delay(context)
+        ordered = sorted(self.node.invoices.values(), key=lambda i: i.add_index)
+        if request.pending_only:
+            pending = (ln.Invoice.OPEN, ln.Invoice.ACCEPTED)
+            ordered = [i for i in ordered if i.state in pending]
+        limit = request.num_max_invoices or 100
+        if request.reversed:
+            offset = request.index_offset or self.node.add_index + 1
+            page = [i for i in ordered if i.add_index < offset][-limit:]
+        else:
+            page = [i for i in ordered if i.add_index > request.index_offset][:limit]
+        return ln.ListInvoiceResponse(
+            invoices=page,
+            first_index_offset=page[0].add_index if page else 0,
+            last_index_offset=page[-1].add_index if page else 0,
+        )
+
+    async def SubscribeInvoices(self, request, context):
+        queue: asyncio.Queue = asyncio.Queue()
+        self.node.invoice_subscribers.add(queue)
+        try:
+            backlog = sorted(self.node.invoices.values(), key=lambda i: i.add_index)
+            for invoice in backlog:
+                if request.add_index and invoice.add_index > request.add_index:
+                    yield invoice
+                elif (
+                    request.settle_index
+                    and invoice.settle_index > request.settle_index
+                ):
+                    yield invoice
+            while True:
+                yield await queue.get()
+        finally:
+            self.node.invoice_subscribers.discard(queue)
+
+    async def SubscribeChannelEvents(self, request, context):
+        # no channel activity on the fake node, keep the stream open
+        await asyncio.Event().wait()
+        yield ln.ChannelEventUpdate()
+
+
+class RouterServicer(routerrpc.RouterServicer):
+    def __init__(self, node: FakeLnd):
+        self.node = node
+
+    async def SendPaymentV2(self, request, context):
+        await self.node.delay(context, self.node.config.pay_latency_ms)
+        try:
+            payment_hash = bolt11_decode(request.payment_request).payment_hash
+        except Exception:
+            await context.abort(
+                grpc.StatusCode.INVALID_ARGUMENT, "invalid payment request"
+            )
+        payment = ln.Payment(
+            payment_hash=payment_hash,
+            payment_request=request.payment_request,
+            creation_date=int(time.time()),
+        )
+        failed = random.random() < self.node.config.pay_failure_rate
+        if failed:
+            payment.status = ln.Payment.FAILED
+            payment.failure_reason = ln.FAILURE_REASON_NO_ROUTE
+        else:
+            payment.status = ln.Payment.SUCCEEDED
+            payment.payment_preimage = (
+                self.node.preimages.get(payment_hash) or os.urandom(32).hex()
+            )
+            payment.fee_msat = 1000
+        self.node.publish_payment(payment)
+        yield payment
+
+    async def EstimateRouteFee(self, request, context):
+        await self.node.delay(context)
+        # flat 1 sat base plus 1000 ppm
+        return router.RouteFeeResponse(
+            routing_fee_msat=1000 + request.amt_sat, time_lock_delay=144
+        )
+
+    async def TrackPaymentV2(self, request, context):
+        await self.node.delay(context)
+        payment = self.node.payments.get(request.payment_hash.hex())
+        if not payment:
+            await context.abort(grpc.StatusCode.NOT_FOUND, "payment isn't initiated")
+        yield payment
+
+    async def TrackPayments(self, request, context):
+        queue: asyncio.Queue = asyncio.Queue()
+        self.node.payment_subscribers.add(queue)
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            self.node.payment_subscribers.discard(queue)
+
+
+class InvoicesServicer(invoicesrpc.InvoicesServicer):
+    def __init__(self, node: FakeLnd):
+        self.node = node
+
+    async def SubscribeSingleInvoice(self, request, context):
+        if len(request.r_hash) != 32:
+            await context.abort(
+                grpc.StatusCode.UNKNOWN,
+                f"invalid hash length of {len(request.r_hash)}, want 32",
+            )
+        queue: asyncio.Queue = asyncio.Queue()
+        self.node.single_subscribers.setdefault(request.r_hash, set()).add(queue)
+        try:
+            if request.r_hash in self.node.invoices:
+                yield self.node.invoices[request.r_hash]
+            while True:
+                yield await queue.get()
+        finally:
+            self.node.single_subscribers[request.r_hash].discard(queue)
+
+    async def AddHoldInvoice(self, request, context):
+        await self.node.delay(context)
+        invoice = ln.Invoice(
+            memo=request.memo,
+            value=request.value,
+            expiry=request.expiry,
+            description_hash=request.description_hash,
+            private=request.private,
+            r_hash=request.hash,
+        )
+        invoice = self.node.add_invoice(invoice, hold=True)
+        return invoices.AddHoldInvoiceResp(
+            payment_request=invoice.payment_request, add_index=invoice.add_index
+        )
+
+    async def SettleInvoice(self, request, context):
+        await self.node.delay(context)
+        r_hash = sha256(request.preimage).digest()
+        invoice = self.node.invoices.get(r_hash)
+        if not invoice or invoice.state != ln.Invoice.ACCEPTED:
+            await context.abort(grpc.StatusCode.UNKNOWN, "invoice still open")
+        self.node.settle(r_hash, request.preimage)
+        return invoices.SettleInvoiceResp()
+
+    async def CancelInvoice(self, request, context):
+        await self.node.delay(context)
+        if not self.node.cancel(request.payment_hash):
+            await context.abort(grpc.StatusCode.UNKNOWN, "invoice already settled")
+        return invoices.CancelInvoiceResp()
+
+
+def self_signed_cert(directory: str) -> tuple[str, str]:
+    """Write a localhost cert/key pair with openssl, return their paths."""
+    cert = os.path.join(directory, "fake-lnd.cert")
+    key = os.path.join(directory, "fake-lnd.key")
+    subprocess.run(
+        [
+            "openssl", "req", "-x509", "-newkey", "ec",
+            "-pkeyopt", "ec_paramgen_curve:prime256v1",
+            "-nodes", "-days", "1", "-subj", "/CN=localhost",
+            "-addext", "subjectAltName=DNS:localhost,IP:127.0.0.1",
+            "-keyout", key, "-out", cert,
+        ],
+        check=True,
+        capture_output=True,
+    )
+    return cert, key
+
+
+async def start_fake_lnd(
+    port: int = 0,
+    config: FakeLndConfig | None = None,
+    cert_dir: str | None = None,
+) -> tuple[grpc.aio.Server, FakeLnd, int, str]:
+    """Start the server; returns (server, node, bound port, cert path)."""
+    node = FakeLnd(config)
+    cert_path, key_path = self_signed_cert(cert_dir or tempfile.mkdtemp())
+    with open(cert_path, "rb") as f:
+        cert = f.read()
+    with open(key_path, "rb") as f:
+        key = f.read()
+    server = grpc.aio.server()
+    lnrpc.add_LightningServicer_to_server(LightningServicer(node), server)
+    routerrpc.add_RouterServicer_to_server(RouterServicer(node), server)
+    invoicesrpc.add_InvoicesServicer_to_server(InvoicesServicer(node), server)
+    credentials = grpc.ssl_server_credentials([(key, cert)])
+    bound = server.add_secure_port(f"127.0.0.1:{port}", credentials)
+    await server.start()
+    return server, node, bound, cert_path
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--port", type=int, default=10009)
+    parser.add_argument("--cert-dir", default=None)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--failure-rate", type=float, default=0)
+    parser.add_argument("--pay-failure-rate", type=float, default=0)
+    parser.add_argument("--pay-latency-ms", type=float, default=0)
+    parser.add_argument("--settle-after", type=float, default=None)
+    parser.add_argument("--accept-after", type=float, default=None)
+    args = parser.parse_args()
+    config = FakeLndConfig(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        failure_rate=args.failure_rate,
+        pay_failure_rate=args.pay_failure_rate,
+        pay_latency_ms=args.pay_latency_ms,
+        settle_after=args.settle_after,
+        accept_after=args.accept_after,
+    )
+    server, _, port, cert = await start_fake_lnd(args.port, config, args.cert_dir)
+    print(f"fake lnd listening on 127.0.0.1:{port} cert={cert}", flush=True)
+    await server.wait_for_termination()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
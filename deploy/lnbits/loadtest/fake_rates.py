@@ -0,0 +1,125 @@
+"""
+Stub exchange-rate HTTP server for exercising `rate_cache.py` without
+reaching real price APIs. Each provider name gets a path with its own price,
+latency and failure behaviour:
+
+    GET /<name>/<to>  ->  {"price": {"<TO>": 65000.0}}
+
+Run the built-in scenario (one fast, one slow, one failing, one outlier):
+
+    python fake_rates.py --port 8765
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+
+class FakeRateProvider:
+    def __init__(
+        self,
+        name: str,
+        price: float,
+        latency_ms: float = 0,
+        status: int = 200,
+    ):
+        self.name = name
+        self.price = price
+        self.latency_ms = latency_ms
+        self.status = status
+        self.requests = 0
+
+
+class FakeRateProviderConfig:
+    """Duck-types lnbits.settings.ExchangeRateProvider for RateCache."""
+
+    def __init__(self, name: str, base_url: str):
+        self.name = name
+        self.api_url = f"{base_url}/{name}/{{to}}"
+        self.path = "$.price.{TO}"
+        self.exclude_to: list[str] = []
+        self.ticker_conversion: list[str] = []
+
+
+class FakeRates:
+    def __init__(self, providers: list[FakeRateProvider]):
+        self.providers = {provider.name: provider for provider in providers}
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = await reader.readline()
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+            _, target, _ = request_line.decode().split(" ", 2)
+            _, name, to = target.split("/", 2)
+            provider = self.providers.get(name)
+            if provider is None:
+                status, body = 404, b"{}"
+            else:
+                provider.requests += 1
+                await asyncio.sleep(provider.latency_ms / 1000)
+                status = provider.status
+                body = json.dumps({"price": {to.upper(): provider.price}}).encode()
+            writer.write(
+                f"HTTP/1.1 {status} X\r\nContent-Type: application/json\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode()
+                + body
+            )
+            await writer.drain()
+        except (ConnectionError, ValueError):
+            pass
+        except asyncio.CancelledError:
+            # slow responses still sleeping when the scenario shuts down
+            pass
+        finally:
+            writer.close()
+
+
+async def start_fake_rates(
+    providers: list[FakeRateProvider], port: int = 0
+) -> tuple[asyncio.Server, FakeRates, int]:
+    fake = FakeRates(providers)
+    server = await asyncio.start_server(fake.handle, "127.0.0.1", port)
+    return server, fake, server.sockets[0].getsockname()[1]
+
+
+async def run(args) -> None:
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from rate_cache import RateCache
+
+    providers = [
+        FakeRateProvider("fast", 65000, latency_ms=20),
+        FakeRateProvider("slow", 65100, latency_ms=2000),
+        FakeRateProvider("broken", 0, status=500),
+        FakeRateProvider("outlier", 90000, latency_ms=60),
+        FakeRateProvider("steady", 64900, latency_ms=120),
+    ]
+    server, fake, port = await start_fake_rates(providers, args.port)
+    base_url = f"http://127.0.0.1:{port}"
+    configs = [FakeRateProviderConfig(name, base_url) for name in fake.providers]
+    cache = RateCache(lambda: configs, ttl=args.ttl, hedge_delay=0.05, timeout=1)
+    try:
+        for label in ("cold", "warm", "stale"):
+            if label == "stale":
+                await asyncio.sleep(args.ttl)
+            started = time.perf_counter()
+            price = await cache.price("usd")
+            print(
+                f"{label:>5}: {price} in {(time.perf_counter() - started) * 1000:.1f}ms"
+            )
+            await asyncio.sleep(1.2)
+        print(json.dumps(cache.snapshot(), indent=2))
+        print({name: provider.requests for name, provider in fake.providers.items()})
+    finally:
+        await cache.close()
+        server.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--ttl", type=float, default=2)
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,76 @@
+"""
+Migrations for the tables this deployment adds on top of LNbits core.
+
+They are tracked in `dbversions` under their own name ("overlay") rather than
+as extra core versions, so upstream core migrations keep their numbering.
+sitecustomize runs `migrate()` right after LNbits' own `migrate_databases`.
+"""
+
+import sys
+
+from lnbits.db import Connection
+
+OVERLAY_DB_NAME = "overlay"
+
+
+async def m001_lnd_invoice_checkpoints(db: Connection):
+    """
+    Last SubscribeInvoices settle/add index per LND node, so settlements that
+    happened while disconnected are replayed. IF NOT EXISTS adopts the table
+    earlier builds created on first use.
+    """
+    await db.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS lnd_invoice_checkpoints (
+            node TEXT PRIMARY KEY,
+            settle_index {db.big_int} NOT NULL DEFAULT 0,
+            add_index {db.big_int} NOT NULL DEFAULT 0
+        )
+        """
+    )
+
+
+async def m002_partition_archive_state(db: Connection):
+    """
+    Postgres partitions PartitionManager has detached but not yet dropped, so an
+    interrupted archive run resumes instead of leaving orphaned tables.
+    """
+    await db.execute(
+        """
+        CREATE TABLE IF NOT EXISTS partition_archive_state (
+            partition_name TEXT PRIMARY KEY,
+            source TEXT NOT NULL,
+            month TEXT NOT NULL
+        )
+        """
+    )
+
+
+async def m003_apipayments_rollup(db: Connection):
+    """Buckets and watermark for LNBITS_DB_ROLLUPS payment history."""
+    from lnbits.db import TimeBucketRollup
+
+    await TimeBucketRollup("apipayments").migrate(db)
+
+
+async def m004_apipayments_time_index(db: Connection):
+    """Rollup compaction walks apipayments by time, one chunk per transaction."""
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS apipayments_time ON apipayments (time)"
+    )
+
+
+async def migrate() -> None:
+    from lnbits.core.crud import get_db_versions
+    from lnbits.core.db import db
+    from lnbits.core.helpers import run_migration
+    from lnbits.core.models import DbVersion
+
+    async with db.connect() as conn:
+        current_version = next(
+            (v for v in await get_db_versions(conn) if v.db == OVERLAY_DB_NAME),
+            DbVersion(db=OVERLAY_DB_NAME, version=0),
+        )
+        await run_migration(
+            conn, sys.modules[__name__], OVERLAY_DB_NAME, current_version
+        )
@@ -0,0 +1,282 @@
+"""
+Background-refreshed BTC/fiat rate cache that replaces the sequential,
+on-demand provider lookups of `lnbits.utils.exchange_rates.btc_price`.
+
+Each currency keeps its last median price. Within RATE_TTL it is served as-is;
+up to RATE_STALE_TTL it is still served while one refresh runs in the
+background. A refresh starts the providers staggered by RATE_HEDGE_DELAY,
+answers a waiting cold request with the first good price and stores the median
+of up to RATE_QUORUM prices once they are in.
+"""
+
+import asyncio
+import statistics
+import time
+from collections.abc import Callable
+from os import environ
+from typing import Any
+
+import httpx
+from loguru import logger
+
+RATE_TTL = float(environ.get("LNBITS_RATE_TTL", "60"))
+RATE_STALE_TTL = float(environ.get("LNBITS_RATE_STALE_TTL", "900"))
+RATE_HEDGE_DELAY = float(environ.get("LNBITS_RATE_HEDGE_DELAY", "0.25"))
+RATE_TIMEOUT = float(environ.get("LNBITS_RATE_TIMEOUT", "3"))
+RATE_QUORUM = int(environ.get("LNBITS_RATE_QUORUM", "3"))
+
+
+def _resolve_path(data: Any, path: str) -> Any:
+    """Resolve the `$.a.b[0]` style paths used by ExchangeRateProvider.path."""
+    for part in path.lstrip("$").replace("[", ".").replace("]", "").split("."):
+        if not part:
+            continue
+        data = data[int(part)] if isinstance(data, list) else data[part]
+    return data
+
+
+def _replacements(ticker: str) -> dict[str, str]:
+    return {
+        "FROM": "BTC",
+        "from": "btc",
+        "TO": ticker.upper(),
+        "to": ticker.lower(),
+    }
+
+
+def _ticker(provider, currency: str) -> str:
+    for conversion in getattr(provider, "ticker_conversion", None) or []:
+        source, _, target = conversion.partition(":")
+        if source.upper() == currency.upper() and target:
+            return target
+    return currency
+
+
+class RateEntry:
+    def __init__(self, price: float, sources: dict[str, float]):
+        self.price = price
+        self.sources = sources
+        self.fetched_at = time.monotonic()
+
+    @property
+    def age(self) -> float:
+        return time.monotonic() - self.fetched_at
+
+
+class RateCache:
+    def __init__(
+        self,
+        providers: Callable[[], list],
+        ttl: float = RATE_TTL,
+        stale_ttl: float = RATE_STALE_TTL,
+        hedge_delay: float = RATE_HEDGE_DELAY,
+        timeout: float = RATE_TIMEOUT,
+        quorum: int = RATE_QUORUM,
+        user_agent: str | None = None,
+    ):
+        # called on every refresh so admin UI changes to the list apply
+        self.providers = providers
+        self.ttl = ttl
+        self.stale_ttl = max(stale_ttl, ttl)
+        self.hedge_delay = hedge_delay
+        self.timeout = timeout
+        self.quorum = max(quorum, 1)
+        self.user_agent = user_agent
+        self.entries: dict[str, RateEntry] = {}
+        self._refreshes: dict[str, tuple[asyncio.Task, asyncio.Future]] = {}
+        self._client: httpx.AsyncClient | None = None
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.provider_failures: dict[str, int] = {}
+
+    async def price(self, currency: str) -> float | None:
+        """BTC price in `currency`, or None when no provider answered."""
+        currency = currency.upper()
+        entry = self.entries.get(currency)
+        if entry and entry.age < self.ttl:
+            self.hits += 1
+            if entry.age > self.ttl * 0.8:
+                # refresh ahead so hot currencies rarely turn stale
+                self.revalidate(currency)
+            return entry.price
+        if entry and entry.age < self.stale_ttl:
+            self.stale_hits += 1
+            self.revalidate(currency)
+            return entry.price
+
+        self.misses += 1
+        first = self.revalidate(currency)
+        price = await asyncio.shield(first)
+        if price is None and entry:
+            logger.warning(
+                f"rate_cache: no provider answered for {currency}, serving "
+                f"{entry.age:.0f}s old price"
+            )
+            return entry.price
+        return price
+
+    def revalidate(self, currency: str) -> asyncio.Future:
+        """Single-flight refresh; the future holds the first good price."""
+        running = self._refreshes.get(currency)
+        if running and not running[0].done():
+            return running[1]
+        first = asyncio.get_running_loop().create_future()
+        # background revalidations never await the future; mark it retrieved
+        first.add_done_callback(lambda f: f.cancelled() or f.exception())
+        task = asyncio.create_task(self._refresh(currency, first))
+        task.add_done_callback(lambda t: self._release(t, first))
+        self._refreshes[currency] = (task, first)
+        return first
+
+    @staticmethod
+    def _release(task: asyncio.Task, first: asyncio.Future) -> None:
+        # a refresh cancelled by close() (possibly before it started) or one
+        # that crashed must not leave cold callers waiting on `first` forever
+        if first.done():
+            return
+        if task.cancelled():
+            first.set_exception(RuntimeError("rate refresh cancelled"))
+        else:
+            first.set_exception(
+                task.exception() or RuntimeError("rate refresh ended without a price")
+            )
+
+    async def _refresh(self, currency: str, first: asyncio.Future) -> None:
+        self.refreshes += 1
+        providers = [
+            provider
+            for provider in self.providers()
+            if currency.lower() not in (provider.exclude_to or [])
+        ]
+        sources: dict[str, float] = {}
+        tasks = [
+            asyncio.create_task(self._hedged(index, provider, currency))
+            for index, provider in enumerate(providers)
+        ]
+        try:
+            for next_done in asyncio.as_completed(tasks, timeout=self.timeout):
+                result = await next_done
+                if result is None:
+                    continue
+                name, price = result
+                sources[name] = price
+                if not first.done():
+                    first.set_result(price)
+                if len(sources) >= self.quorum:
+                    break
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        if sources:
+            self.entries[currency] = RateEntry(
+                statistics.median(sources.values()), sources
+            )
+        if not first.done():
+            first.set_result(self.entries[currency].price if sources else None)
+
+    async def _hedged(self, index: int, provider, currency: str):
+        # provider N starts N * hedge_delay after the refresh, whether or not
+        # earlier ones have answered; the refresh cancels it once it has
+        # RATE_QUORUM prices or hits the timeout
+        if index:
+            await asyncio.sleep(index * self.hedge_delay)
+        return await self._fetch(provider, currency)
+
+    async def _fetch(self, provider, currency: str) -> tuple[str, float] | None:
+        ticker = _ticker(provider, currency)
+        url = provider.api_url.format(**_replacements(ticker))
+        try:
+            response = await self.client.get(url, timeout=self.timeout)
+            response.raise_for_status()
+            if not provider.path:
+                price = float(response.text.replace(",", ""))
+            else:
+                path = provider.path.format(**_replacements(ticker))
+                price = float(_resolve_path(response.json(), path))
+            if price <= 0:
+                raise ValueError(f"non-positive price {price}")
+            return provider.name, price
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            self.provider_failures[provider.name] = (
+                self.provider_failures.get(provider.name, 0) + 1
+            )
+            logger.debug(f"rate_cache: {provider.name} {currency} failed: {exc!r}")
+            return None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            headers = {"User-Agent": self.user_agent} if self.user_agent else None
+            self._client = httpx.AsyncClient(headers=headers)
+        return self._client
+
+    async def close(self) -> None:
+        for task, _ in self._refreshes.values():
+            task.cancel()
+        if self._client:
+            await self._client.aclose()
+
+    def snapshot(self) -> dict:
+        return {
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "refreshes": self.refreshes,
+            "provider_failures": dict(self.provider_failures),
+            "rates": {
+                currency: {
+                    "price": entry.price,
+                    "age": round(entry.age, 1),
+                    "sources": entry.sources,
+                }
+                for currency, entry in self.entries.items()
+            },
+        }
+
+
+def _settings_providers() -> list:
+    from lnbits.settings import settings
+
+    return settings.lnbits_exchange_rate_providers
+
+
+def _user_agent() -> str | None:
+    try:
+        from lnbits.settings import settings
+
+        return getattr(settings, "user_agent", None)
+    except Exception:
+        return None
+
+
+rate_cache = RateCache(_settings_providers, user_agent=_user_agent())
+_fallback_btc_price: Callable | None = None
+_allowed_currencies: Callable[[], list[str]] | None = None
+
+
+async def btc_price(currency: str) -> float:
+    """Drop-in for lnbits.utils.exchange_rates.btc_price."""
+    # same check as upstream btc_rates, and it keeps arbitrary strings out of
+    # the cache
+    if _allowed_currencies and currency.upper() not in _allowed_currencies():
+        raise ValueError(f"Currency '{currency}' not allowed.")
+    price = await rate_cache.price(currency)
+    if price is None and _fallback_btc_price:
+        return await _fallback_btc_price(currency)
+    if price is None:
+        raise ValueError(f"no exchange rate available for {currency}")
+    return price
+
+
+def install(exchange_rates_module) -> None:
+    global _fallback_btc_price, _allowed_currencies
+    _fallback_btc_price = exchange_rates_module.btc_price
+    _allowed_currencies = exchange_rates_module.allowed_currencies
+    exchange_rates_module.btc_price = btc_price
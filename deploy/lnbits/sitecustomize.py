@@ -1,35 +1,381 @@
+import importlib.abc
+import importlib.util
 import os
+import sys
+import time
 
-from lnbits.settings import settings, ExchangeRateProvider
+# Every Python process in the container loads this file, including the small
+# `python -` helpers in entrypoint.sh. Patches are therefore registered against
+# the module they touch and applied by an import hook the first time that
+# module is imported, instead of importing lnbits/FastAPI/SQLAlchemy up front.
+_SITE_STARTED = time.perf_counter()
+
+# Set SITECUSTOMIZE_IMPORTTIME=1 to print per-patch cost to stderr, in the
+# same "self | cumulative | name" layout as `python -X importtime`.
+REPORT_IMPORTTIME = os.getenv("SITECUSTOMIZE_IMPORTTIME", "").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+
+# Hard cap on the background funding source warmup started by the lifespan.
+WARMUP_MAX_SECONDS = float(os.getenv("LNBITS_WARMUP_MAX_SECONDS", "30"))
+
+_PATCHES: dict[str, list] = {}
+# (module, import_us, patch_us) in the order the hooks fired
+PATCH_TIMINGS: list[tuple[str, int, int]] = []
+
+
+def _report(line: str) -> None:
+    if REPORT_IMPORTTIME:
+        print(f"sitecustomize: {line}", file=sys.stderr)
+
+
+def on_import(module_name: str):
+    """Register the decorated function to run once `module_name` is imported."""
+
+    def decorator(func):
+        _PATCHES.setdefault(module_name, []).append(func)
+        return func
+
+    return decorator
+
+
+def _apply_patches(module_name: str, module, import_us: int) -> None:
+    started = time.perf_counter()
+    for func in _PATCHES.pop(module_name, []):
+        try:
+            func(module)
+        except Exception:
+            pass
+    patch_us = int((time.perf_counter() - started) * 1e6)
+    PATCH_TIMINGS.append((module_name, import_us, patch_us))
+    _report(f"{patch_us:>10} | {import_us + patch_us:>10} | {module_name}")
+
+
+class _PatchingLoader(importlib.abc.Loader):
+    def __init__(self, loader, module_name: str):
+        self.loader = loader
+        self.module_name = module_name
+
+    def create_module(self, spec):
+        return self.loader.create_module(spec)
+
+    def exec_module(self, module):
+        started = time.perf_counter()
+        self.loader.exec_module(module)
+        import_us = int((time.perf_counter() - started) * 1e6)
+        _apply_patches(self.module_name, module, import_us)
+
+    def __getattr__(self, name):
+        return getattr(self.loader, name)
+
+
+class _PatchFinder(importlib.abc.MetaPathFinder):
+    def __init__(self):
+        self._resolving: set[str] = set()
+
+    def find_spec(self, fullname, path, target=None):
+        if fullname not in _PATCHES or fullname in self._resolving:
+            return None
+        self._resolving.add(fullname)
+        try:
+            spec = importlib.util.find_spec(fullname)
+        finally:
+            self._resolving.discard(fullname)
+        if spec is None or spec.loader is None:
+            return None
+        spec.loader = _PatchingLoader(spec.loader, fullname)
+        return spec
+
+
+# Pull in shim that patches LndWallet to backfill macaroons/port before init,
+# and backfill onto the wallet module settings.
+@on_import("lnbits.wallets.lndgrpc")
+def _patch_lndgrpc(lndgrpc):
+    try:
+        import lnd_shim  # noqa: F401
+    except Exception:
+        pass
+
+    # Make LNBITS_BACKEND_WALLET_CLASS=LndPoolWallet resolvable.
+    wallets = sys.modules.get("lnbits.wallets")
+    if wallets is not None:
+        wallets.LndPoolWallet = lndgrpc.LndPoolWallet
+
+    from lnbits.settings import settings
+
+    if not lndgrpc.settings.lnd_grpc_port:
+        lndgrpc.settings.lnd_grpc_port = settings.lnd_grpc_port
+    if not lndgrpc.settings.lnd_grpc_macaroon:
+        lndgrpc.settings.lnd_grpc_macaroon = settings.lnd_grpc_macaroon
+    if not lndgrpc.settings.lnd_grpc_admin_macaroon:
+        lndgrpc.settings.lnd_grpc_admin_macaroon = settings.lnd_grpc_admin_macaroon
 
-# Pull in shim that patches LndWallet to backfill macaroons/port before init.
-try:
-    import lnd_shim  # noqa: F401
-except Exception:
-    pass
 
 # Mount a public status router with backend balance.
-try:
-    from fastapi import FastAPI
-    import status_public
+@on_import("fastapi")
+def _patch_fastapi(fastapi):
+    from contextlib import asynccontextmanager
 
+    FastAPI = fastapi.FastAPI
     _fastapi_init = FastAPI.__init__
 
+    def _lifespan_with_flush(lifespan):
+        # Warm the funding source in the background once startup is done, so
+        # a slow or unreachable node never holds up serving, and start table
+        # partition maintenance; drain write-behind queues and buffered trace
+        # spans before the app's own shutdown runs.
+        @asynccontextmanager
+        async def _lifespan(app):
+            import asyncio
+
+            async with lifespan(app) as state:
+                background: list[asyncio.Task] = []
+                try:
+                    from lnbits.wallets import get_funding_source
+
+                    warmup = getattr(get_funding_source(), "warmup", None)
+                    if warmup:
+                        background.append(
+                            asyncio.create_task(
+                                asyncio.wait_for(warmup(), WARMUP_MAX_SECONDS)
+                            )
+                        )
+                except Exception:
+                    pass
+                try:
+                    from lnbits.core.db import db as core_db
+                    from lnbits.db import (
+                        DB_ROLLUPS,
+                        DB_ROLLUPS_REBUILD,
+                        TimeBucketRollup,
+                        load_partition_managers,
+                    )
+
+                    for manager in load_partition_managers(core_db):
+                        background.append(asyncio.create_task(manager.run()))
+                    if DB_ROLLUPS:
+                        # cheap: buckets are (re)filled by the compactor task
+                        await core_db.add_rollup(
+                            TimeBucketRollup("apipayments"), rebuild=DB_ROLLUPS_REBUILD
+                        )
+                        background.append(
+                            asyncio.create_task(core_db.run_rollup_compactor())
+                        )
+                except Exception:
+                    pass
+                for task in background:
+                    # retrieve the outcome so a failure is not logged as
+                    # "exception never retrieved"
+                    task.add_done_callback(
+                        lambda task: task.cancelled() or task.exception()
+                    )
+                try:
+                    yield state
+                finally:
+                    for task in background:
+                        task.cancel()
+                    try:
+                        from lnbits.db import flush_write_behind_queues
+
+                        await flush_write_behind_queues()
+                    except Exception:
+                        pass
+                    try:
+                        from lnbits.tracing import exporter
+
+                        await exporter.flush()
+                    except Exception:
+                        pass
+
+        return _lifespan
+
     def _fastapi_init_with_status(self, *args, **kwargs):
+        if kwargs.get("lifespan"):
+            kwargs["lifespan"] = _lifespan_with_flush(kwargs["lifespan"])
         _fastapi_init(self, *args, **kwargs)
         try:
+            from lnbits.tracing import TRACE_EXPORT, TracingMiddleware
+
+            if TRACE_EXPORT:
+                self.add_middleware(TracingMiddleware)
+        except Exception:
+            pass
+        try:
+            import status_public
+
             self.include_router(status_public.status_router)
         except Exception:
             pass
 
     FastAPI.__init__ = _fastapi_init_with_status  # type: ignore
-except Exception:
-    pass
+
+
+# Run this deployment's own migrations (lnbits/overlay_migrations.py) after
+# the core and extension ones.
+@on_import("lnbits.core.helpers")
+def _patch_migrations(helpers):
+    _migrate_databases = helpers.migrate_databases
+
+    async def _migrate_databases_with_overlay():
+        await _migrate_databases()
+        from lnbits.overlay_migrations import migrate
+
+        await migrate()
+
+    helpers.migrate_databases = _migrate_databases_with_overlay
+
+
+# Answer unfiltered wallet payment history from the apipayments rollup once
+# the lifespan registered it (LNBITS_DB_ROLLUPS).
+@on_import("lnbits.core.crud.payments")
+def _patch_payments_history(payments):
+    _get_payments_history = payments.get_payments_history
+
+    async def get_payments_history(wallet_id=None, group="day", filters=None):
+        rollup = payments.db.rollups.get("apipayments")
+        if (
+            rollup is None
+            or not wallet_id
+            or (filters and (filters.filters or filters.search))
+        ):
+            return await _get_payments_history(wallet_id, group, filters)
+        wallet = await payments.get_wallet(wallet_id)
+        if not wallet:
+            raise ValueError("Unknown wallet")
+        points = await payments.db.fetch_rollup("apipayments", wallet_id, group)
+        # same backwards walk from the current balance as upstream
+        balance = wallet.balance_msat
+        results = []
+        for point in points:
+            results.insert(
+                0,
+                payments.PaymentHistoryPoint(
+                    balance=balance,
+                    date=point["date"],
+                    income=point["income"],
+                    spending=point["spending"],
+                ),
+            )
+            balance -= point["income"] - point["spending"]
+        return results
+
+    payments.get_payments_history = get_payments_history
+
+
+# Check pending incoming payments against the funding source in one
+# get_invoice_statuses batch (LndWallet, LndPoolWallet) instead of a
+# LookupInvoice per invoice: at startup, every 30 minutes and on wallet loads.
+@on_import("lnbits.core.services.payments")
+def _patch_pending_checks(services):
+    import asyncio
+
+    _update_pending_payment = services.update_pending_payment
+
+    async def _update_pending(payments: list, pause: float = 0) -> list:
+        batch = getattr(services.get_funding_source(), "get_invoice_statuses", None)
+        incoming = [p.checking_id for p in payments if p.is_in and not p.is_internal]
+        statuses = await batch(incoming) if batch and incoming else {}
+        updated = []
+        for payment in payments:
+            status = statuses.get(payment.checking_id)
+            if status is None:
+                payment = await _update_pending_payment(payment)
+            elif status.failed:
+                payment.status = services.PaymentState.FAILED
+                await services.update_payment(payment)
+            elif status.success:
+                payment = await services.update_payment_success_status(
+                    payment, status
+                )
+            updated.append(payment)
+            if pause:
+                await asyncio.sleep(pause)
+        return updated
+
+    async def update_pending_payments(wallet_id: str):
+        await _update_pending(
+            await services.get_payments(
+                wallet_id=wallet_id, pending=True, exclude_uncheckable=True
+            )
+        )
+
+    async def check_pending_payments():
+        if services.get_funding_source().__class__.__name__ == "VoidWallet":
+            services.logger.warning("Task: skipping pending check for VoidWallet")
+            return
+        start_time = time.time()
+        pending_payments = await services.get_payments(
+            since=(int(time.time()) - 60 * 60 * 24 * 15),  # 15 days ago
+            complete=False,
+            pending=True,
+            exclude_uncheckable=True,
+        )
+        count = len(pending_payments)
+        if not count:
+            return
+        services.logger.info(
+            f"Task: checking {count} pending payments of last 15 days..."
+        )
+        # same pause between payment updates as upstream, to avoid blocking
+        for payment in await _update_pending(pending_payments, pause=0.01):
+            services.logger.debug(f"payment {payment.status} {payment.checking_id}")
+        services.logger.info(
+            f"Task: pending check finished for {count} payments"
+            f" (took {time.time() - start_time:0.3f} s)"
+        )
+
+    services.update_pending_payments = update_pending_payments
+    services.check_pending_payments = check_pending_payments
+
+
+# Serve account lookups, one per authenticated request, from the core db's
+# read cache when LNBITS_DB_CACHE is on; account writes evict them. Calls that
+# pass a connection read inside the caller's transaction as before.
+@on_import("lnbits.core.crud.users")
+def _patch_accounts(users):
+    from lnbits.db import DB_CACHE
+
+    if not DB_CACHE:
+        return
+    _get_account = users.get_account
+
+    async def get_account(user_id, conn=None):
+        if conn is not None or not user_id:
+            return await _get_account(user_id, conn)
+        return await users.db.fetchone_cached(
+            "SELECT * FROM accounts WHERE id = :id", {"id": user_id}, users.Account
+        )
+
+    users.get_account = get_account
+
+
+# Write audit rows off the request path through the core db's write-behind
+# queue (LNBITS_AUDIT_WRITE_BEHIND=false keeps them inline). Calls that pass a
+# connection stay inside the caller's transaction.
+@on_import("lnbits.core.crud.audit")
+def _patch_audit(audit):
+    if os.getenv("LNBITS_AUDIT_WRITE_BEHIND", "true").lower() not in (
+        "1",
+        "true",
+        "yes",
+    ):
+        return
+    _create_audit_entry = audit.create_audit_entry
+
+    async def create_audit_entry(entry, conn=None):
+        if conn is not None:
+            return await _create_audit_entry(entry, conn)
+        await audit.db.enqueue_insert("audit", entry)
+
+    audit.create_audit_entry = create_audit_entry
+
 
 # Force asyncpg to use TLS by default for Postgres URLs.
-try:
-    import lnbits.db as _ln_db
-    from sqlalchemy.ext.asyncio import create_async_engine as _sa_create_async_engine
+@on_import("lnbits.db")
+def _patch_db(_ln_db):
+    _sa_create_async_engine = _ln_db.create_async_engine
 
     def _create_async_engine_with_ssl(url, **kwargs):
         if url.startswith("postgres://"):
@@ -37,61 +383,69 @@ try:
         return _sa_create_async_engine(url, **kwargs)
 
     _ln_db.create_async_engine = _create_async_engine_with_ssl
-except Exception:
-    pass
-
-# Remove Binance (HTTP 451 in US) and add CoinGecko for fiat rates.
-try:
-    providers = [
-        p for p in settings.lnbits_exchange_rate_providers if p.name.lower() != "binance"
-    ]
-    providers.insert(
-        0,
-        ExchangeRateProvider(
-            name="CoinGecko",
-            api_url="https://api.coingecko.com/api/v3/simple/price?ids=bitcoin&vs_currencies={TO}",
-            path="$.bitcoin.{TO}",
-            exclude_to=[],
-            ticker_conversion=[],
-        ),
-    )
-    settings.lnbits_exchange_rate_providers = providers
-except Exception:
-    pass
-
-# Force-fill gRPC port from env if pydantic missed it (seen in Container Apps).
-if not settings.lnd_grpc_port:
+
+
+# Serve fiat rates from a hedged, background-refreshed cache.
+@on_import("lnbits.utils.exchange_rates")
+def _patch_exchange_rates(exchange_rates):
+    import rate_cache
+
+    rate_cache.install(exchange_rates)
+
+
+@on_import("lnbits.settings")
+def _patch_settings(_ln_settings):
+    settings = _ln_settings.settings
+
+    # Remove Binance (HTTP 451 in US) and add CoinGecko for fiat rates.
     try:
-        settings.lnd_grpc_port = int(os.getenv("LND_GRPC_PORT", "10009"))
+        providers = [
+            p
+            for p in settings.lnbits_exchange_rate_providers
+            if p.name.lower() != "binance"
+        ]
+        providers.insert(
+            0,
+            _ln_settings.ExchangeRateProvider(
+                name="CoinGecko",
+                api_url=(
+                    "https://api.coingecko.com/api/v3/simple/price"
+                    "?ids=bitcoin&vs_currencies={TO}"
+                ),
+                path="$.bitcoin.{TO}",
+                exclude_to=[],
+                ticker_conversion=[],
+            ),
+        )
+        settings.lnbits_exchange_rate_providers = providers
     except Exception:
-        settings.lnd_grpc_port = None
+        pass
 
-# Force-fill macaroon path if missing.
-if not settings.lnd_grpc_macaroon:
-    settings.lnd_grpc_macaroon = os.getenv("LND_GRPC_MACAROON")
-if not settings.lnd_grpc_admin_macaroon:
-    settings.lnd_grpc_admin_macaroon = os.getenv("LND_GRPC_ADMIN_MACAROON")
+    # Force-fill gRPC port from env if pydantic missed it (seen in Container Apps).
+    if not settings.lnd_grpc_port:
+        try:
+            settings.lnd_grpc_port = int(os.getenv("LND_GRPC_PORT", "10009"))
+        except Exception:
+            settings.lnd_grpc_port = None
 
-# Ensure endpoint strips proto/port if provided.
-if settings.lnd_grpc_endpoint and "://" in settings.lnd_grpc_endpoint:
-    settings.lnd_grpc_endpoint = settings.lnd_grpc_endpoint.split("://", 1)[1].split(
-        ":"
-    )[0]
+    # Force-fill macaroon path if missing.
+    if not settings.lnd_grpc_macaroon:
+        settings.lnd_grpc_macaroon = os.getenv("LND_GRPC_MACAROON")
+    if not settings.lnd_grpc_admin_macaroon:
+        settings.lnd_grpc_admin_macaroon = os.getenv("LND_GRPC_ADMIN_MACAROON")
 
-# Also backfill onto the wallet module settings before wallet init.
-try:
-    from lnbits.wallets import lndgrpc
+    # Ensure endpoint strips proto/port if provided.
+    if settings.lnd_grpc_endpoint and "://" in settings.lnd_grpc_endpoint:
+        settings.lnd_grpc_endpoint = settings.lnd_grpc_endpoint.split("://", 1)[
+            1
+        ].split(":")[0]
 
-    if not lndgrpc.settings.lnd_grpc_port:
-        lndgrpc.settings.lnd_grpc_port = settings.lnd_grpc_port
-    if not lndgrpc.settings.lnd_grpc_macaroon:
-        lndgrpc.settings.lnd_grpc_macaroon = settings.lnd_grpc_macaroon
-    if not lndgrpc.settings.lnd_grpc_admin_macaroon:
-        lndgrpc.settings.lnd_grpc_admin_macaroon = settings.lnd_grpc_admin_macaroon
-except Exception:
-    pass
 
-try:
-    import lnd_shim  # noqa: F401
-except Exception:
-    pass
+# Modules imported before this file ran get their patches right away.
+for _name in list(_PATCHES):
+    if _name in sys.modules:
+        _apply_patches(_name, sys.modules[_name], 0)
+sys.meta_path.insert(0, _PatchFinder())
+
+SITE_US = int((time.perf_counter() - _SITE_STARTED) * 1e6)
+_report(f"{SITE_US:>10} | {SITE_US:>10} | sitecustomize")
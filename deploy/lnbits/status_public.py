@@ -1,10 +1,23 @@
+import asyncio
+import json
+import sys
+from collections.abc import AsyncGenerator
+
 from fastapi import APIRouter
+from fastapi.responses import StreamingResponse
+from loguru import logger
 
 from lnbits.wallets import get_funding_source
 from lnbits.wallets.base import StatusResponse
 
 status_router = APIRouter(tags=["Core"], prefix="/status")
 
+# Longest wait between upstream status checks when the backend has no change hook.
+STREAM_POLL_SECONDS = 10.0
+STREAM_KEEPALIVE_SECONDS = 15.0
+# Events buffered per client before it is treated as a slow consumer and dropped.
+STREAM_CLIENT_BUFFER = 16
+
 
 @status_router.get("/health")
 async def health() -> dict:
@@ -15,4 +28,154 @@ async def health() -> dict:
         "funding_source": funding.__class__.__name__,
         "funding_error": status.error_message,
         "funding_balance_msat": status.balance_msat,
+        "funding_cache_age": getattr(funding, "status_cache_age", None),
     }
+
+
+@status_router.get("/metrics")
+async def metrics() -> dict:
+    """Per-RPC call counts, status codes and latency histograms for LND."""
+    funding = get_funding_source()
+    data: dict = {"funding_source": funding.__class__.__name__}
+    try:
+        from lnbits.wallets import lndgrpc
+
+        data["rpc"] = lndgrpc.rpc_metrics.snapshot()
+    except Exception:
+        data["rpc"] = None
+    pay_metrics = getattr(funding, "pay_metrics", None)
+    data["payments"] = pay_metrics() if pay_metrics else None
+    startup_metrics = getattr(funding, "startup_metrics", None)
+    data["startup"] = startup_metrics() if startup_metrics else None
+    try:
+        from lnbits.core.db import db as core_db
+
+        data["invalidation"] = core_db.invalidation.snapshot()
+        data["db_lock"] = {
+            "waits": core_db.lock_waits,
+            "wait_seconds": round(core_db.lock_wait_seconds, 3),
+            "wait_max_seconds": round(core_db.lock_wait_max, 4),
+        }
+    except Exception:
+        data["invalidation"] = None
+        data["db_lock"] = None
+    tracing = sys.modules.get("lnbits.tracing")
+    data["tracing"] = tracing.exporter.snapshot() if tracing else None
+    rate_cache = sys.modules.get("rate_cache")
+    data["rates"] = rate_cache.rate_cache.snapshot() if rate_cache else None
+    sitecustomize = sys.modules.get("sitecustomize")
+    data["boot"] = (
+        {
+            "sitecustomize_us": sitecustomize.SITE_US,
+            "patches": [
+                {"module": name, "import_us": import_us, "patch_us": patch_us}
+                for name, import_us, patch_us in sitecustomize.PATCH_TIMINGS
+            ],
+        }
+        if hasattr(sitecustomize, "PATCH_TIMINGS")
+        else None
+    )
+    data["status_stream"] = {
+        "clients": len(status_broadcaster.clients),
+        "dropped": status_broadcaster.dropped,
+    }
+    return data
+
+
+class StatusBroadcaster:
+    """
+    One upstream watcher per process fanned out to any number of clients.
+    Each client has a bounded queue; a client whose queue is full gets dropped
+    instead of holding back everyone else.
+    """
+
+    def __init__(self):
+        self.clients: set[asyncio.Queue] = set()
+        self.last: dict | None = None
+        self.dropped = 0
+        self._task: asyncio.Task | None = None
+
+    def subscribe(self) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(STREAM_CLIENT_BUFFER)
+        if self.last:
+            queue.put_nowait(self.last)
+        self.clients.add(queue)
+        if not self._task or self._task.done():
+            self._task = asyncio.create_task(self._watch())
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue) -> None:
+        self.clients.discard(queue)
+        if not self.clients and self._task:
+            self._task.cancel()
+            self._task = None
+
+    def publish(self, event: dict) -> None:
+        self.last = event
+        for queue in list(self.clients):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                self.dropped += 1
+                self.clients.discard(queue)
+                # make room for the sentinel that ends the client's stream
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(None)
+
+    async def _watch(self) -> None:
+        while True:
+            funding = get_funding_source()
+            changed: asyncio.Event | None = getattr(funding, "status_changed", None)
+            if changed:
+                changed.clear()
+            try:
+                status: StatusResponse = await funding.status()
+                event = {
+                    "funding_source": funding.__class__.__name__,
+                    "funding_error": status.error_message,
+                    "funding_balance_msat": status.balance_msat,
+                }
+                if event != self.last:
+                    self.publish(event)
+            except Exception as exc:
+                logger.warning(f"status stream check failed: {exc}")
+            try:
+                if changed:
+                    await asyncio.wait_for(changed.wait(), STREAM_POLL_SECONDS)
+                else:
+                    await asyncio.sleep(STREAM_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+
+status_broadcaster = StatusBroadcaster()
+
+
+@status_router.get("/stream")
+async def stream() -> StreamingResponse:
+    """Server-Sent Events with balance and funding-error changes."""
+
+    async def _events() -> AsyncGenerator[str, None]:
+        queue = status_broadcaster.subscribe()
+        try:
+            while True:
+                try:
+                    event = await asyncio.wait_for(
+                        queue.get(), STREAM_KEEPALIVE_SECONDS
+                    )
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if event is None:
+                    yield "event: dropped\ndata: {}\n\n"
+                    return
+                yield f"event: status\ndata: {json.dumps(event)}\n\n"
+        finally:
+            status_broadcaster.unsubscribe(queue)
+
+    return StreamingResponse(
+        _events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
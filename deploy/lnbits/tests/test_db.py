@@ -0,0 +1,205 @@
+import asyncio
+import gzip
+import os
+import sqlite3
+from datetime import datetime, timezone
+
+import pytest
+from pydantic import BaseModel
+
+from lnbits.db import PartitionManager, TimeBucketRollup, load_partition_managers
+
+
+def utc(year: int, month: int, day: int = 1) -> datetime:
+    return datetime(year, month, day, tzinfo=timezone.utc)
+
+
+@pytest.mark.parametrize("table", ["apipayments", "wallets", "accounts"])
+def test_partition_manager_refuses_balance_tables(table):
+    with pytest.raises(ValueError, match="cannot be archived"):
+        PartitionManager(None, table)  # type: ignore[arg-type]
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [{"table": "audit; DROP TABLE x"}, {"table": "audit", "time_column": "a b"}],
+)
+def test_partition_manager_refuses_bad_identifiers(kwargs):
+    with pytest.raises(ValueError, match="invalid table or column name"):
+        PartitionManager(None, **kwargs)  # type: ignore[arg-type]
+
+
+def test_load_partition_managers(monkeypatch):
+    monkeypatch.setenv(
+        "LNBITS_DB_PARTITION_TABLES",
+        '[{"table": "audit", "time_column": "created_at", "retain_months": 3}]',
+    )
+    (manager,) = load_partition_managers(None)  # type: ignore[arg-type]
+    assert (manager.table, manager.time_column, manager.retain_months) == (
+        "audit",
+        "created_at",
+        3,
+    )
+
+
+def archived_rows(path: str) -> list[str]:
+    raw = path[: -len(".gz")]
+    with gzip.open(path, "rb") as src, open(raw, "wb") as dst:
+        dst.write(src.read())
+    try:
+        with sqlite3.connect(raw) as archive:
+            return [row[0] for row in archive.execute("SELECT path FROM audit")]
+    finally:
+        os.remove(raw)
+
+
+def test_sqlite_archives_months_past_retention(tmp_path):
+    from lnbits.db import Database
+
+    db = Database("partition_test")
+    manager = PartitionManager(
+        db,
+        "audit",
+        retain_months=3,
+        time_column="created_at",
+        archive_dir=str(tmp_path),
+    )
+
+    async def run():
+        await db.execute("CREATE TABLE audit (path TEXT, created_at TIMESTAMP)")
+        for path, created_at in [
+            ("/jan", utc(2025, 1, 5)),
+            ("/jan-late", utc(2025, 1, 31)),
+            ("/feb", utc(2025, 2, 5)),
+            ("/jul", utc(2026, 7, 1)),
+            ("/oct", utc(2026, 10, 1)),
+        ]:
+            await db.execute(
+                "INSERT INTO audit (path, created_at) "
+                f"VALUES (:path, {db.timestamp_placeholder('created_at')})",
+                {"path": path, "created_at": created_at},
+            )
+        result = await manager.maintain(utc(2026, 10, 19))
+        rows = await db.fetchall("SELECT path FROM audit ORDER BY path")
+        again = await manager.maintain(utc(2026, 10, 19))
+        return result, [row["path"] for row in rows], again
+
+    result, live, again = asyncio.run(run())
+    assert result == {"created": [], "archived": ["audit_p202501", "audit_p202502"]}
+    assert live == ["/jul", "/oct"]
+    assert again == {"created": [], "archived": []}
+    assert sorted(os.listdir(tmp_path)) == [
+        "partition_test.audit.202501.sqlite3.gz",
+        "partition_test.audit.202502.sqlite3.gz",
+    ]
+    assert sorted(
+        archived_rows(str(tmp_path / "partition_test.audit.202501.sqlite3.gz"))
+    ) == ["/jan", "/jan-late"]
+
+
+class Payment(BaseModel):
+    id: str
+    wallet_id: str = "wallet"
+    amount: int
+    fee: int = 0
+    status: str = "success"
+    time: datetime
+
+
+def test_rollup_compacts_in_chunks_and_rewinds_moved_rows():
+    from lnbits.db import Database
+
+    db = Database("rollup_test")
+    rollup = TimeBucketRollup(chunk_rows=2)
+
+    async def compact_steps() -> list[int]:
+        watermarks = []
+        done = False
+        while not done:
+            async with db.connect() as conn:
+                _, done = await rollup.compact(conn)
+                watermarks.append(await rollup.watermark(conn))
+        return watermarks
+
+    async def income() -> list[int]:
+        await db.compact_rollups()
+        history = await db.fetch_rollup("apipayments", "wallet", "month")
+        return [point["income"] for point in history]
+
+    async def watermark() -> int:
+        async with db.connect() as conn:
+            return await rollup.watermark(conn)
+
+    async def run():
+        await db.execute(
+            """
+            CREATE TABLE apipayments (id TEXT, wallet_id TEXT, amount INT,
+                fee INT, status TEXT, time TIMESTAMP)
+            """
+        )
+        async with db.connect() as conn:
+            await rollup.migrate(conn)
+        for month in range(1, 6):
+            await db.insert(
+                "apipayments",
+                Payment(id=str(month), amount=month * 1000, time=utc(2025, month, 10)),
+            )
+        await db.add_rollup(rollup)
+        steps = await compact_steps()
+        monthly = await income()
+
+        # a restart keeps the watermark instead of rebuilding from scratch
+        caught_up = await watermark()
+        await db.add_rollup(TimeBucketRollup())
+        restarted = await watermark()
+
+        # an update moving January into April un-rolls January as well
+        await db.update(
+            "apipayments", Payment(id="1", amount=1000, time=utc(2025, 4, 12))
+        )
+        rewound = await watermark()
+        moved = await income()
+
+        # so does a raw UPDATE moving May back into February
+        await db.execute(
+            "UPDATE apipayments SET time = :time WHERE id = :id",
+            {"time": utc(2025, 2, 12), "id": "5"},
+        )
+        raw_rewound = await watermark()
+        return steps, monthly, caught_up, restarted, rewound, moved, raw_rewound
+
+    steps, monthly, caught_up, restarted, rewound, moved, raw_rewound = asyncio.run(
+        run()
+    )
+    assert steps[:2] == [
+        int(utc(2025, 3, 10).timestamp()),
+        int(utc(2025, 5, 10).timestamp()),
+    ]
+    assert len(steps) == 3
+    assert monthly == [5000, 4000, 3000, 2000, 1000]
+    assert restarted == caught_up == steps[-1]
+    assert rewound == int(utc(2025, 1).timestamp())
+    assert moved == [5000, 5000, 3000, 2000]
+    assert raw_rewound == int(utc(2025, 2).timestamp())
+
+
+def test_cancel_interrupts_query_without_timeout():
+    from lnbits.db import Database
+
+    db = Database("cancel_test")
+    endless = (
+        "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n) "
+        "SELECT COUNT(*) FROM n"
+    )
+
+    async def run():
+        async with db.connect() as conn:
+            conn.statement_timeout = 0
+            query = asyncio.create_task(conn.fetchone(endless))
+            await asyncio.sleep(0.2)
+            query.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await asyncio.wait_for(query, 5)
+            return conn.conn.invalidated
+
+    assert asyncio.run(asyncio.wait_for(run(), 10))
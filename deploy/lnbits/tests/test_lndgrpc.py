@@ -0,0 +1,393 @@
+import asyncio
+import json
+from collections import Counter
+from types import SimpleNamespace
+
+import pytest
+
+from lnbits.wallets import lndgrpc
+from lnbits.wallets.lnd_grpc_files import lightning_pb2 as ln
+
+# inline values, so constructing a wallet reads no files and opens no channel
+CERT = "-----BEGIN CERTIFICATE-----\nMIIB\n-----END CERTIFICATE-----\n"
+MACAROON = "0201036c6e64"
+PAYEE = "02" + "ab" * 32
+
+
+def make_wallet() -> lndgrpc.LndWallet:
+    return lndgrpc.LndWallet(
+        endpoint="127.0.0.1", port=10009, cert=CERT, macaroon=MACAROON
+    )
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch) -> Clock:
+    clock = Clock()
+    monkeypatch.setattr(lndgrpc.time, "monotonic", clock)
+    return clock
+
+
+def test_inflight_payment_expires(clock):
+    cache = lndgrpc.PaymentStateCache(inflight_ttl=5)
+    cache.update(ln.Payment(payment_hash="aa", status=ln.Payment.IN_FLIGHT))
+    clock.now += 4
+    assert cache.get("aa").status == ln.Payment.IN_FLIGHT
+    clock.now += 2
+    assert cache.get("aa") is None
+    assert "aa" not in cache.inflight
+
+
+def test_finalized_payment_outlives_inflight_ttl(clock):
+    cache = lndgrpc.PaymentStateCache(ttl=60, inflight_ttl=5)
+    cache.update(ln.Payment(payment_hash="aa", status=ln.Payment.IN_FLIGHT))
+    cache.update(ln.Payment(payment_hash="aa", status=ln.Payment.SUCCEEDED))
+    clock.now += 30
+    assert cache.get("aa").status == ln.Payment.SUCCEEDED
+    assert "aa" not in cache.inflight
+    clock.now += 60
+    cache.update(ln.Payment(payment_hash="bb", status=ln.Payment.FAILED))
+    assert cache.get("aa") is None
+
+
+def test_clear_inflight_keeps_finalized():
+    cache = lndgrpc.PaymentStateCache()
+    cache.update(ln.Payment(payment_hash="aa", status=ln.Payment.IN_FLIGHT))
+    cache.update(ln.Payment(payment_hash="bb", status=ln.Payment.FAILED))
+    cache.clear_inflight()
+    assert cache.get("aa") is None
+    assert cache.get("bb") is not None
+
+
+def test_payment_status_keeps_preimage_and_fee():
+    status = lndgrpc.payment_status(
+        ln.Payment(
+            payment_hash="aa",
+            payment_preimage="bb" * 32,
+            status=ln.Payment.SUCCEEDED,
+            fee_msat=1500,
+        )
+    )
+    assert (status.success, status.preimage, status.fee_msat) == (
+        True,
+        "bb" * 32,
+        1500,
+    )
+    failed = ln.Payment(payment_hash="aa", status=ln.Payment.FAILED)
+    assert lndgrpc.payment_status(failed).failed
+    inflight = ln.Payment(payment_hash="aa", status=ln.Payment.IN_FLIGHT)
+    assert lndgrpc.payment_status(inflight).pending
+
+
+def test_invoice_status():
+    settled = ln.Invoice(
+        settled=True, state=ln.Invoice.SETTLED, r_preimage=bytes.fromhex("bb" * 32)
+    )
+    assert lndgrpc.invoice_status(settled).preimage == "bb" * 32
+    assert lndgrpc.invoice_status(ln.Invoice(state=ln.Invoice.CANCELED)).failed
+    assert lndgrpc.invoice_status(ln.Invoice(state=ln.Invoice.ACCEPTED)).pending
+
+
+class FakeInvoices:
+    """ListInvoices over invoices with add_index 1..count, plus LookupInvoice."""
+
+    def __init__(self, count: int):
+        self.invoices = [
+            ln.Invoice(
+                r_hash=i.to_bytes(32, "big"),
+                add_index=i,
+                settled=True,
+                state=ln.Invoice.SETTLED,
+            )
+            for i in range(1, count + 1)
+        ]
+        self.pages = 0
+        self.lookups = 0
+
+    async def ListInvoices(self, request):  # noqa: N802
+        self.pages += 1
+        end = request.index_offset - 1 if request.index_offset else len(self.invoices)
+        start = max(end - request.num_max_invoices, 0)
+        page = self.invoices[start:end]
+        return ln.ListInvoiceResponse(
+            invoices=page, first_index_offset=page[0].add_index if page else 0
+        )
+
+    async def LookupInvoice(self, request):  # noqa: N802
+        self.lookups += 1
+        return ln.Invoice(r_hash=request.r_hash, state=ln.Invoice.OPEN)
+
+
+def test_invoice_statuses_page_then_look_up(monkeypatch):
+    rpc = FakeInvoices(25)
+    monkeypatch.setattr(lndgrpc.LndWallet, "rpc", property(lambda _: rpc))
+    recent, old = (i.to_bytes(32, "big").hex() for i in (20, 3))
+    unknown = "ff" * 32
+    statuses = asyncio.run(
+        make_wallet().get_invoice_statuses(
+            [recent, old, unknown], max_pages=2, page_size=10
+        )
+    )
+    assert statuses[recent].success
+    # two pages reach back to add_index 6, the rest is looked up one by one
+    assert statuses[old].pending and statuses[unknown].pending
+    assert (rpc.pages, rpc.lookups) == (2, 2)
+
+
+def make_pool(monkeypatch, weights: list[float]) -> lndgrpc.LndPoolWallet:
+    nodes = [
+        {
+            "endpoint": f"10.0.0.{i}",
+            "port": 10009,
+            "cert": CERT,
+            "macaroon": MACAROON,
+            "weight": weight,
+        }
+        for i, weight in enumerate(weights)
+    ]
+    monkeypatch.setenv("LND_POOL_NODES", json.dumps(nodes))
+    return lndgrpc.LndPoolWallet()
+
+
+def test_pool_invoices_interleave_by_weight(monkeypatch):
+    pool = make_pool(monkeypatch, [5, 1, 1])
+    picks = [pool._pick_for_invoice() for _ in range(7)]
+    assert picks == [0, 0, 1, 0, 2, 0, 0]
+    counts = Counter(pool._pick_for_invoice() for _ in range(700))
+    assert counts == {0: 500, 1: 100, 2: 100}
+
+
+def test_pool_equal_weights_alternate(monkeypatch):
+    pool = make_pool(monkeypatch, [1, 1])
+    assert [pool._pick_for_invoice() for _ in range(4)] == [0, 1, 0, 1]
+
+
+PAYMENT_HASH = "aa" * 32
+PREIMAGE = "bb" * 32
+
+
+class FakeRouter:
+    """SendPaymentV2 answering with a failure reason, or success for None."""
+
+    def __init__(self, failure_reason: int | None):
+        self.failure_reason = failure_reason
+        self.calls = 0
+
+    def SendPaymentV2(self, request):  # noqa: N802
+        self.calls += 1
+        if self.failure_reason is None:
+            payment = ln.Payment(
+                payment_hash=PAYMENT_HASH,
+                payment_preimage=PREIMAGE,
+                status=ln.Payment.SUCCEEDED,
+                fee_msat=1500,
+            )
+        else:
+            payment = ln.Payment(
+                payment_hash=PAYMENT_HASH,
+                status=ln.Payment.FAILED,
+                failure_reason=self.failure_reason,
+            )
+
+        async def read():
+            return payment
+
+        return SimpleNamespace(read=read)
+
+
+def pay(wallet: lndgrpc.LndWallet, monkeypatch, amount_msat: int):
+    monkeypatch.setattr(
+        lndgrpc,
+        "bolt11_decode",
+        lambda _: SimpleNamespace(amount_msat=amount_msat, payee=PAYEE),
+    )
+    return asyncio.run(wallet._send_payment("lnbc1", 10_000))
+
+
+@pytest.fixture
+def router(monkeypatch, request) -> FakeRouter:
+    router = FakeRouter(request.param)
+    monkeypatch.setattr(lndgrpc.LndWallet, "routerpc", property(lambda _: router))
+    return router
+
+
+@pytest.mark.parametrize("router", [2], indirect=True)  # NO_ROUTE
+def test_no_route_marks_destination_and_bucket(monkeypatch, router):
+    wallet = make_wallet()
+    first = pay(wallet, monkeypatch, 100_000)
+    assert first.ok is False
+    assert first.checking_id == PAYMENT_HASH
+    assert first.error_message == "Payment failed: No route to destination."
+    assert router.calls == 1
+    assert list(wallet.failing_destinations) == [
+        (PAYEE, lndgrpc.amount_bucket_sat(100_000))
+    ]
+
+    # same bucket: refused without asking LND
+    again = pay(wallet, monkeypatch, 110_000)
+    assert again.ok is False
+    assert "destination recently failed" in again.error_message
+    assert router.calls == 1
+
+    # a smaller amount may still find a route
+    pay(wallet, monkeypatch, 1_000)
+    assert router.calls == 2
+
+
+@pytest.mark.parametrize("router", [2], indirect=True)
+def test_doomed_destination_expires(monkeypatch, router, clock):
+    wallet = make_wallet()
+    pay(wallet, monkeypatch, 100_000)
+    clock.now += lndgrpc.PAY_FAILED_DEST_TTL + 1
+    pay(wallet, monkeypatch, 100_000)
+    assert router.calls == 2
+
+
+@pytest.mark.parametrize("router", [5], indirect=True)  # INSUFFICIENT_BALANCE
+def test_insufficient_balance_does_not_mark_destination(monkeypatch, router):
+    wallet = make_wallet()
+    pay(wallet, monkeypatch, 100_000)
+    pay(wallet, monkeypatch, 100_000)
+    assert router.calls == 2
+    assert not wallet.failing_destinations
+
+
+@pytest.mark.parametrize("router", [None], indirect=True)
+def test_successful_payment(monkeypatch, router):
+    wallet = make_wallet()
+    result = pay(wallet, monkeypatch, 100_000)
+    assert result.ok is True
+    assert result.checking_id == PAYMENT_HASH
+    assert result.preimage == PREIMAGE
+    assert result.fee_msat == 1500
+    assert not wallet.failing_destinations
+    assert wallet.payment_states.get(PAYMENT_HASH).status == ln.Payment.SUCCEEDED
+
+
+@pytest.mark.parametrize("router", [None], indirect=True)
+def test_payment_without_final_update_is_pending(monkeypatch, router):
+    async def eof():
+        return lndgrpc.grpc.aio.EOF
+
+    monkeypatch.setattr(router, "SendPaymentV2", lambda _: SimpleNamespace(read=eof))
+    result = pay(make_wallet(), monkeypatch, 100_000)
+    assert result.ok is None
+    assert result.error_message is None
+
+
+class FakeChannel:
+    def __init__(self):
+        self.closed = False
+
+    async def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def dispatch(monkeypatch):
+    monkeypatch.setattr(lndgrpc, "PAY_DISPATCH", True)
+    monkeypatch.setattr(
+        lndgrpc,
+        "bolt11_decode",
+        lambda _: SimpleNamespace(
+            payment_hash=PAYMENT_HASH, amount_msat=100_000, payee=PAYEE
+        ),
+    )
+
+
+@pytest.mark.parametrize("router", [None], indirect=True)
+def test_dispatched_payment_resolves(dispatch, router):
+    wallet = make_wallet()
+
+    async def run():
+        first = await wallet.pay_invoice("lnbc1", 10_000)
+        again = await wallet.pay_invoice("lnbc1", 10_000)
+        result = await wallet.wait_payment(PAYMENT_HASH, timeout=5)
+        await wallet.cleanup()
+        return first, again, result
+
+    first, again, result = asyncio.run(run())
+    assert (first.ok, first.checking_id) == (None, PAYMENT_HASH)
+    assert again == first
+    assert router.calls == 1
+    assert (result.ok, result.preimage, result.fee_msat) == (True, PREIMAGE, 1500)
+
+
+@pytest.mark.parametrize("router", [None], indirect=True)
+def test_cleanup_settles_pending_dispatches(dispatch, router, monkeypatch):
+    async def never():
+        await asyncio.Event().wait()
+
+    monkeypatch.setattr(router, "SendPaymentV2", lambda _: SimpleNamespace(read=never))
+    wallet = make_wallet()
+    channel = FakeChannel()
+    wallet.channels = [channel]
+
+    async def run():
+        await wallet.pay_invoice("lnbc1", 10_000)
+        waiter = asyncio.create_task(wallet.wait_payment(PAYMENT_HASH))
+        await asyncio.sleep(0)
+        await wallet.cleanup()
+        return await waiter
+
+    result = asyncio.run(run())
+    assert result.ok is None
+    assert not wallet._pay_tasks
+    assert channel.closed
+
+
+class FakeHoldInvoices:
+    """AddHoldInvoice plus a SubscribeSingleInvoice fed from `states`."""
+
+    def __init__(self):
+        self.states: asyncio.Queue = asyncio.Queue()
+        self.lookups = 0
+
+    async def AddHoldInvoice(self, request):  # noqa: N802
+        return SimpleNamespace(payment_request=f"lnbc1{request.hash.hex()}")
+
+    async def SubscribeSingleInvoice(self, request):  # noqa: N802
+        while True:
+            yield ln.Invoice(r_hash=request.r_hash, state=await self.states.get())
+
+    async def LookupInvoice(self, request):  # noqa: N802
+        self.lookups += 1
+        return ln.Invoice(r_hash=request.r_hash, state=ln.Invoice.CANCELED)
+
+
+def test_hold_invoice_state_answers_status(monkeypatch):
+    rpc = FakeHoldInvoices()
+    monkeypatch.setattr(lndgrpc.LndWallet, "rpc", property(lambda _: rpc))
+    monkeypatch.setattr(lndgrpc.LndWallet, "invoicesrpc", property(lambda _: rpc))
+    wallet = make_wallet()
+
+    async def run():
+        created = await wallet.create_hold_invoice(1000, payment_hash=PAYMENT_HASH)
+        watch = wallet.hold_watches[PAYMENT_HASH]
+        rpc.states.put_nowait(ln.Invoice.OPEN)
+        while not watch.live:
+            await asyncio.sleep(0)
+        open_status = await wallet.get_invoice_status(PAYMENT_HASH)
+        accepted = asyncio.create_task(watch.wait_for("ACCEPTED", timeout=5))
+        rpc.states.put_nowait(ln.Invoice.ACCEPTED)
+        state = await accepted
+        lookups = rpc.lookups
+        rpc.states.put_nowait(ln.Invoice.CANCELED)
+        await asyncio.wait_for(watch.task, 5)
+        return created, open_status, state, lookups, watch.live
+
+    created, open_status, state, lookups, live = asyncio.run(run())
+    assert created.checking_id == PAYMENT_HASH
+    assert open_status.pending
+    assert (state, lookups) == ("ACCEPTED", 0)
+    # final states come from LookupInvoice, which carries the preimage
+    assert not live
+    assert asyncio.run(wallet.get_invoice_status(PAYMENT_HASH)).failed
+    assert rpc.lookups == 1
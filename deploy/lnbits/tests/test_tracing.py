@@ -0,0 +1,68 @@
+import pytest
+
+from lnbits import tracing
+
+TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+PARENT_ID = "00f067aa0ba902b7"
+TRACEPARENT = f"00-{TRACE_ID}-{PARENT_ID}-01"
+
+
+@pytest.fixture
+def spans(monkeypatch) -> list:
+    exported: list = []
+    monkeypatch.setattr(tracing, "TRACE_EXPORT", "/dev/null")
+    monkeypatch.setattr(tracing.exporter, "add", exported.append)
+    return exported
+
+
+def test_parse_traceparent():
+    assert tracing._parse_traceparent(TRACEPARENT) == (TRACE_ID, PARENT_ID)
+    assert tracing._parse_traceparent(f" {TRACEPARENT}\n") == (TRACE_ID, PARENT_ID)
+
+
+@pytest.mark.parametrize(
+    "header",
+    [
+        None,
+        "",
+        "garbage",
+        TRACEPARENT.upper(),
+        TRACEPARENT[:-1],
+        f"{TRACEPARENT}-00",
+        f"0-{TRACE_ID}-{PARENT_ID}-01",
+        f"ff-{TRACE_ID}-{PARENT_ID}-01",
+        f"00-{'0' * 32}-{PARENT_ID}-01",
+        f"00-{TRACE_ID}-{'0' * 16}-01",
+        f"00-{TRACE_ID[:-1]}g-{PARENT_ID}-01",
+    ],
+)
+def test_parse_traceparent_rejects(header):
+    assert tracing._parse_traceparent(header) is None
+
+
+def test_sampled_flag_does_not_force_sampling(monkeypatch, spans):
+    monkeypatch.setattr(tracing, "TRACE_SAMPLE_RATE", 0.0)
+    with tracing.start_trace("GET /", TRACEPARENT) as root:
+        assert root is None
+    assert spans == []
+
+
+def test_sampled_trace_continues_caller(monkeypatch, spans):
+    monkeypatch.setattr(tracing, "TRACE_SAMPLE_RATE", 1.0)
+    with tracing.start_trace("GET /", TRACEPARENT) as root:
+        assert root is not None
+        with tracing.span("db.query") as child:
+            assert child is not None
+    assert (root.trace_id, root.parent_id) == (TRACE_ID, PARENT_ID)
+    assert child.trace_id == TRACE_ID
+    assert child.parent_id == root.span_id
+    assert spans == [child, root]
+
+
+def test_invalid_traceparent_starts_new_trace(monkeypatch, spans):
+    monkeypatch.setattr(tracing, "TRACE_SAMPLE_RATE", 1.0)
+    with tracing.start_trace("GET /", f"ff-{TRACE_ID}-{PARENT_ID}-01") as root:
+        assert root is not None
+    assert root.trace_id != TRACE_ID
+    assert len(root.trace_id) == 32
+    assert root.parent_id is None
@@ -0,0 +1,296 @@
+"""
+Minimal request tracing for the patched LNbits stack.
+
+A trace starts at the ASGI layer (TracingMiddleware, mounted by
+sitecustomize) and follows the request through a context variable, so
+`lnbits.db` and `LndWallet` only open child spans when the request was
+sampled. Unsampled requests cost one contextvar lookup per span site.
+
+    LNBITS_TRACE_EXPORT       file path (one JSON span per line) or an
+                              http(s) OTLP/JSON traces endpoint; unset disables
+    LNBITS_TRACE_SAMPLE_RATE  share of requests traced (0 disables, default);
+                              an inbound W3C traceparent only links the trace
+                              to its caller, it never forces sampling
+"""
+
+import asyncio
+import json
+import os
+import random
+import re
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from os import environ
+
+from loguru import logger
+
+TRACE_SAMPLE_RATE = float(environ.get("LNBITS_TRACE_SAMPLE_RATE", "0"))
+TRACE_EXPORT = environ.get("LNBITS_TRACE_EXPORT", "")
+TRACE_SERVICE = environ.get("LNBITS_TRACE_SERVICE", "lnbits")
+TRACE_FLUSH_SECONDS = float(environ.get("LNBITS_TRACE_FLUSH_SECONDS", "5"))
+TRACE_BATCH = int(environ.get("LNBITS_TRACE_BATCH", "512"))
+# Finished spans held for export; beyond this new spans are dropped.
+TRACE_BUFFER = int(environ.get("LNBITS_TRACE_BUFFER", "10000"))
+
+
+class Span:
+    __slots__ = (
+        "trace_id",
+        "span_id",
+        "parent_id",
+        "name",
+        "attributes",
+        "start_ns",
+        "end_ns",
+        "error",
+    )
+
+    def __init__(self, name: str, trace_id: str, parent_id: str | None, **attributes):
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.attributes = attributes
+        self.start_ns = time.time_ns()
+        self.end_ns: int | None = None
+        self.error: str | None = None
+
+    def set(self, key: str, value) -> None:
+        self.attributes[key] = value
+
+    def end(self, error: str | None = None) -> None:
+        if self.end_ns is not None:
+            return
+        self.end_ns = time.time_ns()
+        self.error = error
+        exporter.add(self)
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_ns": self.start_ns,
+            "duration_ms": round(
+                ((self.end_ns or self.start_ns) - self.start_ns) / 1e6, 3
+            ),
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+    def to_otlp(self) -> dict:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns or self.start_ns),
+            "attributes": [
+                {"key": key, "value": {"stringValue": str(value)}}
+                for key, value in self.attributes.items()
+            ],
+            "status": {"code": 2, "message": self.error} if self.error else {},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+_current: ContextVar[Span | None] = ContextVar("lnbits_trace_span", default=None)
+
+
+def current_span() -> Span | None:
+    return _current.get()
+
+
+def start_span(name: str, **attributes) -> Span | None:
+    """
+    Child of the current span, or None outside a sampled trace. The caller
+    ends it; use this when the work finishes outside the current context.
+    """
+    parent = _current.get()
+    if parent is None:
+        return None
+    return Span(name, parent.trace_id, parent.span_id, **attributes)
+
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[Span | None]:
+    child = start_span(name, **attributes)
+    if child is None:
+        yield None
+        return
+    token = _current.set(child)
+    try:
+        yield child
+    except BaseException as exc:
+        child.end(repr(exc))
+        raise
+    finally:
+        _current.reset(token)
+        child.end()
+
+
+_TRACEPARENT = re.compile(r"^([0-9a-f]{2})-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$")
+
+
+def _parse_traceparent(header: str | None) -> tuple[str, str] | None:
+    """(trace id, parent span id) of a W3C traceparent, None if it is invalid."""
+    match = _TRACEPARENT.match(header.strip()) if header else None
+    if not match:
+        return None
+    version, trace_id, parent_id = match.groups()
+    if version == "ff" or not trace_id.strip("0") or not parent_id.strip("0"):
+        return None
+    return trace_id, parent_id
+
+
+@contextmanager
+def start_trace(
+    name: str, traceparent: str | None = None, **attributes
+) -> Iterator[Span | None]:
+    """
+    Root span, subject to local head sampling. A valid upstream traceparent
+    supplies the trace and parent ids but its sampled flag is ignored, since
+    it comes from the client.
+    """
+    sampled = TRACE_SAMPLE_RATE > 0 and random.random() < TRACE_SAMPLE_RATE
+    if not sampled or not TRACE_EXPORT:
+        yield None
+        return
+    trace_id, parent_id = _parse_traceparent(traceparent) or (None, None)
+    root = Span(name, trace_id or os.urandom(16).hex(), parent_id, **attributes)
+    token = _current.set(root)
+    try:
+        yield root
+    except BaseException as exc:
+        root.end(repr(exc))
+        raise
+    finally:
+        _current.reset(token)
+        root.end()
+
+
+class SpanExporter:
+    """Buffers finished spans and writes them out in batches off the hot path."""
+
+    def __init__(self, target: str = TRACE_EXPORT):
+        self.target = target
+        self.buffer: list[Span] = []
+        self.exported = 0
+        self.dropped = 0
+        self._task: asyncio.Task | None = None
+
+    def add(self, finished: Span) -> None:
+        if len(self.buffer) >= TRACE_BUFFER:
+            self.dropped += 1
+            return
+        self.buffer.append(finished)
+        if self._task is None or self._task.done():
+            try:
+                self._task = asyncio.get_running_loop().create_task(self._run())
+            except RuntimeError:
+                pass
+
+    async def _run(self) -> None:
+        while self.buffer:
+            await asyncio.sleep(TRACE_FLUSH_SECONDS)
+            await self.flush()
+
+    async def flush(self) -> None:
+        while self.buffer:
+            batch = self.buffer[:TRACE_BATCH]
+            del self.buffer[:TRACE_BATCH]
+            try:
+                if self.target.startswith(("http://", "https://")):
+                    await self._post_otlp(batch)
+                else:
+                    await asyncio.to_thread(self._write_file, batch)
+                self.exported += len(batch)
+            except Exception as exc:
+                self.dropped += len(batch)
+                logger.warning(f"trace export to {self.target} failed: {exc!r}")
+
+    def _write_file(self, batch: list[Span]) -> None:
+        with open(self.target, "a") as f:
+            for finished in batch:
+                f.write(json.dumps(finished.to_dict(), default=str) + "\n")
+
+    async def _post_otlp(self, batch: list[Span]) -> None:
+        import httpx
+
+        payload = {
+            "resourceSpans": [
+                {
+                    "resource": {
+                        "attributes": [
+                            {
+                                "key": "service.name",
+                                "value": {"stringValue": TRACE_SERVICE},
+                            }
+                        ]
+                    },
+                    "scopeSpans": [
+                        {
+                            "scope": {"name": "lnbits.tracing"},
+                            "spans": [finished.to_otlp() for finished in batch],
+                        }
+                    ],
+                }
+            ]
+        }
+        async with httpx.AsyncClient() as client:
+            response = await client.post(self.target, json=payload, timeout=10)
+            response.raise_for_status()
+
+    def snapshot(self) -> dict:
+        return {
+            "sample_rate": TRACE_SAMPLE_RATE if TRACE_EXPORT else 0,
+            "export": self.target or None,
+            "buffered": len(self.buffer),
+            "exported": self.exported,
+            "dropped": self.dropped,
+        }
+
+
+exporter = SpanExporter()
+
+
+class TracingMiddleware:
+    """Pure ASGI middleware opening the root span of each sampled HTTP request."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not (TRACE_EXPORT and TRACE_SAMPLE_RATE > 0):
+            return await self.app(scope, receive, send)
+
+        traceparent = None
+        for key, value in scope.get("headers") or []:
+            if key == b"traceparent":
+                traceparent = value.decode("latin-1")
+                break
+
+        with start_trace(
+            f"{scope['method']} {scope['path']}",
+            traceparent,
+            **{"http.method": scope["method"], "http.target": scope["path"]},
+        ) as root:
+            if root is None:
+                return await self.app(scope, receive, send)
+
+            async def _send(message):
+                if message["type"] == "http.response.start":
+                    root.set("http.status_code", message["status"])
+                await send(message)
+
+            await self.app(scope, receive, _send)
+            route = scope.get("route")
+            if route is not None and getattr(route, "path", None):
+                # group spans by route template rather than raw path
+                root.name = f"{scope['method']} {route.path}"